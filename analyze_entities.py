@@ -1,6 +1,5 @@
 import os
 import sys
-import requests
 from typing import Dict, List, Any, Tuple, Optional
 from dotenv import load_dotenv
 
@@ -16,11 +15,12 @@ HEADERS = {
 }
 
 # 导入模块化组件
-from source.api_layer.home_assistant import hass_manager
-from source.home_assistant_llm_controller_langgraph import hass_llm_controller_langgraph as hass_llm_controller
+from source.api_layer.ha_transport import get_ha_transport
+from source.api_layer.home_assistant import get_hass_manager
+from source.home_assistant_llm_controller_langgraph import get_hass_llm_controller
 
 # 导入日志工具
-from source.base_layer.utils import logger
+from source.base_layer.utils import logger, setup_logging
 
 # 从get_sensor.py合并的功能函数
 def get_entity_info(entity_id: str) -> Optional[Dict[str, Any]]:
@@ -32,7 +32,7 @@ def get_entity_info(entity_id: str) -> Optional[Dict[str, Any]]:
     """
     try:
         url = f"{HA_URL}/api/states/{entity_id}"
-        response = requests.get(url, headers=HEADERS, timeout=10)
+        response = get_ha_transport().request_sync("GET", url, headers=HEADERS, timeout=10)
         
         if response.status_code == 200:
             return response.json()
@@ -63,7 +63,7 @@ def get_entity_history(entity_id: str, hours: int = 24) -> Optional[List[Dict[st
             "end_time": datetime.datetime.now().isoformat()
         }
         
-        response = requests.get(url, headers=HEADERS, params=params, timeout=30)
+        response = get_ha_transport().request_sync("GET", url, headers=HEADERS, params=params, timeout=30)
         
         if response.status_code == 200:
             history_data = response.json()
@@ -83,7 +83,7 @@ def get_all_entities() -> Optional[List[Dict[str, Any]]]:
     """
     try:
         url = f"{HA_URL}/api/states"
-        response = requests.get(url, headers=HEADERS, timeout=10)
+        response = get_ha_transport().request_sync("GET", url, headers=HEADERS, timeout=10)
         
         if response.status_code == 200:
             return response.json()
@@ -98,6 +98,9 @@ def main() -> None:
     """
     主函数，用于直接运行实体分析
     """
+    setup_logging()
+    hass_manager = get_hass_manager()
+    hass_llm_controller = get_hass_llm_controller()
     logger.info("开始实体分析...")
     
     # 获取实体数据
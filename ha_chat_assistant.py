@@ -1,15 +1,16 @@
 import os
 import sys
+import asyncio
 import gradio as gr
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, List, Any, Tuple, Optional, AsyncIterator
 
 # 导入日志工具
-from source.base_layer.utils import logger
+from source.base_layer.utils import logger, setup_logging
 
-# 导入模块化组件
-from source.api_layer.home_assistant import hass_manager
-from source.home_assistant_llm_controller_langgraph import hass_llm_controller_langgraph as hass_llm_controller
-from source.api_layer.qwen_speech_model import qwen_speech_manager
+# 导入模块化组件（全局实例在首次使用时创建）
+from source.api_layer.home_assistant import get_hass_manager
+from source.home_assistant_llm_controller_langgraph import get_hass_llm_controller
+from source.api_layer.qwen_speech_model import get_qwen_speech_manager
 
 import dotenv
 
@@ -20,11 +21,11 @@ def update_entity_groups(device_type: str) -> Tuple[gr.Dropdown, gr.Dropdown, gr
     """
     更新设备分组下拉框
     """
+    hass_manager = get_hass_manager()
     if not device_type or device_type not in hass_manager.entity_data.get("non_sensor_data", {}):
         return gr.Dropdown(choices=[], value=""), gr.Dropdown(choices=[], value=""), gr.Textbox(value="")
     
-    entities = hass_manager.entity_data.get("non_sensor_data", {}).get(device_type, [])
-    groups = list(hass_manager.group_entities_by_name(entities).keys())
+    groups = list(hass_manager.entity_index.get_domain_groups(device_type).keys())
     
     return gr.Dropdown(choices=groups, value=groups[0] if groups else ""), \
            gr.Dropdown(choices=[], value=""), \
@@ -34,14 +35,14 @@ def update_entity_list(device_type: str, group_name: str) -> Tuple[gr.Dropdown,
     """
     更新设备列表下拉框
     """
+    hass_manager = get_hass_manager()
     if not device_type or not group_name or device_type not in hass_manager.entity_data.get("non_sensor_data", {}):
         return gr.Dropdown(choices=[], value=""), gr.Textbox(value="")
     
-    entities = hass_manager.entity_data.get("non_sensor_data", {}).get(device_type, [])
-    grouped = hass_manager.group_entities_by_name(entities)
+    group_entities = hass_manager.entity_index.get_group_entities(device_type, group_name)
     
-    if group_name in grouped:
-        entity_choices = [e.get("friendly_name", e.get("entity_id", "未知")) for e in grouped[group_name]]
+    if group_entities:
+        entity_choices = [e.get("friendly_name", e.get("entity_id", "未知")) for e in group_entities]
         return gr.Dropdown(choices=entity_choices, value=entity_choices[0] if entity_choices else ""), \
                gr.Textbox(value="请选择设备查看状态")
     
@@ -51,19 +52,17 @@ def update_entity_status(device_type: str, group_name: str, entity_name: str) ->
     """
     更新设备状态显示
     """
+    hass_manager = get_hass_manager()
     if not device_type or not group_name or not entity_name or device_type not in hass_manager.entity_data.get("non_sensor_data", {}):
         return gr.Textbox(value="")
     
-    entities = hass_manager.entity_data.get("non_sensor_data", {}).get(device_type, [])
-    grouped = hass_manager.group_entities_by_name(entities)
-    
-    if group_name in grouped:
-        for entity in grouped[group_name]:
-            if entity.get("friendly_name", entity.get("entity_id", "未知")) == entity_name:
-                entity_id = entity.get("entity_id", "未知")
-                state = entity.get("state", "未知")
-                last_updated = entity.get("last_updated", "未知")
-                return gr.Textbox(value=f"实体ID: {entity_id}\n状态: {state}\n最后更新: {last_updated}")
+    matches = hass_manager.entity_index.find_by_name(entity_name, domain=device_type, group_name=group_name)
+    if matches:
+        entity = matches[0]
+        entity_id = entity.get("entity_id", "未知")
+        state = entity.get("state", "未知")
+        last_updated = entity.get("last_updated", "未知")
+        return gr.Textbox(value=f"实体ID: {entity_id}\n状态: {state}\n最后更新: {last_updated}")
     
     return gr.Textbox(value="未找到设备信息")
 
@@ -71,30 +70,27 @@ def control_entity(device_type: str, group_name: str, entity_name: str) -> Tuple
     """
     控制设备状态
     """
+    hass_manager = get_hass_manager()
     if not device_type or not group_name or not entity_name or device_type not in hass_manager.entity_data.get("non_sensor_data", {}):
         return gr.Textbox(value="控制失败：参数无效"), gr.Textbox(value="")
     
-    entities = hass_manager.entity_data.get("non_sensor_data", {}).get(device_type, [])
-    grouped = hass_manager.group_entities_by_name(entities)
-    
-    if group_name in grouped:
-        for entity in grouped[group_name]:
-            if entity.get("friendly_name", entity.get("entity_id", "未知")) == entity_name:
-                entity_id = entity.get("entity_id", "未知")
-                current_state = entity.get("state", "未知")
-                new_state = "off" if current_state == "on" else "on"
-                
-                # 调用Home Assistant服务
-                success_message = hass_manager.call_home_assistant_service(entity_id, f"turn_{new_state}")
-                
-                if "成功" in success_message:
-                    # 更新实体数据
-                    hass_manager.update_entity_data()
-                    # 重新获取状态
-                    status_text = update_entity_status(device_type, group_name, entity_name).value
-                    return gr.Textbox(value=f"控制成功：已将 {entity_name} {new_state}"), gr.Textbox(value=status_text)
-                else:
-                    return gr.Textbox(value=f"控制失败：{success_message}"), gr.Textbox(value="")
+    matches = hass_manager.entity_index.find_by_name(entity_name, domain=device_type, group_name=group_name)
+    if matches:
+        entity = matches[0]
+        entity_id = entity.get("entity_id", "未知")
+        # 优先使用实体存储中的最新状态
+        current_state = hass_manager.current_state(entity_id) or entity.get("state", "未知")
+        new_state = "off" if current_state == "on" else "on"
+        
+        # 调用Home Assistant服务（实体已处于目标状态时不会发送请求）
+        success_message = hass_manager.call_home_assistant_service(entity_id, f"turn_{new_state}")
+        
+        if "成功" in success_message or success_message.startswith("已满足"):
+            # 实体已在当前快照中乐观更新为新状态，并会在后台与权威状态校正，无需重新拉取全部实体
+            status_text = update_entity_status(device_type, group_name, entity_name).value
+            return gr.Textbox(value=f"控制成功：已将 {entity_name} {new_state}"), gr.Textbox(value=status_text)
+        else:
+            return gr.Textbox(value=f"控制失败：{success_message}"), gr.Textbox(value="")
     
     return gr.Textbox(value=f"控制失败：未找到设备 {entity_name}"), gr.Textbox(value="")
 
@@ -102,7 +98,8 @@ def refresh_device_list() -> Tuple[gr.Dropdown, gr.Dropdown, gr.Dropdown, gr.Tex
     """
     刷新设备列表
     """
-    hass_manager.update_entity_data()
+    hass_manager = get_hass_manager()
+    hass_manager.update_entity_data(force=True)
     device_types = list(hass_manager.entity_data.get("non_sensor_data", {}).keys())
     
     # 确保即使没有设备类型，也不会有空值警告
@@ -119,6 +116,7 @@ def create_device_control_tab():
     """
     创建设备控制选项卡
     """
+    hass_manager = get_hass_manager()
     # 获取设备类型列表
     device_types = list(hass_manager.entity_data.get("non_sensor_data", {}).keys())
     
@@ -203,6 +201,7 @@ def update_sensor_groups(sensor_type: str) -> Tuple[gr.Dropdown, gr.Dropdown, gr
     """
     更新传感器分组下拉框
     """
+    hass_manager = get_hass_manager()
     # 转换UI中的类型名称为后端使用的类型名称
     if sensor_type == "numeric":
         backend_sensor_type = "numeric_sensors"
@@ -224,6 +223,7 @@ def update_sensor_list(sensor_type: str, group_name: str) -> Tuple[gr.Dropdown,
     """
     更新传感器列表下拉框
     """
+    hass_manager = get_hass_manager()
     # 转换UI中的类型名称为后端使用的类型名称
     if sensor_type == "numeric":
         backend_sensor_type = "numeric_sensors"
@@ -248,6 +248,7 @@ def update_sensor_info(sensor_type: str, group_name: str, sensor_name: str) -> g
     """
     更新传感器信息显示
     """
+    hass_manager = get_hass_manager()
     # 转换UI中的类型名称为后端使用的类型名称
     if sensor_type == "numeric":
         backend_sensor_type = "numeric_sensors"
@@ -296,6 +297,8 @@ def analyze_all_entities() -> gr.Textbox:
     分析所有实体
     """
     try:
+        hass_manager = get_hass_manager()
+        hass_llm_controller = get_hass_llm_controller()
         # 更新实体数据
         hass_manager.update_entity_data()
         
@@ -319,7 +322,8 @@ def refresh_sensor_list() -> Tuple[gr.Dropdown, gr.Dropdown, gr.Dropdown, gr.Tex
     """
     刷新传感器列表
     """
-    hass_manager.update_entity_data()
+    hass_manager = get_hass_manager()
+    hass_manager.update_entity_data(force=True)
     # UI中使用的传感器类型是'numeric'和'text'
     return gr.Dropdown(choices=["numeric", "text"], value="numeric", interactive=True, allow_custom_value=True), \
            gr.Dropdown(choices=[], value="", interactive=False, allow_custom_value=True), \
@@ -406,30 +410,52 @@ def create_sensor_data_tab():
         analyze_result
     return sensor_type, sensor_groups, sensor_list, sensor_info, analyze_btn, refresh_btn, analyze_result
 
-async def process_message_wrapper(message: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+async def process_message_wrapper(message: str, history: List[Dict[str, str]]) -> AsyncIterator[List[Dict[str, str]]]:
     """
-    处理用户消息并生成响应，返回符合Gradio Chatbot messages格式的历史记录
+    处理用户消息并流式生成响应，逐步产出符合Gradio Chatbot messages格式的历史记录
+    回复文本边生成边显示，工具调用以带标题的消息显示进度
     """
-    # 更新实体数据，确保设备列表是最新的
-    hass_manager.update_entity_data()
+    hass_manager = get_hass_manager()
+    hass_llm_controller = get_hass_llm_controller()
+    qwen_speech_manager = get_qwen_speech_manager()
+    # 更新实体数据，确保设备列表是最新的（陈旧度预算内复用同一快照），可能需要REST拉取，放到线程中执行
+    await asyncio.to_thread(hass_manager.update_entity_data)
     
-    # 将新格式的历史记录转换为旧格式（元组列表）
+    # 将新格式的历史记录转换为旧格式（元组列表），工具调用进度消息不计入对话
+    dialog = [msg for msg in history if not (msg.get("metadata") or {}).get("title")]
     old_format_history = []
     i = 0
-    while i < len(history):
-        if i+1 < len(history) and history[i].get("role") == "user" and history[i+1].get("role") == "assistant":
-            old_format_history.append((history[i]["content"], history[i+1]["content"]))
+    while i < len(dialog):
+        if i+1 < len(dialog) and dialog[i].get("role") == "user" and dialog[i+1].get("role") == "assistant":
+            old_format_history.append((dialog[i]["content"], dialog[i+1]["content"]))
             i += 2
         else:
             i += 1
 
-    # 调用process_message方法（使用hass_llm_controller）
-    response = await hass_llm_controller.process_home_assistant_message(message, old_format_history)
-    
-    # 添加新的用户消息和助手响应到历史记录
+    # 添加新的用户消息和（逐步填充的）助手回复到历史记录
     updated_history = history.copy()
     updated_history.append({"role": "user", "content": message})
-    updated_history.append({"role": "assistant", "content": response})
+    reply = {"role": "assistant", "content": ""}
+    updated_history.append(reply)
+    yield updated_history
+    
+    # 流式处理消息（使用hass_llm_controller）
+    tool_messages = {}
+    response = ""
+    async for event in hass_llm_controller.stream_home_assistant_message(message, old_format_history):
+        if event["type"] == "token":
+            reply["content"] += event["content"]
+        elif event["type"] == "tool_start":
+            # 工具调用进度显示在回复之前
+            tool_message = {"role": "assistant", "content": "执行中...", "metadata": {"title": f"调用工具: {event['name']}"}}
+            tool_messages[event["id"]] = tool_message
+            updated_history.insert(len(updated_history) - 1, tool_message)
+        elif event["type"] == "tool_end" and event["id"] in tool_messages:
+            tool_messages[event["id"]]["content"] = "已完成"
+        elif event["type"] == "final":
+            response = event["content"]
+            reply["content"] = response
+        yield updated_history
     
     # 自动生成并播放语音回复
     try:
@@ -446,14 +472,13 @@ async def process_message_wrapper(message: str, history: List[Dict[str, str]]) -
             logger.error("语音合成失败")
     except Exception as e:
           logger.error(f"自动播放语音时出错: {str(e)}")
-    
-    return updated_history
 
 # 创建对话选项卡
 def create_chat_tab():
     """
     创建聊天标签页
     """
+    qwen_speech_manager = get_qwen_speech_manager()
     # 创建聊天历史组件
     chat_history = gr.Chatbot(label="智能家居助手", type="messages")
     user_input = gr.Textbox(label="请输入您的问题或命令")
@@ -470,7 +495,8 @@ def create_chat_tab():
     # 新增自动提交功能的语音识别函数
     async def recognize_and_auto_submit(audio, chat_history):
         if not audio:
-            return "", "请先录制语音", chat_history
+            yield "", "请先录制语音", chat_history
+            return
         
         # 更新状态
         status = "正在进行语音识别..."
@@ -480,11 +506,13 @@ def create_chat_tab():
             # 检查文件是否存在
             import os
             if not os.path.exists(audio):
-                return "", "错误：录音文件不存在或已损坏", chat_history
+                yield "", "错误：录音文件不存在或已损坏", chat_history
+                return
             
             # 获取文件大小，确保文件不为空
             if os.path.getsize(audio) == 0:
-                return "", "错误：录音文件内容为空", chat_history
+                yield "", "错误：录音文件内容为空", chat_history
+                return
             
             # 调用语音识别服务
             text = qwen_speech_manager.audio_to_text(audio)
@@ -492,23 +520,22 @@ def create_chat_tab():
                 # 语音识别成功
                 status = f"语音识别成功: {text[:30]}...，正在自动提交..."
                 
-                # 更新实体数据，确保设备列表是最新的
-                hass_manager.update_entity_data()
-                
-                # 调用process_message_wrapper函数处理消息并生成回复，这样会包含TTS生成
-                updated_history = await process_message_wrapper(text, chat_history)
+                # 调用process_message_wrapper函数流式处理消息并生成回复，这样会包含TTS生成
+                updated_history = chat_history
+                async for updated_history in process_message_wrapper(text, chat_history):
+                    yield text, status, updated_history
                 
                 status = f"语音识别成功: {text[:30]}...，已自动提交并生成回复"
-                return text, status, updated_history
+                yield text, status, updated_history
             else:
                 # 语音识别失败
-                return "", "语音识别失败：可能是API密钥配置问题或网络连接问题", chat_history
+                yield "", "语音识别失败：可能是API密钥配置问题或网络连接问题", chat_history
         except Exception as e:
             error_msg = f"语音识别出错: {str(e)}"
             logger.error(error_msg)
             import traceback
             traceback.print_exc()
-            return "", error_msg, chat_history
+            yield "", error_msg, chat_history
     
     # 设置事件处理
     submit_btn.click(
@@ -568,6 +595,7 @@ def main(server_port):
     """
     主函数
     """
+    setup_logging()
     try:
         # 创建并启动Gradio界面
         interface = create_gradio_interface()
@@ -0,0 +1,232 @@
+from typing import Dict, List, Any, Tuple, Optional, Callable, Iterable, Set
+# 导入日志记录器
+from source.base_layer.utils import logger
+# 导入实体索引及有序分组维护函数
+from source.api_layer.entity_index import EntityIndex, insert_into_group, remove_from_group, replace_in_group
+# 导入紧凑实体记录及其列表视图
+from source.api_layer.entity_record import EntityRecord, RecordView, SENSOR_BUCKETS, entity_domain
+# 导入数值型传感器列式表及批量数值解析
+from source.api_layer.numeric_table import NumericSensorTable, parse_numeric_states
+
+# 有效传感器在本轮结束批量解析数值前所处的临时分类
+PENDING_SENSOR_BUCKET = "pending_sensors"
+
+
+class EntityClassifier:
+    """
+    增量实体分类器
+    以entity_id + last_updated识别变化，只重新处理新增、变化和删除的实体，
+    并原地修补分类结果、分组字典和实体索引，分类开销与变化量而非实体总数成正比；
+    实体以EntityRecord保存在索引中，分类结果中的列表均为引用同一批记录的视图
+    """
+
+    def __init__(self, group_func: Callable[[Dict[str, Any]], str]):
+        """
+        初始化分类器
+        :param group_func: 计算单个实体分组名称的函数
+        """
+        self.group_func = group_func
+        self.index = EntityIndex()
+        self.numeric_table = NumericSensorTable()
+        self.reset()
+
+    def reset(self):
+        """
+        清空所有分类状态，下一次分类将全量处理
+        """
+        # 传感器分类 -> {entity_id: 记录}
+        self._sensor_records: Dict[str, Dict[str, EntityRecord]] = {bucket: {} for bucket in SENSOR_BUCKETS}
+        self.sensor_data: Dict[str, Any] = {}
+        for bucket in SENSOR_BUCKETS:
+            self.sensor_data[bucket] = RecordView(self._sensor_records[bucket])
+            self.sensor_data[f"{bucket}_by_group"] = {}
+        # 数值型传感器的列式表，表对象可能被外部持有，只清空不重建
+        self.numeric_table.clear()
+        self.sensor_data["numeric_table"] = self.numeric_table
+        # 非传感器实体按类型直接使用索引中的类型字典作为视图
+        self.non_sensor_data: Dict[str, RecordView] = {}
+        # 全量重建时，此前存在的实体类型都视为发生了变化
+        self._reset_domains = set(self.index.by_domain)
+        # 索引对象可能被外部持有，只清空不重建
+        self.index.clear()
+        self._seen: Optional[set] = None
+        # 等待批量解析数值的有效传感器：(旧记录, 新记录)
+        self._pending: List[Tuple[Optional[EntityRecord], EntityRecord]] = []
+        self.changed_count = 0
+        self.changed_domains: Set[str] = set()
+
+    def classify(self, all_entities: Iterable[Dict[str, Any]], incremental: bool = True) -> Tuple[Dict[str, Any], Dict[str, RecordView]]:
+        """
+        对完整的实体状态列表进行分类
+        :param all_entities: 实体原始状态列表或迭代器
+        :param incremental: 是否基于上一次结果增量分类，False时全量重建
+        :return: (sensor实体分类结果, 非sensor实体分类结果)
+        """
+        if not incremental:
+            self.reset()
+        self.begin()
+        for entity in all_entities:
+            self.feed(entity)
+        return self.finish()
+
+    def begin(self):
+        """
+        开始一轮分类
+        """
+        self._seen = set()
+        self._pending = []
+        self.changed_count = 0
+        # 本轮有实体新增、变化或移除的实体类型
+        self.changed_domains = self._reset_domains
+        self._reset_domains = set()
+
+    def feed(self, entity: Dict[str, Any]):
+        """
+        处理一个实体的原始状态，未变化的实体直接跳过
+        :param entity: 实体原始状态
+        """
+        entity_id = entity.get("entity_id")
+        if not entity_id:
+            return
+        self._seen.add(entity_id)
+        old_record = self.index.by_id.get(entity_id)
+        if old_record is not None and old_record.updated == entity.get("last_updated", ""):
+            return
+
+        record = self._classify_entity(entity)
+        self.changed_count += 1
+        if record is not None and record.bucket == PENDING_SENSOR_BUCKET:
+            # 数值判断在本轮结束时批量进行
+            self._pending.append((old_record, record))
+            return
+        self._apply(old_record, record)
+
+    def retain(self, prefix: str):
+        """
+        保留以prefix开头的现有实体，本轮结束时不移除（用于本轮未能拉取的Home Assistant实例）
+        :param prefix: 实体ID前缀
+        """
+        self._seen.update(entity_id for entity_id in self.index.by_id if entity_id.startswith(prefix))
+
+    def patch(self, entities: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, RecordView]]:
+        """
+        只处理给定实体的新状态（如服务调用后的乐观更新或单实体校正），不移除其他实体
+        :param entities: 实体原始状态
+        :return: (sensor实体分类结果, 非sensor实体分类结果)
+        """
+        self.begin()
+        for entity in entities:
+            self.feed(entity)
+        self._apply_pending()
+        self._seen = None
+        return self.sensor_data, self.non_sensor_data
+
+    def finish(self) -> Tuple[Dict[str, Any], Dict[str, RecordView]]:
+        """
+        结束一轮分类：批量解析有效传感器的数值并归入数值型/文本型，移除本轮未出现的实体
+        :return: (sensor实体分类结果, 非sensor实体分类结果)
+        """
+        self._apply_pending()
+
+        removed = [record for entity_id, record in self.index.by_id.items() if entity_id not in self._seen]
+        for record in removed:
+            self._remove(record)
+        self.changed_count += len(removed)
+        self._seen = None
+        return self.sensor_data, self.non_sensor_data
+
+    def _apply_pending(self):
+        """
+        批量解析等待中的有效传感器的数值，并归入数值型/文本型
+        """
+        if self._pending:
+            values = parse_numeric_states([record.state for _, record in self._pending]).tolist()
+            for (old_record, record), value in zip(self._pending, values):
+                # NaN表示无法解析为数值
+                if value == value:
+                    record.bucket = "numeric_sensors"
+                    record.value = value
+                else:
+                    record.bucket = "text_sensors"
+                self._apply(old_record, record)
+            self._pending = []
+
+    def _classify_entity(self, entity: Dict[str, Any]) -> Optional[EntityRecord]:
+        """
+        分类单个实体
+        :return: 实体记录，处理出错时返回None
+        """
+        try:
+            entity_id = entity["entity_id"]
+            attributes = entity.get("attributes", {})
+            entity_type = entity_domain(entity_id)
+            state = entity["state"]
+            updated = entity["last_updated"]
+
+            if entity_type != "sensor":
+                return EntityRecord(entity_id, state, updated, attributes, entity_type)
+
+            sensor_state = state.strip().lower()
+            # 排除状态为"unknown"（未知）、"unavailable"（不可用）的传感器
+            if sensor_state in ["unknown", "unavailable", "none"]:
+                return EntityRecord(entity_id, state, updated, attributes, "invalid_sensors")
+
+            # 是否为数值型（如"25.5%""100W"）在本轮结束时批量解析
+            return EntityRecord(entity_id, state, updated, attributes, PENDING_SENSOR_BUCKET)
+        except Exception as e:
+            # 忽略单个实体处理错误
+            logger.warning(f"处理实体 {entity.get('entity_id', '未知')} 时出错: {str(e)}")
+            return None
+
+    def _apply(self, old_record: Optional[EntityRecord], record: Optional[EntityRecord]):
+        """
+        用新记录替换旧记录，分类不变时原地替换，否则先移除再加入
+        """
+        if old_record is not None:
+            if record is not None and record.bucket == old_record.bucket:
+                self._replace(old_record, record)
+                return
+            self._remove(old_record)
+        if record is not None:
+            self._add(record)
+
+    def _add(self, record: EntityRecord):
+        self.changed_domains.add(record.domain)
+        record.set_group_name(self.group_func(record))
+        bucket = record.bucket
+        if bucket in SENSOR_BUCKETS:
+            self._sensor_records[bucket][record.entity_id] = record
+            insert_into_group(self.sensor_data[f"{bucket}_by_group"], record.group_name, record)
+        self.index.add(record, record.group_name)
+        if bucket == "numeric_sensors":
+            self.numeric_table.upsert(record)
+        if bucket not in SENSOR_BUCKETS and bucket not in self.non_sensor_data:
+            self.non_sensor_data[bucket] = RecordView(self.index.by_domain[bucket])
+
+    def _remove(self, record: EntityRecord):
+        self.changed_domains.add(record.domain)
+        bucket = record.bucket
+        if bucket in SENSOR_BUCKETS:
+            del self._sensor_records[bucket][record.entity_id]
+            remove_from_group(self.sensor_data[f"{bucket}_by_group"], record.group_name, record)
+        self.index.remove(record.entity_id)
+        if bucket == "numeric_sensors":
+            self.numeric_table.remove(record.entity_id)
+        if bucket not in SENSOR_BUCKETS and bucket not in self.index.by_domain:
+            del self.non_sensor_data[bucket]
+
+    def _replace(self, old_record: EntityRecord, record: EntityRecord):
+        self.changed_domains.add(record.domain)
+        # 名称未变化时沿用原分组，无需重新计算
+        if record.friendly_name == old_record.friendly_name:
+            record.group_name = old_record.group_name
+        else:
+            record.set_group_name(self.group_func(record))
+        bucket = record.bucket
+        if bucket in SENSOR_BUCKETS:
+            self._sensor_records[bucket][record.entity_id] = record
+            replace_in_group(self.sensor_data[f"{bucket}_by_group"], old_record.group_name, old_record,
+                             record.group_name, record)
+        self.index.add(record, record.group_name)
+        if bucket == "numeric_sensors":
+            self.numeric_table.upsert(record)
@@ -0,0 +1,268 @@
+import re
+from collections import OrderedDict
+from operator import itemgetter, is_
+from typing import Dict, List, Any, Tuple, Optional, Iterable
+# 导入分组内实体排序键
+from source.api_layer.entity_index import entity_sort_key
+# 导入紧凑实体记录
+from source.api_layer.entity_record import EntityRecord
+
+# 常见的位置关键词（可根据需要扩展），靠前的关键词优先
+LOCATION_KEYWORDS = [
+    "客厅", "卧室", "厨房", "卫生间", "浴室", "书房", "儿童房", "主卧", "次卧",
+    "阳台", "门厅", "走廊", "餐厅", "车库", "花园", "院子", "阁楼"
+]
+
+# 名称中用于分隔位置信息的常见分隔符
+NAME_SEPARATORS = ["-", "_", "(", "（", " "]
+
+# 名称分组缓存的最大条目数，超出时清空重建
+NAME_CACHE_SIZE = 200_000
+
+# 所有实体都能取到friendly_name时使用的排序键，与entity_sort_key结果一致
+_by_friendly_name = itemgetter("friendly_name")
+
+
+class LocationMatcher:
+    """
+    位置关键词匹配器
+    所有关键词预编译为一个多选正则，一次扫描即可找到名称中的关键词，按关键词顺序决定优先级，
+    结果与逐个关键词做子串判断一致
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        """
+        编译关键词
+        :param keywords: 位置关键词，靠前的优先；空串被忽略
+        """
+        # 关键词 -> 优先级（在列表中的位置，越小越优先）
+        self.rank: Dict[str, int] = {}
+        for keyword in keywords:
+            if keyword:
+                self.rank.setdefault(keyword, len(self.rank))
+        # 同一位置能匹配多个关键词时，多选正则取排在前面的，即更优先的关键词
+        pattern = re.compile("|".join(map(re.escape, self.rank)) or "(?!)")
+        self.search = pattern.search
+        self._find_keywords = pattern.findall
+        # 关键词 -> 可能与之重叠而被跳过的更优先关键词（如"主卧室"中匹配到"主卧"时会跳过"卧室"）
+        self._overlapping: Dict[str, Tuple[str, ...]] = {}
+        for keyword, rank in self.rank.items():
+            overlapping = tuple(other for other, other_rank in self.rank.items()
+                                if other_rank < rank and self._can_overlap(keyword, other))
+            if overlapping:
+                self._overlapping[keyword] = overlapping
+
+    @staticmethod
+    def _can_overlap(matched: str, other: str) -> bool:
+        """
+        other的某次出现能否从matched的某次出现内部开始（此时非重叠扫描会跳过other）
+        """
+        return any(other.startswith(matched[i:]) or matched[i:].startswith(other) for i in range(1, len(matched)))
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        找出文本中最优先的关键词
+        :return: 关键词，文本中没有关键词时返回None
+        """
+        found = self.search(text)
+        if found is None:
+            return None
+        # 找到的是最靠左的关键词，同一位置上更优先的关键词排在多选正则前面；
+        # 之后（包括与之重叠的位置）再没有关键词时即为结果，绝大多数名称只有一个关键词
+        if self.search(text, found.start() + 1) is None:
+            return found[0]
+        return self.best_keyword(text)
+
+    def best_keyword(self, text: str) -> str:
+        """
+        按优先级取文本中最优先的关键词，用于文本中有多个关键词或关键词可能重叠的情况
+        :param text: 至少含有一个关键词的文本
+        """
+        rank = self.rank
+        found = self._find_keywords(text)
+        best = min(found, key=rank.__getitem__)
+        for keyword in found:
+            for other in self._overlapping.get(keyword, ()):
+                if rank[other] < rank[best] and other in text:
+                    best = other
+        return best
+
+
+# 关键词元组 -> 匹配器，相同的关键词列表只编译一次
+_MATCHERS: Dict[Tuple[str, ...], LocationMatcher] = {}
+
+
+def get_location_matcher(keywords: Iterable[str]) -> LocationMatcher:
+    """
+    获取关键词列表对应的预编译匹配器
+    """
+    keywords = tuple(keywords)
+    matcher = _MATCHERS.get(keywords)
+    if matcher is None:
+        matcher = _MATCHERS[keywords] = LocationMatcher(keywords)
+    return matcher
+
+
+class EntityGrouper:
+    """
+    实体分组器
+    位置关键词由共享的LocationMatcher预编译为一个正则，每个名称只需一次扫描；
+    普通字典实体按名称缓存分组，名称不变时直接复用，只有名称变化（新名称）时才重新计算；
+    EntityRecord的分组名称保存在记录上，由分类器在实体名称变化时才重新计算；
+    完整分组结果按输入实体对象集合缓存，实体信息在分类时只会被替换而不会被原地修改，
+    因此同一组实体对象的重复分组可以直接复用上一次的结果
+    """
+
+    def __init__(self, location_keywords: List[str] = None, result_cache_size: int = 16,
+                 name_cache_size: int = NAME_CACHE_SIZE):
+        """
+        初始化分组器
+        :param location_keywords: 位置关键词列表，默认使用LOCATION_KEYWORDS
+        :param result_cache_size: 缓存的完整分组结果数量
+        :param name_cache_size: 名称分组缓存的最大条目数
+        """
+        self.location_keywords = location_keywords or LOCATION_KEYWORDS
+        self.result_cache_size = result_cache_size
+        self.name_cache_size = name_cache_size
+        # 预编译的位置关键词匹配器，相同关键词列表的分组器共享
+        self._matcher = get_location_matcher(self.location_keywords)
+        # friendly_name -> 由名称得到的分组名称，None表示名称中无法提取（或为"其他"）、需要按entity_id分组
+        self._name_groups: Dict[str, Optional[str]] = {}
+        # (实体数量, 首个实体对象id, 末个实体对象id) -> (输入实体对象列表, 完整分组结果)；
+        # 缓存持有这些实体对象，缓存期间其id不会被复用
+        self._results: "OrderedDict[Tuple[int, int, int], Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]]" = OrderedDict()
+
+    def _name_group(self, friendly_name: str) -> Optional[str]:
+        """
+        从名称中提取分组：优先取位置关键词，没有时取分隔符前的部分
+        :return: 分组名称，名称中无法提取或提取到"其他"时返回None
+        """
+        group_name = self._matcher.match(friendly_name)
+        if group_name is None:
+            for sep in NAME_SEPARATORS:
+                if sep in friendly_name:
+                    group_name = friendly_name.split(sep, 1)[0].strip()
+                    break
+        return None if group_name == "其他" else group_name
+
+    @staticmethod
+    def _id_group(entity_id: str) -> str:
+        """
+        从entity_id提取分组：类似 "living_room_temperature" 的格式，通常前两个部分是位置信息
+        """
+        if "." in entity_id:
+            entity_name = entity_id.split(".", 1)[1]
+            if "_" in entity_name:
+                parts = entity_name.split("_")
+                return parts[0] + "_" + parts[1]
+        return "其他"
+
+    def get_group_name(self, entity: Dict[str, Any]) -> str:
+        """
+        获取单个实体的分组名称，按名称缓存，名称变化时才重新计算
+        """
+        friendly_name = entity.get("friendly_name", "")
+        cache = self._name_groups
+        group_name = cache.get(friendly_name, False)
+        if group_name is False:
+            if len(cache) > self.name_cache_size:
+                cache.clear()
+            group_name = cache[friendly_name] = self._name_group(friendly_name) if friendly_name else None
+        if group_name is None:
+            group_name = self._id_group(entity.get("entity_id", ""))
+        return group_name
+
+    def compute_group_name(self, entity_id: str, friendly_name: str) -> str:
+        """
+        根据实体ID和名称计算分组名称（不使用缓存）
+        分组规则：
+        1. 优先从friendly_name中提取分组信息（如"客厅温度"分组为"客厅"）
+        2. 如果friendly_name不可用，则从entity_id中提取位置/区域信息
+        3. 使用常见的分隔符和规则识别位置/区域信息
+        """
+        group_name = self._name_group(friendly_name) if friendly_name else None
+        # 如果friendly_name未能提取分组，尝试从entity_id提取
+        if group_name is None:
+            group_name = self._id_group(entity_id)
+        return group_name
+
+    def group_entities(self, entities: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        将实体按名称分组，分组和组内实体均按名称排序
+        相同实体对象集合的重复调用直接返回缓存结果，调用方不应修改返回值
+        """
+        # 按数量和首尾实体对象定位缓存，再逐个比对实体对象
+        key = (len(entities), id(entities[0]), id(entities[-1])) if entities else (0, 0, 0)
+        cached = self._results.get(key)
+        if cached is not None and all(map(is_, cached[0], entities)):
+            self._results.move_to_end(key)
+            return cached[1]
+
+        grouped_entities: Dict[str, List[Dict[str, Any]]] = {}
+        if entities and all(type(entity) is EntityRecord for entity in entities):
+            # 实体记录已带有分组名称
+            for entity in entities:
+                members = grouped_entities.get(entity.group_name)
+                if members is None:
+                    grouped_entities[entity.group_name] = [entity]
+                else:
+                    members.append(entity)
+            sort_key = entity_sort_key
+        else:
+            sort_key = self._group_by_name(entities, grouped_entities)
+
+        result = {}
+        for group in sorted(grouped_entities):
+            members = grouped_entities[group]
+            members.sort(key=sort_key)
+            result[group] = members
+
+        self._results[key] = (list(entities), result)
+        self._results.move_to_end(key)
+        if len(self._results) > self.result_cache_size:
+            self._results.popitem(last=False)
+        return result
+
+    def _group_by_name(self, entities: List[Dict[str, Any]], grouped_entities: Dict[str, List[Dict[str, Any]]]):
+        """
+        按名称把实体放入分组，名称已缓存的直接复用分组，新名称计算后写入缓存
+        :return: 组内实体的排序键
+        """
+        cache = self._name_groups
+        if len(cache) > self.name_cache_size:
+            cache.clear()
+        search, best_keyword = self._matcher.search, self._matcher.best_keyword
+        id_group = self._id_group
+        has_missing_name = False
+        cached_group = cache.get
+        for entity in entities:
+            friendly_name = entity.get("friendly_name")
+            # False表示名称尚未缓存（缓存值可能是None）
+            group_name = cached_group(friendly_name, False)
+            if group_name is False:
+                # 新名称：与_name_group相同，新名称较多时逐个调用的开销明显，这里展开
+                group_name = None
+                if friendly_name:
+                    found = search(friendly_name)
+                    if found is not None:
+                        group_name = found[0]
+                        if search(friendly_name, found.start() + 1) is not None:
+                            group_name = best_keyword(friendly_name)
+                    else:
+                        for sep in NAME_SEPARATORS:
+                            if sep in friendly_name:
+                                group_name = friendly_name.split(sep, 1)[0].strip()
+                                break
+                    if group_name == "其他":
+                        group_name = None
+                cache[friendly_name] = group_name
+            if group_name is None:
+                has_missing_name = has_missing_name or friendly_name is None
+                group_name = id_group(entity.get("entity_id", ""))
+            members = grouped_entities.get(group_name)
+            if members is None:
+                grouped_entities[group_name] = [entity]
+            else:
+                members.append(entity)
+        # 所有实体都能取到friendly_name时直接按该字段排序
+        return entity_sort_key if has_missing_name else _by_friendly_name
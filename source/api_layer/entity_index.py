@@ -0,0 +1,200 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+# 导入紧凑实体记录
+from source.api_layer.entity_record import EntityRecord, entity_domain
+
+
+def entity_sort_key(entity: Dict[str, Any]) -> str:
+    """
+    分组内实体的排序键，与group_entities_by_name保持一致
+    """
+    if type(entity) is EntityRecord:
+        return entity.friendly_name
+    return entity.get("friendly_name", entity.get("entity_id", ""))
+
+
+def insert_into_group(groups: Dict[str, List[Dict[str, Any]]], group_name: str, info: Dict[str, Any]):
+    """
+    将实体插入有序分组，出现新分组时保持分组字典按名称有序
+    """
+    if group_name not in groups:
+        groups[group_name] = []
+        ordered = sorted(groups.items())
+        groups.clear()
+        groups.update(ordered)
+    insort(groups[group_name], info, key=entity_sort_key)
+
+
+def remove_from_group(groups: Dict[str, List[Dict[str, Any]]], group_name: str, info: Dict[str, Any]):
+    """
+    从有序分组中移除实体，分组为空时删除该分组
+    """
+    members = groups[group_name]
+    index = bisect_left(members, entity_sort_key(info), key=entity_sort_key)
+    while members[index] is not info:
+        index += 1
+    members.pop(index)
+    if not members:
+        del groups[group_name]
+
+
+def replace_in_group(groups: Dict[str, List[Dict[str, Any]]], group_name: str, old_info: Dict[str, Any],
+                     new_group_name: str, new_info: Dict[str, Any]):
+    """
+    用新实体信息替换有序分组中的旧实体信息，分组和排序键不变时原地替换
+    """
+    if new_group_name == group_name and entity_sort_key(new_info) == entity_sort_key(old_info):
+        members = groups[group_name]
+        index = bisect_left(members, entity_sort_key(old_info), key=entity_sort_key)
+        while members[index] is not old_info:
+            index += 1
+        members[index] = new_info
+    else:
+        remove_from_group(groups, group_name, old_info)
+        insert_into_group(groups, new_group_name, new_info)
+
+
+class EntityIndex:
+    """
+    实体哈希索引
+    按entity_id、friendly_name、domain以及(domain, 分组)建立索引，随实体快照增量维护，
+    使按ID、名称、类型和分组的查找均为O(1)
+    """
+
+    def __init__(self):
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        # 同名实体通常只有一个，使用元组保存以减少内存占用
+        self.by_name: Dict[str, Tuple[Dict[str, Any], ...]] = {}
+        self.by_domain: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.groups_by_domain: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        # 普通字典实体的分组名称，EntityRecord的分组名称直接保存在记录上
+        self._group_of: Dict[str, str] = {}
+        # 实体集合或实体名称发生变化时递增，依赖ID/名称集合的派生结构（如名称匹配自动机）据此判断是否需要重建
+        self.version = 0
+
+    @classmethod
+    def from_entities(cls, entities: Iterable[Dict[str, Any]], group_func: Optional[Callable[[Dict[str, Any]], str]] = None) -> "EntityIndex":
+        """
+        由实体信息列表构建索引
+        :param entities: 实体信息列表
+        :param group_func: 计算分组名称的函数，为None时所有实体归入"其他"
+        """
+        index = cls()
+        for entity in entities:
+            index.add(entity, group_func(entity) if group_func else "其他")
+        return index
+
+    def clear(self):
+        """
+        清空索引
+        """
+        self.by_id.clear()
+        self.by_name.clear()
+        self.by_domain.clear()
+        self.groups_by_domain.clear()
+        self._group_of.clear()
+        self.version += 1
+
+    def add(self, info: Dict[str, Any], group_name: str):
+        """
+        将实体加入索引，已存在的同ID实体会被原地替换，保持其在类型字典中的位置
+        :param info: 实体信息
+        :param group_name: 实体分组名称
+        """
+        entity_id = info["entity_id"]
+        domain = entity_domain(entity_id)
+        old_info = self.by_id.get(entity_id)
+        self.by_id[entity_id] = info
+        self.by_domain.setdefault(domain, {})[entity_id] = info
+        groups = self.groups_by_domain.setdefault(domain, {})
+        if old_info is None:
+            insert_into_group(groups, group_name, info)
+        else:
+            self._remove_name(old_info)
+            replace_in_group(groups, self._group_name_of(old_info), old_info, group_name, info)
+        name = info.get("friendly_name", entity_id)
+        self.by_name[name] = self.by_name.get(name, ()) + (info,)
+        if old_info is None or old_info.get("friendly_name", entity_id) != name:
+            self.version += 1
+        if type(info) is EntityRecord:
+            info.set_group_name(group_name)
+            if old_info is not None and type(old_info) is not EntityRecord:
+                del self._group_of[entity_id]
+        else:
+            self._group_of[entity_id] = group_name
+
+    def remove(self, entity_id: str):
+        """
+        从索引中移除实体
+        :param entity_id: 实体ID
+        """
+        info = self.by_id.pop(entity_id, None)
+        if info is None:
+            return
+        self.version += 1
+        domain = entity_domain(entity_id)
+        self._remove_name(info)
+        domain_entities = self.by_domain[domain]
+        del domain_entities[entity_id]
+        if not domain_entities:
+            del self.by_domain[domain]
+        groups = self.groups_by_domain[domain]
+        remove_from_group(groups, self._group_name_of(info), info)
+        self._group_of.pop(entity_id, None)
+        if not groups:
+            del self.groups_by_domain[domain]
+
+    def _remove_name(self, info: Dict[str, Any]):
+        name = info.get("friendly_name", info["entity_id"])
+        same_name = tuple(e for e in self.by_name[name] if e is not info)
+        if same_name:
+            self.by_name[name] = same_name
+        else:
+            del self.by_name[name]
+
+    def get(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        按entity_id查找实体
+        """
+        return self.by_id.get(entity_id)
+
+    def get_group_name(self, entity_id: str) -> Optional[str]:
+        """
+        获取实体所在分组名称
+        """
+        info = self.by_id.get(entity_id)
+        return self._group_name_of(info) if info is not None else None
+
+    def _group_name_of(self, info: Dict[str, Any]) -> str:
+        if type(info) is EntityRecord:
+            return info.group_name
+        return self._group_of[info["entity_id"]]
+
+    def find_by_name(self, friendly_name: str, domain: Optional[str] = None, group_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        按friendly_name查找实体，可限定类型和分组
+        """
+        matches = list(self.by_name.get(friendly_name, ()))
+        if domain is not None:
+            matches = [e for e in matches if entity_domain(e["entity_id"]) == domain]
+        if group_name is not None:
+            matches = [e for e in matches if self._group_name_of(e) == group_name]
+        return matches
+
+    def get_domain_entities(self, domain: str) -> List[Dict[str, Any]]:
+        """
+        获取某一类型的所有实体
+        """
+        return list(self.by_domain.get(domain, {}).values())
+
+    def get_domain_groups(self, domain: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        获取某一类型按名称分组的实体，分组和组内实体均有序
+        """
+        return self.groups_by_domain.get(domain, {})
+
+    def get_group_entities(self, domain: str, group_name: str) -> List[Dict[str, Any]]:
+        """
+        获取某一类型下某个分组的实体
+        """
+        return self.groups_by_domain.get(domain, {}).get(group_name, [])
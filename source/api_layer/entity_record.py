@@ -0,0 +1,256 @@
+import sys
+from collections.abc import Mapping, Sequence
+from itertools import islice
+from typing import Dict, Any, Iterator, Tuple, Optional
+
+# 各类实体对外暴露的字段，与原先分类结果中字典的键保持一致
+BASE_FIELDS = ("entity_id", "friendly_name", "state", "last_updated")
+LIGHT_FIELDS = BASE_FIELDS + ("external_attributes",)
+EVENT_FIELDS = BASE_FIELDS + ("external_attributes", "event_type")
+SENSOR_FIELDS = ("entity_id", "friendly_name", "state", "unit", "unit_of_measurement", "last_updated", "external_attributes")
+
+# 分类 -> 对外暴露的字段；非传感器实体的分类即实体类型
+FIELDS_BY_BUCKET = {
+    "numeric_sensors": SENSOR_FIELDS,
+    "text_sensors": SENSOR_FIELDS,
+    "light": LIGHT_FIELDS,
+    "event": EVENT_FIELDS,
+}
+
+# 传感器分类
+SENSOR_BUCKETS = ("numeric_sensors", "text_sensors", "invalid_sensors")
+
+# 传感器实体信息中不重复保存的属性
+SENSOR_EXCLUDED_ATTRIBUTES = ("friendly_name", "unit_of_measurement")
+
+# 超过该长度的字符串属性值通常不会在实体间重复，不做驻留
+INTERN_MAX_LENGTH = 64
+
+# 多实例联邦时实体ID的命名空间分隔符："实例名:domain.object_id"（Home Assistant实体ID本身不含冒号）
+NAMESPACE_SEPARATOR = ":"
+
+
+def namespace_entity_id(instance_name: str, entity_id: str) -> str:
+    """
+    为实体ID加上实例命名空间
+    """
+    return f"{instance_name}{NAMESPACE_SEPARATOR}{entity_id}"
+
+
+def split_entity_id(entity_id: str) -> Tuple[Optional[str], str]:
+    """
+    拆分带命名空间的实体ID
+    :return: (实例名, 实例内的实体ID)，不带命名空间时实例名为None
+    """
+    instance_name, separator, local_id = entity_id.rpartition(NAMESPACE_SEPARATOR)
+    if not separator:
+        return None, entity_id
+    return instance_name, local_id
+
+
+def entity_domain(entity_id: str) -> str:
+    """
+    获取实体类型（domain），兼容带命名空间的实体ID
+    """
+    domain = entity_id.split(".", 1)[0]
+    if NAMESPACE_SEPARATOR in domain:
+        domain = domain.rpartition(NAMESPACE_SEPARATOR)[2]
+    return domain
+
+
+def intern_value(value: Any) -> Any:
+    """
+    驻留较短的字符串值，使各实体中相同的状态、单位等字符串共享同一个对象
+    """
+    if type(value) is str and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+# 属性键元组 -> 同一个元组对象，属性键集合相同的实体共享一份键元组
+_ATTRIBUTE_KEYS: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def pack_attributes(attributes: Dict[str, Any]) -> Tuple[Tuple[str, ...], Tuple[Any, ...]]:
+    """
+    将属性字典压缩为(共享的键元组, 值元组)，值中较短的字符串（friendly_name除外）会被驻留
+    """
+    keys = tuple(attributes)
+    keys = _ATTRIBUTE_KEYS.setdefault(keys, keys)
+    values = tuple(
+        sys.intern(value) if type(value) is str and key != "friendly_name" and len(value) <= INTERN_MAX_LENGTH else value
+        for key, value in attributes.items()
+    )
+    return keys, values
+
+
+class EntityRecord(Mapping):
+    """
+    紧凑的实体记录
+    使用__slots__保存实体关键信息，类型、状态、分组名称及属性中的单位等短字符串驻留复用；
+    原始属性压缩为共享的键元组和值元组，单位、格式化时间和额外属性字典在访问时才生成，
+    不在每个实体上重复保存；
+    同时实现只读映射接口，可以像原先的实体字典一样通过get/[]访问
+    """
+
+    __slots__ = ("entity_id", "friendly_name", "state", "updated", "bucket", "group_name", "value", "_attribute_keys", "_attribute_values")
+
+    def __init__(self, entity_id: str, state: str, updated: str, attributes: Dict[str, Any], bucket: str):
+        """
+        初始化实体记录
+        :param entity_id: 实体ID
+        :param state: 实体状态
+        :param updated: 原始last_updated时间字符串
+        :param attributes: 实体原始属性
+        :param bucket: 实体所属分类（实体类型或传感器分类）
+        """
+        self.entity_id = entity_id
+        self.friendly_name = attributes.get("friendly_name", "未命名")
+        self.state = intern_value(state)
+        self.updated = updated
+        self.bucket = sys.intern(bucket)
+        self.group_name = "其他"
+        # 数值型传感器解析出的数值，其他实体为None
+        self.value = None
+        self._attribute_keys, self._attribute_values = pack_attributes(attributes)
+
+    @property
+    def domain(self) -> str:
+        """
+        实体类型
+        """
+        return "sensor" if self.bucket in SENSOR_BUCKETS else self.bucket
+
+    @property
+    def _fields(self) -> Tuple[str, ...]:
+        return FIELDS_BY_BUCKET.get(self.bucket, BASE_FIELDS)
+
+    @property
+    def attributes(self) -> Dict[str, Any]:
+        """
+        实体原始属性，每次访问生成新的字典
+        """
+        return dict(zip(self._attribute_keys, self._attribute_values))
+
+    def get_attribute(self, name: str, default: Any = None) -> Any:
+        """
+        读取单个原始属性，不生成属性字典
+        """
+        try:
+            return self._attribute_values[self._attribute_keys.index(name)]
+        except ValueError:
+            return default
+
+    @property
+    def last_updated(self) -> str:
+        """
+        格式化后的最后更新时间
+        """
+        return self.updated[:19].replace("T", " ")
+
+    @property
+    def unit(self) -> str:
+        """
+        展示用单位，无单位时为"无单位"
+        """
+        return self.get_attribute("unit_of_measurement", "无单位")
+
+    @property
+    def unit_of_measurement(self) -> str:
+        """
+        原始单位
+        """
+        return self.get_attribute("unit_of_measurement", "")
+
+    @property
+    def external_attributes(self) -> Dict[str, Any]:
+        """
+        额外属性，传感器会排除已单独保存的属性
+        """
+        if self._fields is SENSOR_FIELDS:
+            return {k: v for k, v in zip(self._attribute_keys, self._attribute_values) if k not in SENSOR_EXCLUDED_ATTRIBUTES}
+        return self.attributes
+
+    @property
+    def event_type(self) -> str:
+        """
+        事件类型
+        """
+        return self.get_attribute("event_type", "未知")
+
+    def set_group_name(self, group_name: str):
+        """
+        设置分组名称，相同名称共享同一个字符串对象
+        """
+        self.group_name = sys.intern(group_name)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in FIELDS_BY_BUCKET.get(self.bucket, BASE_FIELDS):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in FIELDS_BY_BUCKET.get(self.bucket, BASE_FIELDS):
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in FIELDS_BY_BUCKET.get(self.bucket, BASE_FIELDS)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self._fields
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为普通字典
+        """
+        return {key: getattr(self, key) for key in self._fields}
+
+    # 记录按对象身份区分，便于放入集合及在有序分组中定位
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f"EntityRecord({self.entity_id!r}, state={self.state!r})"
+
+
+class RecordView(Sequence):
+    """
+    实体记录的只读列表视图
+    直接引用底层的 entity_id -> 记录 字典，不复制记录，底层字典变化时视图随之变化
+    """
+
+    __slots__ = ("_records",)
+
+    def __init__(self, records: Dict[str, EntityRecord]):
+        self._records = records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[EntityRecord]:
+        return iter(self._records.values())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is None and (index.start or 0) >= 0 and index.stop is not None and index.stop >= 0:
+                return list(islice(self._records.values(), index.start, index.stop))
+            return list(self._records.values())[index]
+        if index < 0:
+            index += len(self._records)
+        if not 0 <= index < len(self._records):
+            raise IndexError("RecordView index out of range")
+        return next(islice(self._records.values(), index, None))
+
+    def __contains__(self, record: object) -> bool:
+        entity_id = getattr(record, "entity_id", None)
+        return entity_id is not None and self._records.get(entity_id) is record
+
+    def __repr__(self) -> str:
+        return f"RecordView({list(self._records.values())!r})"
@@ -0,0 +1,250 @@
+import json
+import asyncio
+import threading
+from typing import Dict, List, Any, Optional, Tuple, Callable
+# 导入日志记录器
+from source.base_layer.utils import logger
+
+try:
+    import websockets
+except ImportError:  # websockets为可选依赖，缺失时退回HTTP轮询
+    websockets = None
+
+
+class EntityStore:
+    """
+    实时实体存储，通过Home Assistant WebSocket API维护所有实体的最新状态
+    启动时获取一次完整快照(get_states)，之后只应用state_changed增量事件
+    """
+
+    def __init__(self, url: str, token: str):
+        """
+        初始化实体存储
+        :param url: Home Assistant URL（http/https）
+        :param token: 长生命周期访问令牌
+        """
+        self.url = url
+        self.token = token
+        self.ws_url = self._build_ws_url(url)
+        self.states: Dict[str, Dict[str, Any]] = {}
+        self.version = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # 订阅线程的事件循环和主任务，stop时取消主任务以立即关闭空闲连接
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._main_task: Optional[asyncio.Task] = None
+        self._message_id = 0
+        # 存储发生变化时调用的回调
+        self._listeners: List[Callable[[], None]] = []
+
+    @staticmethod
+    def _build_ws_url(url: str) -> str:
+        """
+        将REST地址转换为WebSocket地址
+        """
+        if url.startswith("https://"):
+            ws_url = "wss://" + url[len("https://"):]
+        elif url.startswith("http://"):
+            ws_url = "ws://" + url[len("http://"):]
+        else:
+            ws_url = url
+        return ws_url.rstrip("/") + "/api/websocket"
+
+    @property
+    def is_live(self) -> bool:
+        """
+        是否已拿到初始快照并处于订阅状态
+        """
+        return self._ready.is_set()
+
+    def start(self) -> bool:
+        """
+        在后台线程中启动WebSocket订阅
+        :return: 是否成功启动
+        """
+        if websockets is None:
+            logger.warning("未安装websockets，实体存储将退回HTTP轮询模式")
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="ha-entity-store", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """
+        停止WebSocket订阅，连接空闲时也立即关闭
+        """
+        self._stopped.set()
+        self._ready.clear()
+        loop, task = self._loop, self._main_task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        """
+        等待初始快照加载完成
+        :param timeout: 最长等待秒数
+        :return: 是否已就绪
+        """
+        return self._ready.wait(timeout)
+
+    def add_listener(self, callback: Callable[[], None]):
+        """
+        注册变化回调，存储在线期间每次发生变化后以及转为在线时在订阅线程中调用，回调应尽快返回
+        :param callback: 无参数回调函数
+        """
+        self._listeners.append(callback)
+
+    def _notify_listeners(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"实体存储变化回调出错: {str(e)}")
+
+    def snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        获取当前所有实体状态的快照
+        :return: (版本号, 实体状态列表)
+        """
+        with self._lock:
+            return self.version, list(self.states.values())
+
+    def get_state(self, entity_id: str) -> Optional[str]:
+        """
+        获取单个实体的最新状态
+        :return: 状态值，实体不存在时返回None
+        """
+        with self._lock:
+            state = self.states.get(entity_id)
+        return state.get("state") if state is not None else None
+
+    def get_entity(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取单个实体的完整状态
+        :return: 实体状态的副本，实体不存在时返回None
+        """
+        with self._lock:
+            state = self.states.get(entity_id)
+        return dict(state) if state is not None else None
+
+    def load_snapshot(self, states: List[Dict[str, Any]]):
+        """
+        用完整的实体状态列表替换当前存储（存储转为在线时统一通知订阅方）
+        :param states: /api/states 或 get_states 返回的实体列表
+        """
+        with self._lock:
+            self.states = {state["entity_id"]: state for state in states if "entity_id" in state}
+            self.version += 1
+        logger.info(f"实体存储已加载快照，共 {len(self.states)} 个实体")
+
+    def apply_state_changed(self, data: Dict[str, Any]) -> bool:
+        """
+        应用一条state_changed事件
+        :param data: 事件中的data字段，包含entity_id、old_state、new_state
+        :return: 存储是否发生变化
+        """
+        entity_id = data.get("entity_id")
+        if not entity_id:
+            return False
+        new_state = data.get("new_state")
+        with self._lock:
+            if new_state is None:
+                # 实体被移除
+                if self.states.pop(entity_id, None) is None:
+                    return False
+            else:
+                # 订阅先于快照建立，忽略比快照更旧的事件
+                current = self.states.get(entity_id)
+                if current and current.get("last_updated", "") > new_state.get("last_updated", ""):
+                    return False
+                self.states[entity_id] = new_state
+            self.version += 1
+        # 快照加载后补应用的事件不单独通知，存储转为在线时统一通知
+        if self.is_live:
+            self._notify_listeners()
+        return True
+
+    def _next_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    def _run(self):
+        """
+        后台线程入口，断线后按指数退避重连
+        """
+        try:
+            asyncio.run(self._listen_forever())
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop = None
+            self._main_task = None
+
+    async def _listen_forever(self):
+        self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        delay = 1
+        while not self._stopped.is_set():
+            try:
+                await self._listen()
+                delay = 1
+            except Exception as e:
+                logger.warning(f"实体存储WebSocket连接中断: {str(e)}，{delay}秒后重连")
+            self._ready.clear()
+            if self._stopped.is_set():
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def _listen(self):
+        """
+        建立一次WebSocket会话：认证、订阅、拉取快照、持续应用增量
+        """
+        self._message_id = 0
+        async with websockets.connect(self.ws_url, max_size=None) as ws:
+            message = json.loads(await ws.recv())
+            if message.get("type") == "auth_required":
+                await ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+                message = json.loads(await ws.recv())
+            if message.get("type") != "auth_ok":
+                self._stopped.set()
+                logger.error(f"实体存储WebSocket认证失败: {message.get('message', message.get('type'))}")
+                return
+
+            # 先订阅再拉取快照，避免两者之间的状态变化丢失
+            subscribe_id = self._next_id()
+            await ws.send(json.dumps({"id": subscribe_id, "type": "subscribe_events", "event_type": "state_changed"}))
+            states_id = self._next_id()
+            await ws.send(json.dumps({"id": states_id, "type": "get_states"}))
+
+            # 快照到达前收到的事件先缓存，快照加载后再按时间戳补应用
+            pending_events = []
+            async for raw in ws:
+                if self._stopped.is_set():
+                    break
+                message = json.loads(raw)
+                if message.get("type") == "event" and message.get("id") == subscribe_id:
+                    data = message.get("event", {}).get("data", {})
+                    if self.is_live:
+                        self.apply_state_changed(data)
+                    else:
+                        pending_events.append(data)
+                elif message.get("type") == "result" and message.get("id") == states_id:
+                    if not message.get("success"):
+                        raise RuntimeError(f"get_states失败: {message.get('error')}")
+                    self.load_snapshot(message.get("result") or [])
+                    for data in pending_events:
+                        self.apply_state_changed(data)
+                    pending_events = []
+                    self._ready.set()
+                    # 存储转为在线，通知订阅方改用内存快照
+                    self._notify_listeners()
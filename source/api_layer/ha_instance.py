@@ -0,0 +1,261 @@
+import os
+import re
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Callable
+import httpx
+# 导入日志记录器
+from source.base_layer.utils import logger
+# 导入实时实体存储
+from source.api_layer.entity_store import EntityStore
+# 导入实体ID命名空间工具
+from source.api_layer.entity_record import namespace_entity_id
+# 导入JSON数组流式解析
+from source.base_layer.json_stream import iter_json_array
+# 导入共享的HTTP传输层
+from source.api_layer.ha_transport import get_ha_transport, StreamingResponse
+
+# 流式读取/api/states响应时每次读取的字节数
+STATES_CHUNK_SIZE = 64 * 1024
+
+# 实例名称只允许小写字母、数字和下划线（会作为实体ID命名空间及MCP服务名的一部分）
+INSTANCE_NAME_PATTERN = re.compile(r"^[a-z0-9_]+$")
+
+# 未配置HA_INSTANCES时唯一实例的名称
+DEFAULT_INSTANCE_NAME = "default"
+
+
+class HomeAssistantInstance:
+    """
+    单个Home Assistant实例
+    保存实例的连接信息和实时实体存储，负责拉取该实例的全部实体状态；
+    联邦模式下拉取到的实体ID会加上"实例名:"命名空间
+    """
+
+    def __init__(self, name: str, url: str, token: str, namespaced: bool = False):
+        """
+        初始化实例
+        :param name: 实例名称
+        :param url: Home Assistant URL
+        :param token: 长生命周期访问令牌
+        :param namespaced: 实体ID是否加实例命名空间
+        """
+        self.name = name
+        self.url = url
+        self.token = token
+        self.headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        # 实体ID命名空间前缀，单实例时为空
+        self.prefix = namespace_entity_id(name, "") if namespaced else ""
+        self.entity_store: Optional[EntityStore] = None
+        self._store_version: Optional[int] = None
+
+    @property
+    def _log_prefix(self) -> str:
+        return f"[{self.name}] " if self.prefix else ""
+
+    def start_store(self, listener: Callable[[], None]) -> bool:
+        """
+        启动实时实体存储（WebSocket订阅）
+        :param listener: 存储变化回调
+        :return: 是否成功启动
+        """
+        store = EntityStore(self.url, self.token)
+        store.add_listener(listener)
+        if not store.start():
+            return False
+        self.entity_store = store
+        return True
+
+    @property
+    def is_live(self) -> bool:
+        """
+        实时实体存储是否在线
+        """
+        return self.entity_store is not None and self.entity_store.is_live
+
+    def is_store_current(self) -> bool:
+        """
+        实体存储在线且自上次读取以来没有变化
+        """
+        return self.is_live and self._store_version == self.entity_store.version
+
+    def wait_for_store(self, timeout: float) -> bool:
+        """
+        等待实体存储加载初始快照
+        :return: 是否已就绪（没有实体存储时返回True）
+        """
+        if self.entity_store is None:
+            return True
+        return self.entity_store.wait_until_ready(timeout)
+
+    def live_state(self, entity_id: str) -> Optional[str]:
+        """
+        从在线的实体存储读取实体的最新状态
+        :param entity_id: 实体ID（可带本实例的命名空间）
+        :return: 状态值，实体存储不在线或实体不存在时返回None
+        """
+        if not self.is_live:
+            return None
+        return self.entity_store.get_state(self.local_entity_id(entity_id))
+
+    def live_entity(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        从在线的实体存储读取实体的完整状态
+        :param entity_id: 实体ID（可带本实例的命名空间）
+        :return: 实体状态（联邦模式下实体ID已加命名空间），实体存储不在线或实体不存在时返回None
+        """
+        if not self.is_live:
+            return None
+        state = self.entity_store.get_entity(self.local_entity_id(entity_id))
+        if state is not None and self.prefix:
+            state["entity_id"] = self.prefix + state["entity_id"]
+        return state
+
+    def local_entity_id(self, entity_id: str) -> str:
+        """
+        去掉实体ID的实例命名空间
+        """
+        if self.prefix and entity_id.startswith(self.prefix):
+            return entity_id[len(self.prefix):]
+        return entity_id
+
+    def fetch_all_states(self) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        通过REST API获取实例中所有实体的原始状态
+        响应体以流式方式逐个解析，不在内存中保存完整的原始状态列表
+        :return: 实体状态迭代器，请求失败时返回None；读取过程中的网络或解析错误在迭代时抛出
+        """
+        all_entities_url = f"{self.url}/api/states"
+        try:
+            response = get_ha_transport().stream_sync("GET", all_entities_url, chunk_size=STATES_CHUNK_SIZE,
+                                                      headers=self.headers, timeout=15)
+            if response.status_code == 401:
+                response.close()
+                logger.error(f"{self._log_prefix}获取实体失败！状态码：401，原因：未授权访问")
+                logger.error("\n可能的解决方案：")
+                logger.error("1. 检查访问令牌是否正确 - 令牌格式应为以Bearer开头的长字符串")
+                logger.error("2. 生成新的长生命周期访问令牌")
+                return None
+            elif response.status_code != 200:
+                logger.error(f"{self._log_prefix}获取实体失败！状态码：{response.status_code}，原因：{response.text}")
+                response.close()
+                return None
+            return self._iter_states(response)
+        except httpx.ConnectError:
+            logger.error(f"{self._log_prefix}连接异常！无法连接到Home Assistant服务器")
+            return None
+        except Exception as e:
+            logger.error(f"{self._log_prefix}请求异常！原因：{str(e)}")
+            return None
+
+    @staticmethod
+    def _iter_states(response: StreamingResponse) -> Iterator[Dict[str, Any]]:
+        """
+        逐个解析响应中的实体状态，读取结束或中断时归还连接
+        """
+        with response:
+            yield from iter_json_array(response.iter_bytes())
+
+    def load_states(self) -> Optional[Iterable[Dict[str, Any]]]:
+        """
+        获取实例中所有实体的状态
+        实体存储在线时直接读取内存中的最新状态，否则通过REST API流式拉取
+        :return: 实体状态（联邦模式下实体ID已加命名空间），请求失败时返回None
+        """
+        if self.is_live:
+            self._store_version, states = self.entity_store.snapshot()
+        else:
+            states = self.fetch_all_states()
+            if states is None:
+                return None
+        if self.prefix:
+            return self._namespaced(states)
+        return states
+
+    def _namespaced(self, states: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for state in states:
+            if "entity_id" in state:
+                state = dict(state, entity_id=self.prefix + state["entity_id"])
+            yield state
+
+    def load_states_list(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        完整读取实例中所有实体的状态（供并发拉取的工作线程使用）
+        :return: 实体状态列表，请求、读取或解析失败时返回None
+        """
+        states = self.load_states()
+        if states is None:
+            return None
+        try:
+            return list(states)
+        except httpx.HTTPError as e:
+            logger.error(f"{self._log_prefix}读取实体状态异常！原因：{str(e)}")
+        except ValueError as e:
+            logger.error(f"{self._log_prefix}解析实体状态失败！原因：{str(e)}")
+        return None
+
+    async def async_fetch_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """
+        通过REST API获取单个实体的权威状态（GET /api/states/<entity_id>）
+        :param entity_id: 实体ID（可带本实例的命名空间）
+        :return: 实体状态（联邦模式下实体ID已加命名空间），请求失败或实体不存在时返回None
+        """
+        try:
+            response = await get_ha_transport().request(
+                "GET", f"{self.url}/api/states/{self.local_entity_id(entity_id)}", headers=self.headers
+            )
+            if response.status_code != 200:
+                logger.warning(f"{self._log_prefix}获取实体 {entity_id} 状态失败！状态码：{response.status_code}")
+                return None
+            state = response.json()
+        except Exception as e:
+            logger.warning(f"{self._log_prefix}获取实体 {entity_id} 状态异常！原因：{str(e)}")
+            return None
+        if self.prefix and "entity_id" in state:
+            state["entity_id"] = self.prefix + state["entity_id"]
+        return state
+
+    def mcp_connection(self, endpoint: str) -> Dict[str, Any]:
+        """
+        实例的MCP服务连接配置
+        :param endpoint: MCP服务端点
+        """
+        return {
+            "transport": "sse",
+            "url": f"{self.url}{endpoint}",
+            "headers": self.headers,
+        }
+
+
+def load_instances_from_env() -> Dict[str, HomeAssistantInstance]:
+    """
+    从环境变量读取Home Assistant实例配置
+    未配置HA_INSTANCES时只有一个实例（HA_URL/HA_TOKEN），实体ID不加命名空间；
+    HA_INSTANCES="home,office"时，每个实例读取HA_URL_<实例名大写>和HA_TOKEN_<实例名大写>，
+    配置了多个实例时实体ID格式为"实例名:domain.object_id"
+    :return: 实例名称 -> 实例，第一个为主实例
+    """
+    names = []
+    for name in os.getenv("HA_INSTANCES", "").split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if not INSTANCE_NAME_PATTERN.match(name):
+            logger.error(f"无效的Home Assistant实例名称: {name}（只允许小写字母、数字和下划线）")
+            continue
+        if name not in names:
+            names.append(name)
+
+    if not names:
+        url = os.getenv("HA_URL", "http://localhost:8123")
+        token = os.getenv("HA_TOKEN", "")
+        return {DEFAULT_INSTANCE_NAME: HomeAssistantInstance(DEFAULT_INSTANCE_NAME, url, token)}
+
+    namespaced = len(names) > 1
+    instances = {}
+    for name in names:
+        url = os.getenv(f"HA_URL_{name.upper()}", os.getenv("HA_URL", "http://localhost:8123"))
+        token = os.getenv(f"HA_TOKEN_{name.upper()}", "")
+        instances[name] = HomeAssistantInstance(name, url, token, namespaced=namespaced)
+    return instances
@@ -0,0 +1,332 @@
+import os
+import atexit
+import asyncio
+import threading
+from typing import Dict, List, Any, Optional, Tuple, Iterator, AsyncIterator
+import httpx
+# 导入日志记录器
+from source.base_layer.utils import logger
+# 导入延迟单例
+from source.base_layer.lazy_singleton import LazySingleton
+
+
+class StreamingResponse:
+    """
+    可在同步代码中逐块读取的流式响应
+    底层连接在传输线程的事件循环中读取，读取结束或关闭后归还连接池
+    """
+
+    def __init__(self, transport: "HomeAssistantTransport", response: httpx.Response, chunks: AsyncIterator):
+        self._transport = transport
+        self._response = response
+        self._chunks = chunks
+        self.status_code = response.status_code
+
+    @property
+    def text(self) -> str:
+        """
+        读取完整响应文本，用于输出错误信息
+        """
+        self._transport.run_sync(self._response.aread())
+        return self._response.text
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """
+        逐块读取响应体
+        """
+        try:
+            while True:
+                try:
+                    yield self._transport.run_sync(self._chunks.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        关闭响应，归还连接
+        """
+        if self._chunks is not None:
+            chunks, self._chunks = self._chunks, None
+            self._transport.run_sync(chunks.aclose())
+
+    def __enter__(self) -> "StreamingResponse":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HomeAssistantTransport:
+    """
+    Home Assistant HTTP传输层
+    所有REST调用共享按主机划分的长连接池（httpx.AsyncClient），连接复用，避免每次请求重新握手；
+    客户端运行在独立的事件循环线程中，异步调用方不会阻塞自身的事件循环，
+    同步调用方（CLI、Gradio回调等）通过同步包装方法使用同一个连接池
+    """
+
+    def __init__(self):
+        # 从环境变量读取连接池配置
+        self.timeout = float(os.getenv("HA_HTTP_TIMEOUT", "10"))
+        self.max_connections = int(os.getenv("HA_HTTP_MAX_CONNECTIONS", "10"))
+        self.max_keepalive_connections = int(os.getenv("HA_HTTP_MAX_KEEPALIVE", "5"))
+        self.keepalive_expiry = float(os.getenv("HA_HTTP_KEEPALIVE_EXPIRY", "30"))
+        # 多实体服务调用无法合并为一次请求时，逐个调用的最大并发数
+        self.service_concurrency = int(os.getenv("HA_SERVICE_CONCURRENCY", "8"))
+        # (scheme, host, port) -> 客户端
+        self._clients: Dict[Tuple[str, str, Optional[int]], httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        首次使用时启动传输线程及其事件循环
+        """
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="ha-transport", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+                atexit.register(self.close)
+        return self._loop
+
+    def _client_for(self, url: str) -> httpx.AsyncClient:
+        """
+        获取目标主机的客户端，每个主机一个连接池（只在传输线程中调用）
+        """
+        parsed = httpx.URL(url)
+        key = (parsed.scheme, parsed.host, parsed.port)
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+            self._clients[key] = client
+        return client
+
+    def run_sync(self, coro, timeout: Optional[float] = None) -> Any:
+        """
+        在传输线程中运行协程并同步等待结果
+        :param coro: 协程
+        :param timeout: 最长等待时间（秒），None表示不限
+        """
+        loop = self._ensure_loop()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("不能在传输线程中同步等待HTTP请求")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    async def _run_async(self, coro) -> Any:
+        """
+        在传输线程中运行协程，调用方的事件循环在等待期间不被阻塞
+        """
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    async def _request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        client = self._client_for(url)
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return await client.request(method, url, **kwargs)
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        发送HTTP请求（异步）
+        :param method: 请求方法
+        :param url: 完整URL
+        :param timeout: 本次请求的超时时间（秒），默认使用HA_HTTP_TIMEOUT
+        :param kwargs: 透传给httpx的参数（headers、json、params等）
+        :return: 已读取完响应体的响应
+        """
+        return await self._run_async(self._request(method, url, timeout=timeout, **kwargs))
+
+    def request_sync(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """
+        发送HTTP请求（同步包装）
+        参数同request
+        """
+        return self.run_sync(self._request(method, url, timeout=timeout, **kwargs))
+
+    async def _stream(self, method: str, url: str, chunk_size: int, timeout: Optional[float] = None, **kwargs) -> AsyncIterator:
+        # 第一个产出值为响应对象，之后依次产出响应体字节块
+        client = self._client_for(url)
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        async with client.stream(method, url, **kwargs) as response:
+            yield response
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+
+    def stream_sync(self, method: str, url: str, chunk_size: int = 64 * 1024, timeout: Optional[float] = None, **kwargs) -> StreamingResponse:
+        """
+        发送HTTP请求并以流式方式读取响应体（同步包装）
+        :param chunk_size: 每次读取的字节数
+        :return: 流式响应，使用完毕后需关闭（iter_bytes读取结束时会自动关闭）
+        """
+        chunks = self._stream(method, url, chunk_size, timeout=timeout, **kwargs)
+        response = self.run_sync(chunks.__anext__())
+        return StreamingResponse(self, response, chunks)
+
+    def close(self):
+        """
+        关闭所有连接池并停止传输线程
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def close_clients():
+            for client in self._clients.values():
+                await client.aclose()
+            self._clients.clear()
+
+        try:
+            asyncio.run_coroutine_threadsafe(close_clients(), loop).result(5)
+        except Exception as e:
+            logger.warning(f"关闭HTTP连接池时出错: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+
+
+# 全局共享的传输层实例，首次使用时创建，传输线程在首次请求时才启动
+_ha_transport = LazySingleton(HomeAssistantTransport, "ha_transport")
+
+
+def get_ha_transport() -> HomeAssistantTransport:
+    """
+    获取全局HomeAssistantTransport实例，首次调用时创建
+    """
+    return _ha_transport.get()
+
+
+def __getattr__(name: str):
+    # 兼容 from ... import ha_transport 的旧用法，访问时才创建实例
+    if name == "ha_transport":
+        return get_ha_transport()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def async_call_service(url: str, headers: Dict[str, str], entity_id: str, service: str) -> str:
+    """
+    调用Home Assistant服务（异步）
+    :param url: Home Assistant URL
+    :param headers: 请求头
+    :param entity_id: 实体ID
+    :param service: 服务名称（turn_on/turn_off等）
+    :return: 执行结果
+    """
+    try:
+        # 从entity_id中提取域（domain）
+        domain = entity_id.split(".")[0] if "." in entity_id else ""
+
+        if not domain:
+            return f"无效的实体ID: {entity_id}"
+
+        # 构建服务调用URL
+        service_url = f"{url}/api/services/{domain}/{service}"
+
+        # 发送请求
+        response = await get_ha_transport().request("POST", service_url, headers=headers, json={"entity_id": entity_id})
+
+        if response.status_code in [200, 201]:
+            return f"成功执行: {service} {entity_id}"
+        else:
+            return f"执行失败: {response.status_code} {response.text}"
+    except Exception as e:
+        return f"执行异常: {str(e)}"
+
+
+def call_service(url: str, headers: Dict[str, str], entity_id: str, service: str) -> str:
+    """
+    调用Home Assistant服务（同步包装）
+    参数同async_call_service
+    """
+    try:
+        return get_ha_transport().run_sync(async_call_service(url, headers, entity_id, service))
+    except Exception as e:
+        return f"执行异常: {str(e)}"
+
+
+async def async_call_services(url: str, headers: Dict[str, str], entity_ids: List[str], service: str,
+                              concurrency: Optional[int] = None) -> Dict[str, str]:
+    """
+    对多个实体调用同一服务（异步）
+    同一类型的实体合并为一次请求（服务数据中的entity_id为列表），耗时约为一次往返；
+    合并请求被拒绝（状态码400，如服务不支持多个实体或其中有无效实体）时改为逐个调用，并发数不超过concurrency
+    :param url: Home Assistant URL
+    :param headers: 请求头
+    :param entity_ids: 实体ID列表
+    :param service: 服务名称（turn_on/turn_off等）
+    :param concurrency: 逐个调用时的最大并发数，默认使用HA_SERVICE_CONCURRENCY
+    :return: 实体ID -> 执行结果，顺序与entity_ids一致
+    """
+    results = {}
+    by_domain: Dict[str, List[str]] = {}
+    for entity_id in dict.fromkeys(entity_ids):
+        domain = entity_id.split(".")[0] if "." in entity_id else ""
+        if domain:
+            by_domain.setdefault(domain, []).append(entity_id)
+        else:
+            results[entity_id] = f"无效的实体ID: {entity_id}"
+
+    semaphore = asyncio.Semaphore(concurrency or get_ha_transport().service_concurrency)
+    for domain_results in await asyncio.gather(*(
+        _call_domain_service(url, headers, domain, domain_entity_ids, service, semaphore)
+        for domain, domain_entity_ids in by_domain.items()
+    )):
+        results.update(domain_results)
+    return {entity_id: results[entity_id] for entity_id in entity_ids}
+
+
+async def _call_domain_service(url: str, headers: Dict[str, str], domain: str, entity_ids: List[str], service: str,
+                               semaphore: asyncio.Semaphore) -> Dict[str, str]:
+    """
+    对同一类型的多个实体调用服务，先尝试合并为一次请求，被拒绝时有限并发地逐个调用
+    """
+    async def call_one(entity_id: str) -> Tuple[str, str]:
+        async with semaphore:
+            return entity_id, await async_call_service(url, headers, entity_id, service)
+
+    if len(entity_ids) > 1:
+        try:
+            service_url = f"{url}/api/services/{domain}/{service}"
+            response = await get_ha_transport().request("POST", service_url, headers=headers, json={"entity_id": entity_ids})
+            if response.status_code in [200, 201]:
+                return {entity_id: f"成功执行: {service} {entity_id}" for entity_id in entity_ids}
+            if response.status_code != 400:
+                return {entity_id: f"执行失败: {response.status_code} {response.text}" for entity_id in entity_ids}
+            logger.info(f"批量调用 {domain}.{service} 被拒绝，改为逐个调用 {len(entity_ids)} 个实体")
+        except Exception as e:
+            return {entity_id: f"执行异常: {str(e)}" for entity_id in entity_ids}
+
+    return dict(await asyncio.gather(*(call_one(entity_id) for entity_id in entity_ids)))
+
+
+def call_services(url: str, headers: Dict[str, str], entity_ids: List[str], service: str,
+                  concurrency: Optional[int] = None) -> Dict[str, str]:
+    """
+    对多个实体调用同一服务（同步包装）
+    参数同async_call_services
+    """
+    try:
+        return get_ha_transport().run_sync(async_call_services(url, headers, entity_ids, service, concurrency))
+    except Exception as e:
+        return {entity_id: f"执行异常: {str(e)}" for entity_id in entity_ids}
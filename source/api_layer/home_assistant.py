@@ -1,13 +1,52 @@
-import requests
 import os
 import sys
+import time
+import atexit
+import asyncio
+import threading
+import httpx
 import pandas as pd
-from datetime import datetime
-from typing import Dict, List, Tuple, Any, Optional
-# 导入MCP客户端
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple, Any, Optional, Iterable, TYPE_CHECKING
 # 导入日志记录器
 from source.base_layer.utils import logger
+# 导入延迟单例
+from source.base_layer.lazy_singleton import LazySingleton
+# 导入Home Assistant实例及实例配置
+from source.api_layer.ha_instance import HomeAssistantInstance, load_instances_from_env
+# 导入实体ID命名空间工具
+from source.api_layer.entity_record import split_entity_id
+# 导入增量实体分类器
+from source.api_layer.entity_classifier import EntityClassifier
+# 导入实体分组器
+from source.api_layer.entity_grouping import EntityGrouper
+# 导入单飞快照缓存
+from source.base_layer.snapshot_cache import SnapshotCache
+# 导入后台刷新任务
+from source.base_layer.background_refresher import BackgroundRefresher
+# 导入实体快照文件
+from source.base_layer.snapshot_file import SnapshotFile
+# 导入共享的HTTP传输层
+from source.api_layer.ha_transport import get_ha_transport, call_service, async_call_service, async_call_services
+# 导入MCP会话管理器
+from source.api_layer.mcp_session import MCPSessionManager
+
+if TYPE_CHECKING:
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+
+# 实体摘要中列出分组示例的实体类型
+SUMMARY_DETAIL_DOMAINS = ['light', 'switch', 'binary_sensor']
+
+# 服务执行后实体应处于的状态；实体当前已处于该状态时跳过服务调用
+SERVICE_TARGET_STATES = {
+    "turn_on": "on",
+    "turn_off": "off",
+    "open_cover": "open",
+    "close_cover": "closed",
+    "lock": "locked",
+    "unlock": "unlocked",
+}
 
 class HomeAssistantManager:
     """
@@ -15,17 +54,187 @@ class HomeAssistantManager:
     """
     
     def __init__(self):
-        # 从环境变量读取配置
-        self.url = os.getenv("HA_URL", "http://localhost:8123")
-        self.token = os.getenv("HA_TOKEN", "")
-        self.headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
+        # 从环境变量读取实例配置；配置了多个实例时以联邦模式运行，实体ID带"实例名:"命名空间
+        self.instances: Dict[str, HomeAssistantInstance] = load_instances_from_env()
+        self.federated = len(self.instances) > 1
+        # 主实例的连接信息，保持单实例时的属性兼容
+        primary = next(iter(self.instances.values()))
+        self.url = primary.url
+        self.token = primary.token
+        self.headers = primary.headers
         self.entity_data = {}
-        self.current_entity_summary = ""
+        # 实体摘要在首次读取时才生成，按快照版本缓存；各实体类型的摘要片段单独缓存，只重建发生变化的类型
+        self._summary = ""
+        self._summary_version: Optional[int] = None
+        self._summary_sections: Dict[str, List[str]] = {}
+        # 自上次生成摘要以来发生变化的实体类型，None表示全部需要重建
+        self._dirty_summary_domains: Optional[set] = None
+        self._summary_lock = threading.Lock()
+        self.entity_grouper = EntityGrouper()
+        self.entity_classifier = EntityClassifier(group_func=self.get_entity_group_name)
+        # 实体索引随每次分类增量维护，支持按ID、名称、类型和分组的O(1)查找
+        self.entity_index = self.entity_classifier.index
+        # 后台刷新任务：启用后由后台保持实体数据最新，请求路径只读取最新快照
+        self.background_refresher: Optional[BackgroundRefresher] = None
+        # 实时实体存储：每个实例通过WebSocket订阅state_changed，避免每次全量拉取/api/states
+        if os.getenv("HA_USE_WEBSOCKET", "true") == "true":
+            for instance in self.instances.values():
+                instance.start_store(self._on_store_changed)
+        # 主实例的实体存储，保持单实例时的属性兼容
+        self.entity_store = primary.entity_store
+        self.store_ready_timeout = float(os.getenv("HA_WEBSOCKET_READY_TIMEOUT", "10"))
+        # 实体快照缓存：陈旧度预算内的刷新请求共享同一份快照，并发刷新合并为一次拉取
+        self.snapshot_cache = SnapshotCache(
+            loader=self._load_entity_snapshot,
+            max_staleness=float(os.getenv("HA_SNAPSHOT_MAX_STALENESS", "5")),
+            validator=self._is_store_unchanged
+        )
+        # 磁盘中保存的上一次实体快照：启动时立即加载并标记为陈旧，在后台重新验证
+        snapshot_path = os.getenv("HA_SNAPSHOT_FILE", os.path.join(os.getenv("OUTPUT_DIR", "output"), "entity_snapshot.bin"))
+        self.snapshot_file = SnapshotFile(snapshot_path, self._snapshot_source()) if snapshot_path else None
+        self.snapshot_save_interval = float(os.getenv("HA_SNAPSHOT_SAVE_INTERVAL", "60"))
+        self._persisted_version: Optional[int] = None
+        self._persisted_at: Optional[float] = None
+        # 重新验证期间，非强制的刷新请求直接使用已加载的陈旧快照
+        self._revalidating = threading.Event()
+        # 因实体已处于目标状态而跳过的服务调用次数
+        self.elided_service_calls = 0
+        self._elided_lock = threading.Lock()
+        # 服务调用成功后先乐观更新受影响的实体，延迟若干秒后只拉取这些实体的权威状态进行校正
+        self.reconcile_delay = float(os.getenv("HA_RECONCILE_DELAY", "1"))
+        # MCP长连接会话及缓存的工具目录，首次使用时创建
+        self._mcp_sessions: Optional[MCPSessionManager] = None
+        self._mcp_sessions_lock = threading.Lock()
         logger.info("正在初始化Home Assistant数据...")
-        self.update_entity_data()
+        if self._restore_entity_snapshot():
+            self._revalidating.set()
+            threading.Thread(target=self._revalidate_entity_snapshot, name="ha-snapshot-revalidate", daemon=True).start()
+        else:
+            self._wait_for_store()
+            self.update_entity_data()
+        if self.snapshot_file is not None:
+            atexit.register(self._persist_entity_snapshot, True)
+        if os.getenv("HA_BACKGROUND_REFRESH", "false") == "true":
+            self.start_background_refresh()
+        # 启动时在后台建立MCP会话并加载工具目录，第一条消息无需等待
+        if os.getenv("HA_MCP_PRELOAD", "true") == "true":
+            self.get_mcp_sessions().start()
+    
+    def start_background_refresh(self):
+        """
+        启动后台刷新任务：按HA_REFRESH_INTERVAL定时刷新，实体存储变化时提前刷新，
+        两次刷新至少间隔HA_REFRESH_MIN_INTERVAL秒，突发的变化合并为一次刷新
+        """
+        if self.background_refresher is None:
+            self.background_refresher = BackgroundRefresher(
+                refresh=self._background_refresh,
+                interval=float(os.getenv("HA_REFRESH_INTERVAL", "30")),
+                min_interval=float(os.getenv("HA_REFRESH_MIN_INTERVAL", "1")),
+                name="ha-entity-refresher"
+            )
+        self.background_refresher.start()
+        logger.info("实体数据后台刷新任务已启动")
+
+    def stop_background_refresh(self):
+        """
+        停止后台刷新任务，之后的刷新请求重新在调用方同步执行
+        """
+        if self.background_refresher is not None:
+            self.background_refresher.stop()
+
+    def _background_refresh(self):
+        # 忽略陈旧度预算；实体存储未变化时加载函数直接复用现有数据
+        self._refresh_snapshot(force=True)
+
+    def _wait_for_store(self):
+        """
+        等待各实例的实体存储加载初始快照，所有实例共用同一个超时时间
+        """
+        deadline = time.monotonic() + self.store_ready_timeout
+        for instance in self.instances.values():
+            if not instance.wait_for_store(max(deadline - time.monotonic(), 0)):
+                name = f"实例 {instance.name} 的" if self.federated else ""
+                logger.warning(f"{name}实体存储未能在超时时间内就绪，暂时使用HTTP轮询")
+
+    def _snapshot_source(self) -> str:
+        """
+        快照文件的数据来源标识，实例配置变化后旧快照不会被加载
+        """
+        if not self.federated:
+            return self.url
+        return ";".join(f"{name}={instance.url}" for name, instance in self.instances.items())
+
+    def _restore_entity_snapshot(self) -> bool:
+        """
+        从磁盘加载上一次保存的实体快照并分类，快照被标记为陈旧
+        :return: 是否加载成功
+        """
+        if self.snapshot_file is None:
+            return False
+        loaded = self.snapshot_file.load()
+        if loaded is None:
+            return False
+        saved_at, rows = loaded
+        sensor_data, non_sensor_data = self.classify_entities(
+            {"entity_id": entity_id, "state": state, "last_updated": updated, "attributes": attributes}
+            for entity_id, state, updated, attributes in rows
+        )
+        self.entity_data = {
+            "sensor_data": sensor_data,
+            "non_sensor_data": non_sensor_data
+        }
+        self.snapshot_cache.prime(self.entity_data)
+        self._persisted_version = self.snapshot_version
+        age = max(time.time() - saved_at, 0)
+        logger.info(f"已从磁盘加载实体快照，共 {len(rows)} 个实体，保存于 {age:.0f} 秒前，正在后台重新验证")
+        return True
+
+    def _revalidate_entity_snapshot(self):
+        """
+        后台重新验证从磁盘加载的快照，完成前的刷新请求直接使用陈旧快照
+        """
+        try:
+            self._wait_for_store()
+            self._refresh_snapshot(force=True)
+        except Exception as e:
+            logger.warning(f"重新验证实体快照失败: {str(e)}")
+        finally:
+            self._revalidating.clear()
+
+    def _refresh_snapshot(self, force: bool = False, max_staleness: Optional[float] = None):
+        """
+        刷新快照，并按HA_SNAPSHOT_SAVE_INTERVAL保存到磁盘
+        """
+        self.snapshot_cache.get(max_staleness=max_staleness, force=force)
+        self._persist_entity_snapshot()
+
+    def _persist_entity_snapshot(self, force: bool = False):
+        """
+        将当前分类结果中的实体保存到磁盘，快照未变化时跳过
+        :param force: 是否忽略保存间隔（退出时使用）
+        """
+        version = self.snapshot_version
+        if self.snapshot_file is None or version == 0 or version == self._persisted_version:
+            return
+        now = time.monotonic()
+        if not force and self._persisted_at is not None and now - self._persisted_at < self.snapshot_save_interval:
+            return
+        rows = [(record.entity_id, record.state, record.updated, record.attributes)
+                for record in list(self.entity_index.by_id.values())]
+        if self.snapshot_file.save(rows):
+            self._persisted_version = version
+            self._persisted_at = now
+
+    def _on_store_changed(self):
+        # 在实体存储的订阅线程中调用，只发出通知，不在此处刷新
+        if self.background_refresher is not None:
+            self.background_refresher.notify()
+    
+    def get_entity_group_name(self, entity: Dict[str, Any]) -> str:
+        """
+        计算单个实体的分组名称，结果按名称缓存，名称变化时才重新计算
+        """
+        return self.entity_grouper.get_group_name(entity)
     
     def group_entities_by_name(self, entities: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
         """
@@ -35,270 +244,463 @@ class HomeAssistantManager:
         2. 如果friendly_name不可用，则从entity_id中提取位置/区域信息
         3. 使用常见的分隔符和规则识别位置/区域信息
         """
-        grouped_entities = {}
-        
-        # 常见的位置关键词（可根据需要扩展）
-        location_keywords = [
-            "客厅", "卧室", "厨房", "卫生间", "浴室", "书房", "儿童房", "主卧", "次卧", 
-            "阳台", "门厅", "走廊", "餐厅", "车库", "花园", "院子", "阁楼"
-        ]
-        
-        for entity in entities:
-            group_name = "其他"
-            
-            # 尝试从friendly_name提取分组
-            friendly_name = entity.get("friendly_name", "")
-            if friendly_name:
-                # 检查是否包含常见位置关键词
-                for keyword in location_keywords:
-                    if keyword in friendly_name:
-                        group_name = keyword
-                        break
-                
-                # 如果没有匹配到关键词，尝试按分隔符分割
-                if group_name == "其他":
-                    # 尝试按常见分隔符分割
-                    separators = ["-", "_", "(", "（", " "]
-                    for sep in separators:
-                        if sep in friendly_name:
-                            parts = friendly_name.split(sep, 1)
-                            if parts:
-                                group_name = parts[0].strip()
-                                break
-            
-            # 如果friendly_name未能提取分组，尝试从entity_id提取
-            if group_name == "其他":
-                entity_id = entity.get("entity_id", "")
-                # 提取entity_type部分
-                if "." in entity_id:
-                    entity_type, entity_name = entity_id.split(".", 1)
-                    # 尝试按下划线分割entity_name
-                    if "_" in entity_name:
-                        parts = entity_name.split("_")
-                        # 通常第一个或前两个部分是位置信息
-                        if parts:
-                            # 如果是类似 "living_room_temperature" 的格式
-                            if len(parts) > 1:
-                                group_name = parts[0] + "_" + parts[1]
-                            else:
-                                group_name = parts[0]
-            
-            # 将实体添加到对应分组
-            if group_name not in grouped_entities:
-                grouped_entities[group_name] = []
-            grouped_entities[group_name].append(entity)
-        
-        # 对分组进行排序
-        sorted_groups = {}
-        for group in sorted(grouped_entities.keys()):
-            # 对同一分组内的实体按名称排序
-            sorted_entities = sorted(grouped_entities[group], key=lambda s: s.get("friendly_name", s.get("entity_id", "")))
-            sorted_groups[group] = sorted_entities
-        
-        return sorted_groups
+        return self.entity_grouper.group_entities(entities)
     
-    def get_mcp_client(self) -> Optional[MultiServerMCPClient]:
+    def _mcp_connections(self) -> Dict[str, Dict[str, Any]]:
+        """
+        MCP服务连接配置，每个实例对应一个MCP服务
+        """
+        ha_mcp_endpoint = os.getenv("HA_MCP_ENDPOINT", "/mcp_server/sse")
+        return {
+            self._mcp_server_name(instance): instance.mcp_connection(ha_mcp_endpoint)
+            for instance in self.instances.values()
+        }
+
+    def get_mcp_client(self) -> Optional["MultiServerMCPClient"]:
         """
-        获取MCP客户端实例
+        获取MCP客户端实例（每次调用工具都新建连接，对话流程使用get_mcp_tools获取长连接会话上的工具）
         :return: MultiServerMCPClient实例
         """
         try:
-            # 使用已有的配置
-            ha_mcp_endpoint = os.getenv("HA_MCP_ENDPOINT", "/mcp_server/sse")
-            
-            # 创建MCP客户端
-            client = MultiServerMCPClient(
-                {
-                    "homeassistant": {
-                        "transport": "sse",
-                        "url": f"{self.url}{ha_mcp_endpoint}",
-                        "headers": self.headers,
-                    }
-                }
-            )
-            
-            return client
+            # 创建MCP客户端（首次使用时才导入MCP适配器）
+            from langchain_mcp_adapters.client import MultiServerMCPClient
+            return MultiServerMCPClient(self._mcp_connections())
         except Exception as e:
             logger.error(f"创建MCP客户端失败: {str(e)}")
             return None
+
+    def get_mcp_sessions(self) -> MCPSessionManager:
+        """
+        获取MCP会话管理器，首次调用时创建
+        """
+        with self._mcp_sessions_lock:
+            if self._mcp_sessions is None:
+                self._mcp_sessions = MCPSessionManager(
+                    self._mcp_connections(),
+                    tool_ttl=float(os.getenv("HA_MCP_TOOLS_TTL", "300")),
+                    ping_interval=float(os.getenv("HA_MCP_PING_INTERVAL", "30")),
+                    ready_timeout=float(os.getenv("HA_MCP_READY_TIMEOUT", "10")),
+                    tool_transform=self._prepare_mcp_tool
+                )
+            return self._mcp_sessions
     
     async def get_mcp_tools(self) -> Optional[List]:
         """
         获取MCP可用的工具
+        工具目录在长连接会话上加载并缓存，只在首次加载未完成时等待
         :return: 工具列表
         """
+        return (await self.get_mcp_tool_catalog())[1]
+
+    async def get_mcp_tool_catalog(self) -> Tuple[int, Optional[List]]:
+        """
+        获取MCP可用的工具及工具目录版本，工具重新加载后版本加一
+        :return: (工具目录版本, 工具列表)，获取失败时工具列表为None
+        """
+        sessions = self.get_mcp_sessions()
         try:
-            client = self.get_mcp_client()
-            if client:
-                tools = await client.get_tools()
-                return tools
-            return None
+            return await sessions.get_catalog()
         except Exception as e:
             logger.error(f"获取MCP工具失败: {str(e)}")
-            return None
+            return sessions.version, None
+
+    def _prepare_mcp_tool(self, server_name: str, tool):
+        """
+        联邦模式下工具名称加上实例名前缀，避免不同实例的同名工具冲突
+        """
+        if self.federated:
+            name = server_name[len("homeassistant_"):]
+            tool.name = f"{name}_{tool.name}"
+            tool.description = f"[{name}] {tool.description}"
+        return tool
+
+    def _mcp_server_name(self, instance: HomeAssistantInstance) -> str:
+        return f"homeassistant_{instance.name}" if self.federated else "homeassistant"
     
+    def call_home_assistant_service(self, entity_id: str, service: str) -> str:
+        """
+        调用Home Assistant服务
+        :param entity_id: 实体ID
+        :param service: 服务名称（turn_on/turn_off等）
+        :return: 执行结果
+        """
+        instance = self.resolve_instance(entity_id)
+        if instance is None:
+            return f"无效的实体ID: {entity_id}"
+        satisfied = self._satisfied_result(entity_id, service)
+        if satisfied is not None:
+            return satisfied
+        result = call_service(instance.url, instance.headers, instance.local_entity_id(entity_id), service)
+        self._after_service_calls({entity_id: result}, service)
+        return result
+
+    async def async_call_home_assistant_service(self, entity_id: str, service: str) -> str:
+        """
+        异步调用Home Assistant服务，不阻塞调用方的事件循环
+        :param entity_id: 实体ID
+        :param service: 服务名称（turn_on/turn_off等）
+        :return: 执行结果
+        """
+        instance = self.resolve_instance(entity_id)
+        if instance is None:
+            return f"无效的实体ID: {entity_id}"
+        satisfied = self._satisfied_result(entity_id, service)
+        if satisfied is not None:
+            return satisfied
+        result = await async_call_service(instance.url, instance.headers, instance.local_entity_id(entity_id), service)
+        # 乐观更新需要获取快照锁，在线程中执行，不阻塞调用方的事件循环
+        await asyncio.to_thread(self._after_service_calls, {entity_id: result}, service)
+        return result
+
+    def call_home_assistant_services(self, entity_ids: List[str], service: str) -> Dict[str, str]:
+        """
+        对多个实体调用同一服务，已处于目标状态的实体被跳过，其余实体每个实例的同类实体合并为一次请求，各实例并发调用
+        :param entity_ids: 实体ID列表
+        :param service: 服务名称（turn_on/turn_off等）
+        :return: 实体ID -> 执行结果，顺序与entity_ids一致
+        """
+        try:
+            results = get_ha_transport().run_sync(self._call_services(entity_ids, service))
+        except Exception as e:
+            return {entity_id: f"执行异常: {str(e)}" for entity_id in entity_ids}
+        self._after_service_calls(results, service)
+        return results
+
+    async def async_call_home_assistant_services(self, entity_ids: List[str], service: str) -> Dict[str, str]:
+        """
+        异步对多个实体调用同一服务
+        参数同call_home_assistant_services
+        """
+        results = await self._call_services(entity_ids, service)
+        await asyncio.to_thread(self._after_service_calls, results, service)
+        return results
+
+    async def _call_services(self, entity_ids: List[str], service: str) -> Dict[str, str]:
+        """
+        跳过已处于目标状态的实体，其余实体按实例分组并发调用（不做乐观更新，可在传输线程中运行）
+        """
+        results = {}
+        by_instance: Dict[str, List[str]] = {}
+        for entity_id in dict.fromkeys(entity_ids):
+            instance = self.resolve_instance(entity_id)
+            if instance is None:
+                results[entity_id] = f"无效的实体ID: {entity_id}"
+                continue
+            satisfied = self._satisfied_result(entity_id, service)
+            if satisfied is not None:
+                results[entity_id] = satisfied
+            else:
+                by_instance.setdefault(instance.name, []).append(entity_id)
+        if not by_instance:
+            return {entity_id: results[entity_id] for entity_id in entity_ids}
+
+        async def call_instance(instance: HomeAssistantInstance, instance_entity_ids: List[str]) -> Dict[str, str]:
+            local_ids = [instance.local_entity_id(entity_id) for entity_id in instance_entity_ids]
+            local_results = await async_call_services(instance.url, instance.headers, local_ids, service)
+            return {entity_id: local_results[local_id] for entity_id, local_id in zip(instance_entity_ids, local_ids)}
+
+        for instance_results in await asyncio.gather(*(
+            call_instance(self.instances[name], instance_entity_ids) for name, instance_entity_ids in by_instance.items()
+        )):
+            results.update(instance_results)
+        return {entity_id: results[entity_id] for entity_id in entity_ids}
+
+    def _after_service_calls(self, results: Dict[str, str], service: str):
+        """
+        服务调用成功后，将受影响的实体乐观更新为目标状态，并安排与权威状态校正；
+        刷新开销与受影响的实体数量而非实体总数成正比
+        :param results: 实体ID -> 执行结果
+        :param service: 服务名称
+        """
+        succeeded = [entity_id for entity_id, result in results.items() if result.startswith("成功执行")]
+        if not succeeded:
+            return
+        target_state = SERVICE_TARGET_STATES.get(service)
+        if target_state is not None:
+            updated = datetime.now(timezone.utc).isoformat()
+            optimistic = []
+            for entity_id in succeeded:
+                record = self.entity_index.get(entity_id)
+                if record is not None and record.state != target_state:
+                    optimistic.append({"entity_id": entity_id, "state": target_state, "last_updated": updated,
+                                       "attributes": record.attributes})
+            self._apply_entity_patch(optimistic)
+        # 所有受影响的实体都在延迟后校正：设备未响应或拒绝变化时不会有state_changed，乐观状态必须回退
+        timer = threading.Timer(self.reconcile_delay, self._reconcile_entities, args=(succeeded,))
+        timer.daemon = True
+        timer.start()
+
+    def _reconcile_entities(self, entity_ids: List[str]):
+        """
+        读取给定实体的权威状态，校正乐观更新的结果：
+        实例的实体存储在线时直接读取存储中的状态（与乐观状态不一致时即回退），
+        否则并发拉取（GET /api/states/<entity_id>）
+        """
+        states = []
+        to_fetch = []
+        for entity_id in entity_ids:
+            instance = self.resolve_instance(entity_id)
+            state = instance.live_entity(entity_id) if instance is not None else None
+            if state is not None:
+                states.append(state)
+            elif instance is not None:
+                to_fetch.append(entity_id)
+
+        async def fetch_all():
+            return await asyncio.gather(*(
+                self.resolve_instance(entity_id).async_fetch_state(entity_id) for entity_id in to_fetch
+            ))
+
+        if to_fetch:
+            try:
+                states.extend(get_ha_transport().run_sync(fetch_all()))
+            except Exception as e:
+                logger.warning(f"校正实体状态失败: {str(e)}")
+        self._apply_entity_patch([state for state in states if state is not None])
+
+    def _apply_entity_patch(self, entities: List[Dict[str, Any]]):
+        """
+        在快照缓存的加载锁内把给定实体的新状态合并进当前分类结果，只处理这些实体
+        :param entities: 实体原始状态
+        """
+        if not entities:
+            return
+
+        def apply(entity_data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            if not entity_data:
+                return None
+            sensor_data, non_sensor_data = self.entity_classifier.patch(entities)
+            if self.entity_classifier.changed_count == 0:
+                return entity_data
+            with self._summary_lock:
+                if self._dirty_summary_domains is not None:
+                    self._dirty_summary_domains |= self.entity_classifier.changed_domains
+            self.entity_data = {
+                "sensor_data": sensor_data,
+                "non_sensor_data": non_sensor_data
+            }
+            return self.entity_data
+
+        self.snapshot_cache.update(apply)
+
+    def current_state(self, entity_id: str) -> Optional[str]:
+        """
+        获取实体的当前状态，可信时才返回：
+        实例的实体存储在线时读取最新状态；否则只在快照处于陈旧度预算内时读取快照中的状态
+        :param entity_id: 实体ID
+        :return: 状态值，实体不存在或当前状态不可信时返回None
+        """
+        instance = self.resolve_instance(entity_id)
+        if instance is not None and instance.is_live:
+            return instance.live_state(entity_id)
+        if not self.snapshot_cache.is_fresh():
+            return None
+        record = self.entity_index.get(entity_id)
+        return record.get("state") if record is not None else None
+
+    def _satisfied_result(self, entity_id: str, service: str) -> Optional[str]:
+        """
+        服务调用不会改变实体状态时（如对已打开的灯调用turn_on），记录一次跳过并返回"已满足"结果
+        :return: "已满足"结果，需要调用服务时返回None
+        """
+        target_state = SERVICE_TARGET_STATES.get(service)
+        if target_state is None or self.current_state(entity_id) != target_state:
+            return None
+        with self._elided_lock:
+            self.elided_service_calls += 1
+        return f"已满足: {entity_id} 已处于 {target_state} 状态，无需执行 {service}"
+
+    def resolve_instance(self, entity_id: str) -> Optional[HomeAssistantInstance]:
+        """
+        根据实体ID的命名空间找到所属实例
+        :param entity_id: 实体ID，联邦模式下格式为"实例名:domain.object_id"
+        :return: 所属实例；联邦模式下实体ID未带命名空间或实例不存在时返回None
+        """
+        instance_name, _ = split_entity_id(entity_id)
+        if not self.federated:
+            return next(iter(self.instances.values())) if instance_name is None else None
+        if instance_name is None:
+            return None
+        return self.instances.get(instance_name)
+
     def get_and_classify_entities(self) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, List[Dict[str, Any]]]]]:
         """
         获取Home Assistant中所有实体，并进行分类
+        实体存储在线时直接读取内存中的最新状态，否则通过REST API流式拉取，边解析边分类；
+        联邦模式下各实例并发拉取，按完成顺序逐个分类
         :return: (sensor实体分类结果, 非sensor实体分类结果)
         """
-        # 调用API获取所有实体
-        all_entities_url = f"{self.url}/api/states"
+        if self.federated:
+            return self._get_and_classify_federated()
+
+        instance = next(iter(self.instances.values()))
+        all_entities = instance.load_states()
+        if all_entities is None:
+            return None, None
         try:
-            response = requests.get(all_entities_url, headers=self.headers, timeout=15)
-            if response.status_code == 401:
-                logger.error("获取实体失败！状态码：401，原因：未授权访问")
-                logger.error("\n可能的解决方案：")
-                logger.error("1. 检查访问令牌是否正确 - 令牌格式应为以Bearer开头的长字符串")
-                logger.error("2. 生成新的长生命周期访问令牌")
-                return None, None
-            elif response.status_code != 200:
-                logger.error(f"获取实体失败！状态码：{response.status_code}，原因：{response.text}")
-                return None, None
-            all_entities = response.json()
-        except requests.exceptions.ConnectionError:
-            logger.error("连接异常！无法连接到Home Assistant服务器")
+            return self.classify_entities(all_entities)
+        except httpx.HTTPError as e:
+            logger.error(f"读取实体状态异常！原因：{str(e)}")
             return None, None
-        except Exception as e:
-            logger.error(f"请求异常！原因：{str(e)}")
+        except ValueError as e:
+            logger.error(f"解析实体状态失败！原因：{str(e)}")
             return None, None
 
-        # 分离sensor和非sensor实体
-        sensor_entities = [entity for entity in all_entities if entity["entity_id"].startswith("sensor.")]
-        non_sensor_entities = [entity for entity in all_entities if not entity["entity_id"].startswith("sensor.")]
-        
-        # 处理sensor实体
-        valid_sensors = []  # 存储状态有效的传感器
-        invalid_sensors = []  # 存储状态无效的传感器
-
-        for sensor in sensor_entities:
-            sensor_state = sensor["state"].strip().lower()
-            # 排除状态为"unknown"（未知）、"unavailable"（不可用）的传感器
-            if sensor_state in ["unknown", "unavailable", "none"]:
-                invalid_sensors.append({
-                    "entity_id": sensor["entity_id"],
-                    "friendly_name": sensor["attributes"].get("friendly_name", "未命名"),
-                    "state": sensor["state"],
-                    "last_updated": sensor["last_updated"][:19].replace("T", " ")
-                })
-            else:
-                # 提取传感器关键信息
-                valid_sensor_info = {
-                    "entity_id": sensor["entity_id"],
-                    "friendly_name": sensor["attributes"].get("friendly_name", "未命名"),
-                    "state": sensor["state"],
-                    "unit": sensor["attributes"].get("unit_of_measurement", "无单位"),
-                    "unit_of_measurement": sensor["attributes"].get("unit_of_measurement", ""),
-                    "last_updated": sensor["last_updated"][:19].replace("T", " "),
-                    "external_attributes": {k: v for k, v in sensor["attributes"].items() if k not in ["friendly_name", "unit_of_measurement"]}
-                }
-                valid_sensors.append(valid_sensor_info)
-
-        # 对有效传感器按"数值型"和"文本型"分类
-        numeric_sensors = []  # 数值型传感器
-        text_sensors = []     # 文本型传感器
-        
-        for sensor in valid_sensors:
-            sensor_state = sensor["state"].strip().lower()
-            # 检查是否为数值型
-            try:
-                # 处理特殊数值（如"25.5%""100W"需先提取数字）
-                clean_state = ''.join(filter(lambda c: c.isdigit() or c == '.', sensor_state))
-                float(clean_state)  # 尝试转换为浮点数
-                numeric_sensors.append(sensor)
-            except (ValueError, TypeError):
-                # 其他为文本型
-                text_sensors.append(sensor)
-
-        # 按实体名称分组
-        numeric_sensors_by_group = self.group_entities_by_name(numeric_sensors)
-        text_sensors_by_group = self.group_entities_by_name(text_sensors)
-        invalid_sensors_by_group = self.group_entities_by_name(invalid_sensors)
-
-        # 处理非sensor实体
-        non_sensor_entities_by_type = {}
-        for entity in non_sensor_entities:
-            try:
-                # 提取实体类型
-                entity_type = entity["entity_id"].split(".")[0]
-                
-                # 提取实体关键信息
-                entity_info = {
-                    "entity_id": entity["entity_id"],
-                    "friendly_name": entity["attributes"].get("friendly_name", "未命名"),
-                    "state": entity["state"],
-                    "last_updated": entity["last_updated"][:19].replace("T", " ")
-                }
-                
-                # 为特定实体类型添加额外信息
-                if entity_type == "light":
-                    attributes = entity.get("attributes", {})
-                    entity_info["external_attributes"] = attributes
-                elif entity_type == "event":
-                    attributes = entity.get("attributes", {})
-                    entity_info["external_attributes"] = attributes
-                    entity_info["event_type"] = attributes.get("event_type", "未知")
-                
-                # 按类型分组
-                if entity_type not in non_sensor_entities_by_type:
-                    non_sensor_entities_by_type[entity_type] = []
-                non_sensor_entities_by_type[entity_type].append(entity_info)
-            except Exception as e:
-                # 忽略单个实体处理错误
-                logger.warning(f"处理实体 {entity.get('entity_id', '未知')} 时出错: {str(e)}")
-                continue
+    def _get_and_classify_federated(self) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, List[Dict[str, Any]]]]]:
+        """
+        并发拉取所有实例的实体，总耗时取决于最慢的实例而非各实例之和；
+        网络读取和JSON解析在工作线程中进行，分类在当前线程按完成顺序进行，共享的索引只由一个线程修改；
+        拉取失败的实例保留上一次的实体
+        :return: (sensor实体分类结果, 非sensor实体分类结果)，所有实例都拉取失败时返回(None, None)
+        """
+        classifier = self.entity_classifier
+        failed = []
+        with ThreadPoolExecutor(max_workers=len(self.instances), thread_name_prefix="ha-fetch") as pool:
+            futures = {pool.submit(instance.load_states_list): instance for instance in self.instances.values()}
+            classifier.begin()
+            for future in as_completed(futures):
+                instance = futures[future]
+                try:
+                    states = future.result()
+                except Exception as e:
+                    logger.error(f"[{instance.name}] 拉取实体异常！原因：{str(e)}")
+                    states = None
+                if states is None:
+                    failed.append(instance.name)
+                    classifier.retain(instance.prefix)
+                    continue
+                for entity in states:
+                    classifier.feed(entity)
+        sensor_data, non_sensor_data = classifier.finish()
+        if len(failed) == len(self.instances):
+            return None, None
+        if failed:
+            logger.warning(f"以下实例拉取失败，沿用上一次的实体数据: {', '.join(failed)}")
+        return sensor_data, non_sensor_data
 
-        # 构建返回结果
-        sensor_result = {
-            "numeric_sensors": numeric_sensors,
-            "text_sensors": text_sensors,
-            "invalid_sensors": invalid_sensors,
-            "numeric_sensors_by_group": numeric_sensors_by_group,
-            "text_sensors_by_group": text_sensors_by_group,
-            "invalid_sensors_by_group": invalid_sensors_by_group
-        }
-        
-        return sensor_result, non_sensor_entities_by_type
+    def classify_entities(self, all_entities: Iterable[Dict[str, Any]], incremental: bool = True) -> Tuple[Dict[str, Any], Dict[str, List[Dict[str, Any]]]]:
+        """
+        对实体原始状态进行分类
+        增量模式下只重新处理entity_id + last_updated发生变化的实体，并原地修补分类结果
+        :param all_entities: 实体原始状态列表或迭代器，迭代器中的实体会在到达时逐个分类
+        :param incremental: 是否增量分类，False时全量重建
+        :return: (sensor实体分类结果, 非sensor实体分类结果)
+        """
+        return self.entity_classifier.classify(all_entities, incremental=incremental)
     
-    def get_current_entity_summary(self):
+    def get_current_entity_summary(self) -> str:
         """
         获取当前实体摘要信息
+        摘要在首次读取时生成并按快照版本缓存，快照变化后只重建发生变化的实体类型对应的片段
         :return: 当前实体摘要字符串
         """
-        return self.current_entity_summary
-        
-    def update_entity_data(self) -> str:
+        with self._summary_lock:
+            version = self.snapshot_version
+            if self._summary_version != version:
+                self._summary = self._build_entity_summary()
+                self._summary_version = version
+            return self._summary
+
+    @property
+    def current_entity_summary(self) -> str:
+        """
+        当前实体摘要信息，同get_current_entity_summary
+        """
+        return self.get_current_entity_summary()
+
+    @property
+    def snapshot_version(self) -> int:
+        """
+        当前实体快照的版本号，每次数据实际发生变化时递增
+        """
+        return self.snapshot_cache.version
+
+    def _is_store_unchanged(self) -> bool:
+        """
+        任一实例的实体存储在线且自上次分类以来发生变化，则视为快照失效
+        """
+        return all(instance.is_store_current() for instance in self.instances.values() if instance.is_live)
+
+    def update_entity_data(self, force: bool = False, max_staleness: Optional[float] = None) -> str:
         """
         更新实体数据
-        :return: 实体摘要信息
+        快照在陈旧度预算内时直接复用，并发调用只会触发一次拉取；
+        后台刷新任务运行或启动时正在后台重新验证磁盘快照时，非强制调用不再拉取，直接使用当前快照
+        :param force: 是否忽略陈旧度强制刷新
+        :param max_staleness: 本次调用可接受的最大陈旧度（秒），默认使用HA_SNAPSHOT_MAX_STALENESS
+        :return: 当前快照版本号；实体摘要不在刷新时生成，需要时通过get_current_entity_summary读取
+        """
+        if not force and (self._revalidating.is_set() or self.background_refresher is not None
+                          and self.background_refresher.is_running and self.snapshot_version > 0):
+            return self.snapshot_version
+        self._refresh_snapshot(force=force, max_staleness=max_staleness)
+        return self.snapshot_version
+
+    def invalidate_entity_data(self):
+        """
+        标记实体数据已过期，下一次update_entity_data时重新拉取
+        """
+        self.snapshot_cache.invalidate()
+
+    def _load_entity_snapshot(self) -> Optional[Dict[str, Any]]:
         """
+        拉取并分类实体数据，记录发生变化的实体类型（摘要在读取时才生成）
+        :return: 新的实体数据；数据未变化时返回当前实体数据；拉取失败时返回None
+        """
+        # 所有实例的实体存储都在线且自上次分类以来没有变化时，直接复用现有数据
+        if self.entity_data and all(instance.is_store_current() for instance in self.instances.values()):
+            return self.entity_data
+
         logger.info("正在更新Home Assistant实体数据...")
         sensor_data, non_sensor_data = self.get_and_classify_entities()
         
+        # 增量分类没有发现任何变化时，沿用现有数据和摘要
+        if sensor_data is not None and self.entity_data.get("sensor_data") is sensor_data \
+                and self.entity_classifier.changed_count == 0:
+            logger.info("实体数据无变化")
+            return self.entity_data
+        
         # 存储实体数据
         self.entity_data = {
             "sensor_data": sensor_data,
             "non_sensor_data": non_sensor_data
         }
         
+        with self._summary_lock:
+            if sensor_data is None and non_sensor_data is None:
+                # 拉取失败时实体数据被清空，摘要需全部重建
+                self._dirty_summary_domains = None
+                self._summary_version = None
+            elif self._dirty_summary_domains is not None:
+                self._dirty_summary_domains |= self.entity_classifier.changed_domains
+        
+        logger.info(f"实体数据更新完成, 变化 {self.entity_classifier.changed_count} 个实体")
+        if sensor_data is None and non_sensor_data is None:
+            return None
+        return self.entity_data
+
+    def _build_entity_summary(self) -> str:
+        """
+        生成实体摘要，未发生变化的实体类型直接复用上次生成的片段
+        """
+        sensor_data = self.entity_data.get("sensor_data")
+        non_sensor_data = self.entity_data.get("non_sensor_data")
+        dirty, self._dirty_summary_domains = self._dirty_summary_domains, set()
+        sections = self._summary_sections
+        if dirty is None:
+            sections.clear()
+        else:
+            for domain in dirty:
+                sections.pop(domain, None)
+
         # 准备实体摘要信息
         entity_summary = []
         
         # 添加传感器摘要
         if sensor_data:
-            entity_summary.append("## 传感器信息")
-            entity_summary.append(f"- 数值型传感器数量: {len(sensor_data.get('numeric_sensors', []))}")
-            entity_summary.append(f"- 文本型传感器数量: {len(sensor_data.get('text_sensors', []))}")
-            entity_summary.append(f"- 无效传感器数量: {len(sensor_data.get('invalid_sensors', []))}")
-            
-            # 添加关键数值型传感器示例
-            numeric_groups = sensor_data.get('numeric_sensors_by_group', {})
-            if numeric_groups:
-                entity_summary.append("\n### 数值型传感器分组示例:")
-                for group_name, sensors in list(numeric_groups.items())[:3]:
-                    entity_summary.append(f"- 分组'{group_name}': {len(sensors)}个传感器")
-                    for sensor in sensors[:2]:
-                        entity_summary.append(f"  - {sensor['friendly_name']} (当前值: {sensor['state']}{sensor.get('unit', '')})")
+            if "sensor" not in sections:
+                sections["sensor"] = self._summarize_sensors(sensor_data)
+            entity_summary.extend(sections["sensor"])
         
         # 添加非传感器实体摘要
         if non_sensor_data:
@@ -311,20 +713,47 @@ class HomeAssistantManager:
             entity_summary.extend(entity_types)
             
             # 添加关键实体类型的详细信息
-            for key_type in ['light', 'switch', 'binary_sensor']:
+            for key_type in SUMMARY_DETAIL_DOMAINS:
                 if key_type in non_sensor_data:
-                    entities = non_sensor_data[key_type]
-                    entity_summary.append(f"\n### {key_type}实体示例:")
-                    # 对实体按名称分组
-                    grouped = self.group_entities_by_name(entities)
-                    for group_name, group_entities in list(grouped.items())[:2]:
-                        entity_summary.append(f"- 分组'{group_name}': {len(group_entities)}个实体")
-                        for entity in group_entities[:3]:
-                            entity_summary.append(f"  - {entity.get('friendly_name', entity.get('entity_id', '未知'))} (状态: {entity.get('state', '未知')})")
+                    if key_type not in sections:
+                        sections[key_type] = self._summarize_domain(key_type)
+                    entity_summary.extend(sections[key_type])
+        
+        return "\n".join(entity_summary)
+
+    @staticmethod
+    def _summarize_sensors(sensor_data: Dict[str, Any]) -> List[str]:
+        """
+        生成传感器部分的摘要
+        """
+        entity_summary = ["## 传感器信息"]
+        entity_summary.append(f"- 数值型传感器数量: {len(sensor_data.get('numeric_sensors', []))}")
+        entity_summary.append(f"- 文本型传感器数量: {len(sensor_data.get('text_sensors', []))}")
+        entity_summary.append(f"- 无效传感器数量: {len(sensor_data.get('invalid_sensors', []))}")
         
-        self.current_entity_summary = "\n".join(entity_summary)
-        logger.info(f"实体数据更新完成, 总共 {len(entity_summary)} 条信息")
-        return self.current_entity_summary
+        # 添加关键数值型传感器示例（基于数值型传感器列式表）
+        numeric_table = sensor_data.get('numeric_table')
+        numeric_samples = numeric_table.group_samples() if numeric_table is not None else []
+        if numeric_samples:
+            entity_summary.append("\n### 数值型传感器分组示例:")
+            for sample in numeric_samples:
+                entity_summary.append(f"- 分组'{sample['group']}': {sample['count']}个传感器")
+                for row in sample["samples"].itertuples():
+                    entity_summary.append(f"  - {row.friendly_name} (当前值: {row.state}{row.unit})")
+        return entity_summary
+
+    def _summarize_domain(self, key_type: str) -> List[str]:
+        """
+        生成单个实体类型的分组示例摘要
+        """
+        entity_summary = [f"\n### {key_type}实体示例:"]
+        # 使用实体索引中维护的分组
+        grouped = self.entity_index.get_domain_groups(key_type)
+        for group_name, group_entities in list(grouped.items())[:2]:
+            entity_summary.append(f"- 分组'{group_name}': {len(group_entities)}个实体")
+            for entity in group_entities[:3]:
+                entity_summary.append(f"  - {entity.get('friendly_name', entity.get('entity_id', '未知'))} (状态: {entity.get('state', '未知')})")
+        return entity_summary
     
     def export_to_excel(self, sensor_data: Dict[str, Any], non_sensor_data: Dict[str, List[Dict[str, Any]]]) -> Optional[str]:
         """
@@ -351,19 +780,21 @@ class HomeAssistantManager:
                 all_entity_data = []
                 
                 # 处理sensor类型实体
-                # 数值型传感器（已分组）
-                for group_name, sensors in sensor_data.get("numeric_sensors_by_group", {}).items():
-                    for sensor in sensors:
-                        all_entity_data.append({
-                            "分组": group_name,
-                            "实体类型": "sensor",
-                            "子类型": "数值型",
-                            "实体ID": sensor["entity_id"],
-                            "友好名称": sensor["friendly_name"],
-                            "状态值": sensor["state"],
-                            "单位": sensor.get("unit", "无单位"),
-                            "最后更新时间": sensor["last_updated"]
-                        })
+                # 数值型传感器直接由列式表向量化生成
+                numeric_table = sensor_data.get("numeric_table")
+                numeric_frame = numeric_table.sorted_frame if numeric_table is not None else None
+                df_numeric = None
+                if numeric_frame is not None and not numeric_frame.empty:
+                    df_numeric = pd.DataFrame({
+                        "分组": numeric_frame["group"].to_numpy(),
+                        "实体类型": "sensor",
+                        "子类型": "数值型",
+                        "实体ID": numeric_frame.index.to_numpy(),
+                        "友好名称": numeric_frame["friendly_name"].to_numpy(),
+                        "状态值": numeric_frame["value"].to_numpy(),
+                        "单位": numeric_frame["unit"].replace("", "无单位").to_numpy(),
+                        "最后更新时间": numeric_frame["last_updated"].dt.strftime("%Y-%m-%d %H:%M:%S").fillna("未知").to_numpy()
+                    })
 
                 # 文本型传感器（已分组）
                 for group_name, sensors in sensor_data.get("text_sensors_by_group", {}).items():
@@ -432,8 +863,10 @@ class HomeAssistantManager:
                             all_entity_data.append(entity_row)
                 
                 # 创建实体分类工作表并按分组排序
-                if all_entity_data:
-                    df_entities = pd.DataFrame(all_entity_data)
+                frames = [frame for frame in (df_numeric, pd.DataFrame(all_entity_data) if all_entity_data else None)
+                          if frame is not None]
+                if frames:
+                    df_entities = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
                     df_entities = df_entities.sort_values(by=["分组", "实体类型"])
                     df_entities.to_excel(writer, sheet_name="实体分类", index=False)
                     
@@ -450,10 +883,33 @@ class HomeAssistantManager:
                                 pass
                         adjusted_width = min(max_length + 2, 50)
                         worksheet.column_dimensions[column_letter].width = adjusted_width
+
+                # 2. 数值传感器统计工作表（按分组和单位聚合）
+                if numeric_table is not None and len(numeric_table):
+                    df_stats = numeric_table.group_stats().rename(columns={
+                        "group": "分组", "unit": "单位", "count": "数量",
+                        "mean": "平均值", "min": "最小值", "max": "最大值"
+                    })
+                    df_stats["单位"] = df_stats["单位"].replace("", "无单位")
+                    df_stats.to_excel(writer, sheet_name="数值传感器统计", index=False)
             return file_path
         except Exception as e:
             logger.error(f"导出Excel失败: {str(e)}")
             return None
 
-# 创建全局的HomeAssistantManager实例
-hass_manager = HomeAssistantManager()
+# 全局的HomeAssistantManager实例，首次使用时创建（创建时加载实体数据）
+_hass_manager = LazySingleton(HomeAssistantManager, "hass_manager")
+
+
+def get_hass_manager() -> HomeAssistantManager:
+    """
+    获取全局HomeAssistantManager实例，首次调用时创建
+    """
+    return _hass_manager.get()
+
+
+def __getattr__(name: str):
+    # 兼容 from ... import hass_manager 的旧用法，访问时才创建实例
+    if name == "hass_manager":
+        return get_hass_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
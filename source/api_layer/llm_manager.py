@@ -1,8 +1,9 @@
 import os
-from typing import List, Dict, Any, Optional
-from langchain_openai import ChatOpenAI
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from source.base_layer.utils import logger
+# 导入延迟单例
+from source.base_layer.lazy_singleton import LazySingleton
 
 class LLMManager:
     """
@@ -21,12 +22,16 @@ class LLMManager:
         
         # 初始化ChatOpenAI模型
         self.llm = self._initialize_chat_model()
+        # 其他生成参数(temperature, max_tokens)的模型实例，不替换对话和智能体共享的模型
+        self._models: Dict[Tuple[float, int], Any] = {}
         
     def _initialize_chat_model(self):
         """
         初始化ChatOpenAI模型实例
         """
         try:
+            # 创建模型时才导入langchain_openai（导入开销较大）
+            from langchain_openai import ChatOpenAI
             chat_model = ChatOpenAI(
                 model=self.model_name,
                 api_key=self.api_key,
@@ -73,23 +78,28 @@ class LLMManager:
                 elif role == "assistant":
                     langchain_messages.append(AIMessage(content=content))
             
-            # 如果没有初始化llm或需要重新配置temperature和max_tokens
-            if not self.llm or self.llm.temperature != temperature or self.llm.max_tokens != max_tokens:
-                try:
-                    self.llm = ChatOpenAI(
-                        model=self.model_name,
-                        api_key=self.api_key,
-                        base_url=self.api_base,
-                        temperature=temperature,
-                        max_tokens=max_tokens
-                    )
-                    logger.info(f"重新初始化ChatOpenAI模型，temperature={temperature}, max_tokens={max_tokens}")
-                except Exception as e:
-                    logger.error(f"重新初始化ChatOpenAI模型失败: {str(e)}")
-                    return f"重新初始化模型失败: {str(e)}"
+            # 生成参数与共享模型不同时使用对应参数的模型实例
+            llm = self.llm
+            if not llm or llm.temperature != temperature or llm.max_tokens != max_tokens:
+                llm = self._models.get((temperature, max_tokens))
+                if llm is None:
+                    try:
+                        from langchain_openai import ChatOpenAI
+                        llm = ChatOpenAI(
+                            model=self.model_name,
+                            api_key=self.api_key,
+                            base_url=self.api_base,
+                            temperature=temperature,
+                            max_tokens=max_tokens
+                        )
+                        self._models[(temperature, max_tokens)] = llm
+                        logger.info(f"初始化ChatOpenAI模型，temperature={temperature}, max_tokens={max_tokens}")
+                    except Exception as e:
+                        logger.error(f"初始化ChatOpenAI模型失败: {str(e)}")
+                        return f"初始化模型失败: {str(e)}"
             
             # 调用模型
-            response = self.llm.invoke(langchain_messages)
+            response = llm.invoke(langchain_messages)
             
             # 返回生成的内容
             return response.content
@@ -139,6 +149,19 @@ class LLMManager:
         
         return self.call_openai_api(messages, temperature=0.3)
 
-# 创建全局实例供其他模块使用
-llm_manager = LLMManager()
-logger.info("全局实例 llm_manager 已创建")
\ No newline at end of file
+# 全局实例供其他模块使用，首次使用时创建
+_llm_manager = LazySingleton(LLMManager, "llm_manager")
+
+
+def get_llm_manager() -> LLMManager:
+    """
+    获取全局LLMManager实例，首次调用时创建
+    """
+    return _llm_manager.get()
+
+
+def __getattr__(name: str):
+    # 兼容 from ... import llm_manager 的旧用法，访问时才创建实例
+    if name == "llm_manager":
+        return get_llm_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,256 @@
+import json
+import time
+import atexit
+import asyncio
+import threading
+from typing import Dict, List, Any, Optional, Callable, Tuple
+# 导入日志记录器
+from source.base_layer.utils import logger
+
+# MCP服务通知工具列表变化的方法名
+TOOLS_LIST_CHANGED = "notifications/tools/list_changed"
+
+
+class MCPSessionManager:
+    """
+    MCP会话管理器
+    在独立的事件循环线程中为每个MCP服务保持一个长连接会话（SSE），断线后按指数退避重连；
+    工具目录在会话建立后加载一次并缓存，只在服务端通知工具列表变化或缓存超过有效期时重新加载，
+    获取工具直接返回缓存，处理消息时不再建立连接和列出工具；
+    重新加载或重连后工具的名称、描述和参数都未变化时沿用原工具对象，版本号不变，
+    工具调用在执行时才转到当前会话，会话断开期间调用直接失败
+    """
+
+    def __init__(self, connections: Dict[str, Dict[str, Any]], tool_ttl: float = 300, ping_interval: float = 30,
+                 ready_timeout: float = 10, tool_transform: Optional[Callable[[str, Any], Any]] = None):
+        """
+        初始化会话管理器
+        :param connections: MCP服务名称 -> 连接配置
+        :param tool_ttl: 工具目录有效期（秒），过期后在后台重新加载
+        :param ping_interval: 空闲时检测连接是否存活的间隔（秒）
+        :param ready_timeout: 首次获取工具时等待工具目录加载的最长时间（秒）
+        :param tool_transform: 加载工具后对每个工具的处理函数 (服务名称, 工具) -> 工具
+        """
+        # 通过消息处理函数接收服务端的工具列表变化通知
+        self.connections = {
+            name: dict(connection, session_kwargs=dict(connection.get("session_kwargs") or {},
+                                                       message_handler=self._message_handler(name)))
+            for name, connection in connections.items()
+        }
+        self.tool_ttl = tool_ttl
+        self.ping_interval = ping_interval
+        self.ready_timeout = ready_timeout
+        self.tool_transform = tool_transform
+        # 服务名称 -> 缓存的工具目录
+        self._tools: Dict[str, List[Any]] = {}
+        # 服务名称 -> 缓存的工具目录签名（名称、描述和参数）
+        self._signatures: Dict[str, List[Tuple[str, str, str]]] = {}
+        # 服务名称 -> 工具名称 -> 当前会话上的调用函数，会话断开时移除
+        self._calls: Dict[str, Dict[str, Callable]] = {}
+        self._tools_lock = threading.Lock()
+        # 工具目录版本，工具目录内容变化时加一，供调用方缓存基于工具构建的对象（如智能体）
+        self.version = 0
+        # 所有服务都完成过一次加载（无论成功与否）后置位
+        self._ready = threading.Event()
+        self._attempted: set = set()
+        # 服务名称 -> 工具目录需要重新加载（只在会话线程中使用）
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._main_task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        在后台线程中建立所有MCP会话并加载工具目录
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            if self._thread is None:
+                atexit.register(self.stop)
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="ha-mcp-session", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        关闭所有MCP会话并停止后台线程
+        """
+        self._stopped.set()
+        loop, task = self._loop, self._main_task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    @property
+    def tools(self) -> List[Any]:
+        """
+        当前缓存的全部工具
+        """
+        with self._tools_lock:
+            return self._all_tools()
+
+    def _all_tools(self) -> List[Any]:
+        return [tool for name in self.connections for tool in self._tools.get(name, ())]
+
+    async def get_catalog(self) -> Tuple[int, Optional[List[Any]]]:
+        """
+        获取缓存的工具目录及其版本，只有首次加载尚未完成时才等待（最多ready_timeout秒）
+        :return: (工具目录版本, 工具列表)，没有任何服务加载成功时工具列表为None
+        """
+        self.start()
+        if not self._ready.is_set():
+            await asyncio.to_thread(self._ready.wait, self.ready_timeout)
+        with self._tools_lock:
+            return self.version, (self._all_tools() if self._tools else None)
+
+    async def get_tools(self) -> Optional[List[Any]]:
+        """
+        获取缓存的工具目录
+        :return: 工具列表，没有任何服务加载成功时返回None
+        """
+        return (await self.get_catalog())[1]
+
+    def _message_handler(self, name: str) -> Callable:
+        async def handle(message):
+            if getattr(getattr(message, "root", None), "method", None) == TOOLS_LIST_CHANGED:
+                logger.info(f"MCP服务 {name} 的工具列表已变化，重新加载工具目录")
+                self._changed[name].set()
+        return handle
+
+    def _run(self):
+        """
+        后台线程入口
+        """
+        try:
+            asyncio.run(self._serve_forever())
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop = None
+            self._main_task = None
+            self._ready.set()
+
+    async def _serve_forever(self):
+        try:
+            from langchain_mcp_adapters.client import MultiServerMCPClient
+        except ImportError as e:
+            logger.error(f"无法导入MCP适配器: {str(e)}")
+            return
+        self._loop = asyncio.get_running_loop()
+        self._main_task = asyncio.current_task()
+        if self._stopped.is_set():
+            return
+        self._changed = {name: asyncio.Event() for name in self.connections}
+        client = MultiServerMCPClient(self.connections)
+        await asyncio.gather(*(self._maintain(client, name) for name in self.connections))
+
+    async def _maintain(self, client, name: str):
+        """
+        保持单个MCP服务的会话，断线后按指数退避重连
+        """
+        delay = 1
+        while not self._stopped.is_set():
+            try:
+                async with client.session(name) as session:
+                    delay = 1
+                    await self._serve_session(name, session)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 会话内部的任务组异常只记录首个根本原因
+                while getattr(e, "exceptions", None):
+                    e = e.exceptions[0]
+                logger.warning(f"MCP服务 {name} 会话中断: {type(e).__name__}: {str(e)}，{delay}秒后重连")
+            finally:
+                # 缓存的工具不再指向已断开的会话，重连后重新绑定
+                with self._tools_lock:
+                    self._calls.pop(name, None)
+            self._mark_attempted(name)
+            if self._stopped.is_set():
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    async def _serve_session(self, name: str, session):
+        """
+        在一个会话上加载工具目录；收到变化通知或超过有效期时重新加载，空闲时定期ping检测连接
+        """
+        from langchain_mcp_adapters.tools import load_mcp_tools
+        changed = self._changed[name]
+        while True:
+            changed.clear()
+            tools = await load_mcp_tools(session, server_name=name)
+            self._set_tools(name, tools)
+            expires_at = time.monotonic() + self.tool_ttl
+            while not changed.is_set():
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=min(self.ping_interval, remaining))
+                except asyncio.TimeoutError:
+                    await asyncio.wait_for(session.send_ping(), timeout=self.ping_interval)
+
+    def _set_tools(self, name: str, tools: List[Any]):
+        """
+        缓存服务的工具目录并绑定到当前会话；目录内容未变化时沿用原工具对象，版本号不变
+        """
+        signature = self._catalog_signature(tools)
+        calls = {tool.name: tool.coroutine for tool in tools}
+        with self._tools_lock:
+            self._calls[name] = calls
+            changed = name not in self._tools or self._signatures.get(name) != signature
+            if changed:
+                prepared = []
+                for tool in tools:
+                    self._bind_to_session_loop(name, tool)
+                    if self.tool_transform is not None:
+                        tool = self.tool_transform(name, tool)
+                    prepared.append(tool)
+                self._tools[name] = prepared
+                self._signatures[name] = signature
+                self.version += 1
+        if changed:
+            logger.info(f"MCP服务 {name} 的工具目录已加载，共 {len(tools)} 个工具")
+        else:
+            logger.debug(f"MCP服务 {name} 的工具目录未变化")
+        self._mark_attempted(name)
+
+    @staticmethod
+    def _catalog_signature(tools: List[Any]) -> List[Tuple[str, str, str]]:
+        """
+        工具目录签名：每个工具的名称、描述和参数定义
+        """
+        return [(tool.name, tool.description or "", json.dumps(tool.args, sort_keys=True, ensure_ascii=False, default=str))
+                for tool in tools]
+
+    def _bind_to_session_loop(self, name: str, tool):
+        """
+        工具调用在执行时查找服务当前会话上的调用函数；
+        会话只能在创建它的事件循环中使用，调用方（智能体）在其他事件循环中调用工具时转发到会话线程
+        """
+        from langchain_core.tools import ToolException
+        tool_name = tool.name
+
+        async def call_in_session_loop(*args, **kwargs):
+            with self._tools_lock:
+                call = self._calls.get(name, {}).get(tool_name)
+            loop = self._loop
+            if call is None or loop is None:
+                raise ToolException(f"MCP服务 {name} 会话已断开，正在重连，请稍后再试")
+            if asyncio.get_running_loop() is loop:
+                return await call(*args, **kwargs)
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(call(*args, **kwargs), loop))
+
+        tool.coroutine = call_in_session_loop
+
+    def _mark_attempted(self, name: str):
+        self._attempted.add(name)
+        if len(self._attempted) >= len(self.connections):
+            self._ready.set()
@@ -1,7 +1,13 @@
 import os
-from typing import Optional, Dict, List, Any
-from memu import MemuClient
+import time
+import threading
+from typing import Optional, Dict, List, Any, Tuple, TYPE_CHECKING
 from source.base_layer.utils import logger
+# 导入延迟单例
+from source.base_layer.lazy_singleton import LazySingleton
+
+if TYPE_CHECKING:
+    from memu import MemuClient
 
 class MemoryManager:
     """
@@ -11,8 +17,16 @@ class MemoryManager:
     
     def __init__(self):
         self.memory = self._build_memory()
+        # 检索到的记忆信息缓存：(检索时间, 记忆信息)；超过有效期时在后台重新检索，期间继续使用缓存；
+        # 每轮对话都会记忆新消息，记忆不触发检索，MemU处理新消息后的内容在有效期到达时一并取回
+        self.retrieve_ttl = float(os.environ.get("MEMU_RETRIEVE_TTL", "300"))
+        self._retrieved: Optional[Tuple[float, str]] = None
+        self._retrieve_lock = threading.Lock()
+        self._refreshing = False
+        # 记忆信息版本，检索到的内容发生变化时加一
+        self.version = 0
     
-    def _build_memory(self) -> Optional[MemuClient]:
+    def _build_memory(self) -> Optional["MemuClient"]:
         """
         构建MemU记忆客户端
         """
@@ -20,6 +34,8 @@ class MemoryManager:
             return None
         
         try:
+            # 启用记忆功能时才导入MemU客户端
+            from memu import MemuClient
             memory_client = MemuClient(
                 base_url="https://api.memu.so",
                 api_key=os.environ.get("MEMU_API_KEY", "")
@@ -62,11 +78,50 @@ class MemoryManager:
     def retrieve_memory_info(self) -> str:
         """
         检索记忆信息（检索过程）
+        首次调用时同步检索，之后直接返回缓存；缓存超过MEMU_RETRIEVE_TTL时在后台重新检索
         :return: 格式化的记忆信息字符串
         """
         if self.memory is None:
             return ""
         
+        with self._retrieve_lock:
+            cached = self._retrieved
+            if cached is not None:
+                if time.monotonic() - cached[0] > self.retrieve_ttl and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_memory_info, name="memu-retrieve", daemon=True).start()
+                return cached[1]
+        retrieved_prompt = self._fetch_memory_info()
+        if retrieved_prompt is not None:
+            self._store_memory_info(retrieved_prompt)
+        return retrieved_prompt or ""
+
+    def _refresh_memory_info(self):
+        """
+        后台重新检索记忆信息，失败时继续使用缓存，下一个有效期后再重试
+        """
+        retrieved_prompt = None
+        try:
+            retrieved_prompt = self._fetch_memory_info()
+        finally:
+            if retrieved_prompt is not None:
+                self._store_memory_info(retrieved_prompt)
+            with self._retrieve_lock:
+                if retrieved_prompt is None:
+                    self._retrieved = (time.monotonic(), self._retrieved[1])
+                self._refreshing = False
+
+    def _store_memory_info(self, retrieved_prompt: str):
+        with self._retrieve_lock:
+            if self._retrieved is None or self._retrieved[1] != retrieved_prompt:
+                self.version += 1
+            self._retrieved = (time.monotonic(), retrieved_prompt)
+
+    def _fetch_memory_info(self) -> Optional[str]:
+        """
+        从MemU检索记忆信息
+        :return: 格式化的记忆信息字符串，检索失败时返回None
+        """
         try:
             retrieved_prompt = ""
             
@@ -83,8 +138,21 @@ class MemoryManager:
             return retrieved_prompt
         except Exception as e:
             logger.error(f"检索记忆信息失败: {str(e)}")
-            return ""
+            return None
+
+# 全局实例供其他模块使用，首次使用时创建
+_memory_manager = LazySingleton(MemoryManager, "memory_manager")
+
+
+def get_memory_manager() -> MemoryManager:
+    """
+    获取全局MemoryManager实例，首次调用时创建
+    """
+    return _memory_manager.get()
+
 
-# 创建全局实例供其他模块使用
-memory_manager = MemoryManager()
-logger.info("全局实例 memory_manager 已创建")
\ No newline at end of file
+def __getattr__(name: str):
+    # 兼容 from ... import memory_manager 的旧用法，访问时才创建实例
+    if name == "memory_manager":
+        return get_memory_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
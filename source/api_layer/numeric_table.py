@@ -0,0 +1,156 @@
+from typing import Dict, List, Any, Set, Optional
+import pandas as pd
+# 导入紧凑实体记录
+from source.api_layer.entity_record import EntityRecord
+
+# 数值型传感器表的列
+# value为解析出的数值，用于聚合；state为原始状态字符串，用于展示（不丢失大数值和高精度数值的位数）
+NUMERIC_COLUMNS = ["friendly_name", "state", "value", "unit", "group", "last_updated"]
+
+# 数值解析时保留的字符：数字、小数点和负号，其余字符（单位、百分号等）被去除
+NON_NUMERIC_PATTERN = r"[^0-9.\-]"
+
+
+def parse_numeric_states(states: List[str]) -> pd.Series:
+    """
+    批量解析传感器状态的数值
+    去除单位等非数值字符后一次性转换为浮点数（如"25.5%"为25.5，"-3.2°C"为-3.2），
+    无法解析的状态为NaN
+    :param states: 状态字符串列表
+    :return: 与输入顺序一致的float64序列
+    """
+    if not states:
+        return pd.Series([], dtype="float64")
+    cleaned = pd.Series(states, dtype="object").str.replace(NON_NUMERIC_PATTERN, "", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce").astype("float64")
+
+
+class NumericSensorTable:
+    """
+    数值型传感器列式表
+    以entity_id为索引，保存名称、原始状态、数值、单位、分组和更新时间，聚合、导出和提示词构建直接基于该表向量化计算；
+    分类器只登记变化的传感器，表在下一次读取时批量合并变化
+    """
+
+    def __init__(self):
+        self._frame = self._empty_frame()
+        self._sorted: Optional[pd.DataFrame] = None
+        self._upserts: Dict[str, EntityRecord] = {}
+        self._removed: Set[str] = set()
+
+    @staticmethod
+    def _empty_frame() -> pd.DataFrame:
+        frame = pd.DataFrame({
+            "friendly_name": pd.Series(dtype="object"),
+            "state": pd.Series(dtype="object"),
+            "value": pd.Series(dtype="float64"),
+            "unit": pd.Series(dtype="object"),
+            "group": pd.Series(dtype="object"),
+            "last_updated": pd.Series(dtype="datetime64[ns, UTC]"),
+        })
+        frame.index.name = "entity_id"
+        return frame
+
+    def upsert(self, record: EntityRecord):
+        """
+        登记新增或变化的数值型传感器
+        """
+        self._upserts[record.entity_id] = record
+        self._removed.discard(record.entity_id)
+
+    def remove(self, entity_id: str):
+        """
+        登记被移除的数值型传感器
+        """
+        self._upserts.pop(entity_id, None)
+        self._removed.add(entity_id)
+
+    def clear(self):
+        """
+        清空表
+        """
+        self._frame = self._empty_frame()
+        self._sorted = None
+        self._upserts.clear()
+        self._removed.clear()
+
+    def _merge_pending(self):
+        """
+        将登记的变化批量合并到表中
+        """
+        if not self._upserts and not self._removed:
+            return
+        frame = self._frame
+        stale = self._removed.union(self._upserts)
+        if stale:
+            frame = frame[~frame.index.isin(list(stale))]
+        if self._upserts:
+            records = list(self._upserts.values())
+            new_rows = pd.DataFrame(
+                {
+                    "friendly_name": [record.friendly_name for record in records],
+                    "state": [record.state for record in records],
+                    "value": pd.Series([record.value for record in records], dtype="float64").to_numpy(),
+                    "unit": [record.unit_of_measurement for record in records],
+                    "group": [record.group_name for record in records],
+                    "last_updated": pd.to_datetime([record.updated for record in records], utc=True, errors="coerce", format="ISO8601"),
+                },
+                index=pd.Index([record.entity_id for record in records], name="entity_id")
+            )
+            frame = pd.concat([frame, new_rows]) if len(frame) else new_rows
+        self._frame = frame
+        self._sorted = None
+        self._upserts.clear()
+        self._removed.clear()
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """
+        当前的数值型传感器表（行顺序不保证）
+        """
+        self._merge_pending()
+        return self._frame
+
+    @property
+    def sorted_frame(self) -> pd.DataFrame:
+        """
+        按分组和名称排序的数值型传感器表，结果缓存到下一次数据变化
+        """
+        self._merge_pending()
+        if self._sorted is None:
+            self._sorted = self._frame.sort_values(["group", "friendly_name"], kind="stable")
+        return self._sorted
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def group_stats(self) -> pd.DataFrame:
+        """
+        按分组和单位聚合数值：数量、平均值、最小值、最大值
+        """
+        frame = self.frame
+        if frame.empty:
+            return pd.DataFrame(columns=["group", "unit", "count", "mean", "min", "max"])
+        return (frame.groupby(["group", "unit"], sort=True)["value"]
+                .agg(["count", "mean", "min", "max"])
+                .reset_index())
+
+    def group_samples(self, max_groups: int = 3, per_group: int = 2) -> List[Dict[str, Any]]:
+        """
+        获取前若干个分组的传感器数量及示例
+        :param max_groups: 分组数量上限
+        :param per_group: 每个分组的示例数量
+        :return: [{"group": 分组名称, "count": 数量, "samples": 示例行DataFrame}, ...]
+        """
+        frame = self.sorted_frame
+        if frame.empty:
+            return []
+        counts = frame["group"].value_counts(sort=False)
+        samples = []
+        for group_name in counts.index.sort_values()[:max_groups]:
+            samples.append({
+                "group": group_name,
+                "count": int(counts[group_name]),
+                "samples": frame[frame["group"] == group_name].head(per_group)
+            })
+        return samples
@@ -8,6 +8,8 @@ from typing import Dict, Any, Optional
 
 # 导入日志记录器
 from source.base_layer.utils import logger
+# 导入延迟单例
+from source.base_layer.lazy_singleton import LazySingleton
 
 class QwenSpeechManager:
     """
@@ -357,5 +359,19 @@ class QwenSpeechManager:
             "last_tts_time": self.last_tts_time,
         }
 
-# 创建全局实例供其他模块使用
-qwen_speech_manager = QwenSpeechManager()
\ No newline at end of file
+# 全局实例供其他模块使用，首次使用时创建
+_qwen_speech_manager = LazySingleton(QwenSpeechManager, "qwen_speech_manager")
+
+
+def get_qwen_speech_manager() -> QwenSpeechManager:
+    """
+    获取全局QwenSpeechManager实例，首次调用时创建
+    """
+    return _qwen_speech_manager.get()
+
+
+def __getattr__(name: str):
+    # 兼容 from ... import qwen_speech_manager 的旧用法，访问时才创建实例
+    if name == "qwen_speech_manager":
+        return get_qwen_speech_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,121 @@
+# 后台刷新模块 - 在独立事件循环中按间隔或变化通知执行刷新，合并突发通知并限制刷新频率
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Optional
+# 导入日志记录器
+from source.base_layer.utils import logger
+
+
+class BackgroundRefresher:
+    """
+    后台刷新任务
+    刷新协程运行在独立线程的事件循环中：每隔interval秒或收到notify()通知时执行一次刷新，
+    两次刷新之间至少间隔min_interval秒，期间到达的多次通知合并为一次刷新
+    """
+
+    def __init__(self, refresh: Callable[[], Any], interval: float, min_interval: float, name: str = "background-refresher"):
+        """
+        初始化后台刷新任务
+        :param refresh: 刷新函数（同步），在工作线程中执行，不阻塞事件循环
+        :param interval: 没有通知时的定时刷新间隔（秒），小于等于0表示只响应通知
+        :param min_interval: 两次刷新之间的最小间隔（秒）
+        :param name: 线程名称
+        """
+        self.refresh = refresh
+        self.interval = interval
+        self.min_interval = min_interval
+        self.name = name
+        self.refresh_count = 0
+        self.last_refreshed_at: Optional[float] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        """
+        后台任务是否在运行
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        启动后台线程及刷新任务
+        """
+        with self._lock:
+            if self.is_running:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def stop(self):
+        """
+        取消刷新任务并停止后台线程
+        """
+        with self._lock:
+            loop, task, thread = self._loop, self._task, self._thread
+            if loop is None or task is None:
+                return
+            loop.call_soon_threadsafe(task.cancel)
+        if thread is not threading.current_thread():
+            thread.join(5)
+
+    def notify(self):
+        """
+        通知数据已变化，请求尽快刷新（线程安全，可在任意线程调用）
+        """
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _run(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._refresh_forever())
+        loop.call_soon(ready.set)
+        try:
+            loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop = None
+            self._wakeup = None
+            self._task = None
+            loop.close()
+
+    async def _refresh_forever(self):
+        while True:
+            # 等待变化通知或定时刷新
+            try:
+                if self.interval > 0:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                else:
+                    await self._wakeup.wait()
+            except asyncio.TimeoutError:
+                pass
+
+            # 限制刷新频率，等待期间到达的通知合并到本次刷新
+            if self.last_refreshed_at is not None:
+                remaining = self.min_interval - (time.monotonic() - self.last_refreshed_at)
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+            self._wakeup.clear()
+
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.warning(f"后台刷新失败: {str(e)}")
+            self.last_refreshed_at = time.monotonic()
+            self.refresh_count += 1
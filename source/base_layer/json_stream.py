@@ -0,0 +1,91 @@
+# JSON流式解析模块 - 从分块的字节流中逐个解析顶层JSON数组的元素
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+# 数组元素之间允许出现的空白字符
+_WHITESPACE = " \t\n\r"
+# 可能出现在数字中的字符
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+def iter_json_array(chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[Any]:
+    """
+    流式解析顶层JSON数组，每解析出一个完整元素就立即产出
+    只缓冲尚未解析完的最后一个元素，内存占用与单个元素大小而非整个数组大小相关
+    :param chunks: 字节块迭代器，例如 response.iter_content(chunk_size)
+    :param encoding: 字节流编码
+    :return: 数组元素迭代器
+    :raises ValueError: 数据不是合法的JSON数组
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    chunk_iter = iter(chunks)
+    buffer = ""
+    pos = 0
+    exhausted = False
+    started = False
+    expect_value = True
+
+    def read_more() -> bool:
+        nonlocal buffer, pos, exhausted
+        if exhausted:
+            return False
+        for chunk in chunk_iter:
+            if chunk:
+                # 丢弃已解析部分，避免缓冲区随数组增长
+                buffer = buffer[pos:] + text_decoder.decode(chunk)
+                pos = 0
+                return True
+        buffer = buffer[pos:] + text_decoder.decode(b"", final=True)
+        pos = 0
+        exhausted = True
+        return bool(buffer)
+
+    def next_token() -> str:
+        # 跳过空白，返回下一个非空白字符；数据耗尽时返回空字符串
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                return ""
+
+    if next_token() != "[":
+        raise ValueError("JSON数据不是数组")
+    pos += 1
+
+    while True:
+        token = next_token()
+        if token == "]":
+            if started and expect_value:
+                raise ValueError("JSON数组中存在多余的逗号")
+            return
+        if token == "":
+            raise ValueError("JSON数组不完整")
+        if not expect_value:
+            if token != ",":
+                raise ValueError(f"JSON数组元素之间缺少逗号，位置: {pos}")
+            pos += 1
+            expect_value = True
+            continue
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 元素尚未完整接收，继续读取
+                if not read_more():
+                    raise
+                continue
+            # 数字可能被分块截断（如"12"后仍有"34"，"2.5"后仍有"e3"），需等待更多数据确认
+            if not exhausted and type(value) in (int, float) and (end == len(buffer) or buffer[end] in _NUMBER_CHARS):
+                if read_more():
+                    continue
+            break
+        pos = end
+        started = True
+        expect_value = False
+        yield value
@@ -0,0 +1,46 @@
+# 延迟单例模块 - 全局实例在首次使用时才创建，导入模块不产生网络请求、文件或模型初始化
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+# 导入日志记录器及日志配置
+from source.base_layer.utils import logger, setup_logging
+
+T = TypeVar("T")
+
+
+class LazySingleton(Generic[T]):
+    """
+    线程安全的延迟单例
+    首次调用get()时才调用工厂函数创建实例（同时完成日志配置），并发的首次调用只会创建一次
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str):
+        """
+        初始化延迟单例
+        :param factory: 创建实例的工厂函数
+        :param name: 实例名称，用于日志
+        """
+        self.factory = factory
+        self.name = name
+        self._instance: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_created(self) -> bool:
+        """
+        实例是否已创建
+        """
+        return self._instance is not None
+
+    def get(self) -> T:
+        """
+        获取实例，首次调用时创建
+        """
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    setup_logging()
+                    self._instance = self.factory()
+                    logger.info(f"全局实例 {self.name} 已创建")
+                instance = self._instance
+        return instance
@@ -0,0 +1,110 @@
+# 快照缓存模块 - 提供带最大陈旧度的单飞(single-flight)缓存
+import time
+import threading
+from typing import Any, Callable, Optional
+
+
+class SnapshotCache:
+    """
+    带最大陈旧度的单飞快照缓存
+    并发的刷新请求合并为一次加载，陈旧度预算内的调用方共享同一版本的快照
+    """
+
+    def __init__(self, loader: Callable[[], Any], max_staleness: float, validator: Optional[Callable[[], bool]] = None):
+        """
+        初始化快照缓存
+        :param loader: 加载函数，返回新快照；返回None表示加载失败，不更新缓存时间
+        :param max_staleness: 默认最大陈旧度（秒）
+        :param validator: 可选的额外校验函数，返回False时视为缓存已失效
+        """
+        self.loader = loader
+        self.max_staleness = max_staleness
+        self.validator = validator
+        self.value = None
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # 已完成的加载次数（无论成功与否），在加载函数返回后才增加，由_generation_lock保护
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+
+    def age(self) -> Optional[float]:
+        """
+        获取当前快照的年龄（秒），尚未加载时返回None
+        """
+        if self.loaded_at is None:
+            return None
+        return time.monotonic() - self.loaded_at
+
+    def is_fresh(self, max_staleness: Optional[float] = None) -> bool:
+        """
+        判断当前快照是否在陈旧度预算内
+        :param max_staleness: 本次调用的最大陈旧度，默认使用初始化时的配置
+        """
+        budget = self.max_staleness if max_staleness is None else max_staleness
+        age = self.age()
+        if age is None or age > budget:
+            return False
+        return self.validator() if self.validator else True
+
+    def get(self, max_staleness: Optional[float] = None, force: bool = False) -> Any:
+        """
+        获取快照，必要时加载
+        :param max_staleness: 本次调用的最大陈旧度
+        :param force: 是否忽略陈旧度强制加载（仍与并发请求合并）
+        :return: 当前快照
+        """
+        if not force and self.is_fresh(max_staleness):
+            return self.value
+
+        with self._generation_lock:
+            generation = self._generation
+        with self._lock:
+            # 等锁期间有一次加载完成（包括调用时正在进行的加载），直接共享其结果
+            with self._generation_lock:
+                loaded_meanwhile = self._generation != generation
+            if loaded_meanwhile or (not force and self.is_fresh(max_staleness)):
+                return self.value
+
+            try:
+                value = self.loader()
+            finally:
+                with self._generation_lock:
+                    self._generation += 1
+            if value is not None:
+                # 加载函数返回同一对象表示数据未变化，版本号保持不变
+                if value is not self.value:
+                    self.value = value
+                    self.version += 1
+                self.loaded_at = time.monotonic()
+            return self.value
+
+    def prime(self, value: Any):
+        """
+        使用外部数据（如磁盘中保存的快照）作为当前快照，快照被视为已陈旧，下一次get时重新加载
+        :param value: 快照数据
+        """
+        with self._lock:
+            self.value = value
+            self.version += 1
+            self.loaded_at = None
+
+    def update(self, updater: Callable[[Any], Any]) -> Any:
+        """
+        在加载锁内对当前快照做局部更新（如乐观更新），不改变快照的加载时间
+        :param updater: 更新函数，接收当前快照，返回新快照；返回同一对象表示没有变化，返回None表示放弃更新
+        :return: 当前快照
+        """
+        with self._lock:
+            value = updater(self.value)
+            if value is not None and value is not self.value:
+                self.value = value
+                self.version += 1
+            return self.value
+
+    def invalidate(self):
+        """
+        使当前快照失效，下一次get时重新加载（正在进行的加载完成后生效）
+        """
+        with self._lock:
+            self.loaded_at = None
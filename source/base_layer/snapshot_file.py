@@ -0,0 +1,69 @@
+# 快照文件模块 - 将实体快照以紧凑的二进制格式保存到磁盘，启动时快速加载
+import os
+import sys
+import time
+import marshal
+from typing import Any, List, Optional, Tuple
+# 导入日志记录器
+from source.base_layer.utils import logger
+
+# 文件格式版本，格式变化时递增，旧文件被忽略
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+class SnapshotFile:
+    """
+    实体快照文件
+    使用marshal序列化（只支持基本类型，加载时不会执行任何代码，速度接近直接读取文件）；
+    marshal格式与Python版本相关，文件头记录格式版本、Python版本和数据来源，不匹配时忽略该文件
+    """
+
+    def __init__(self, path: str, source: str):
+        """
+        初始化快照文件
+        :param path: 文件路径
+        :param source: 数据来源标识（如Home Assistant URL），来源不同的快照不会被加载
+        """
+        self.path = path
+        self.source = source
+
+    def _header(self) -> Tuple[Any, ...]:
+        return (SNAPSHOT_FORMAT_VERSION, tuple(sys.version_info[:2]), self.source)
+
+    def save(self, rows: List[Tuple[Any, ...]]) -> bool:
+        """
+        保存快照，先写入临时文件再替换，写入过程中断不会破坏已有文件
+        :param rows: 快照行，只能包含基本类型（str、数字、None、bool、list、dict、tuple）
+        :return: 是否保存成功
+        """
+        try:
+            data = marshal.dumps((self._header(), time.time(), rows))
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+            return True
+        except (OSError, ValueError) as e:
+            logger.warning(f"保存实体快照失败: {str(e)}")
+            return False
+
+    def load(self) -> Optional[Tuple[float, List[Tuple[Any, ...]]]]:
+        """
+        加载快照
+        :return: (保存时间戳, 快照行)，文件不存在、已损坏或与当前环境不匹配时返回None
+        """
+        try:
+            with open(self.path, "rb") as f:
+                header, saved_at, rows = marshal.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logger.warning(f"读取实体快照失败: {str(e)}")
+            return None
+        if header != self._header():
+            logger.info("实体快照与当前环境不匹配，已忽略")
+            return None
+        return saved_at, rows
@@ -0,0 +1,79 @@
+# 文本匹配模块 - 基于Aho-Corasick自动机的多模式串匹配
+from collections import deque
+from typing import Dict, List, Iterable, Iterator, Tuple
+
+
+class AhoCorasickMatcher:
+    """
+    Aho-Corasick多模式匹配自动机
+    预编译一组模式串，单次扫描文本即可找出所有出现的模式，耗时与文本长度（及匹配数量）成正比，与模式数量无关
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        """
+        构建自动机
+        :param patterns: 模式串列表，模式在列表中的下标即其编号，空串被忽略
+        """
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[int, ...]] = [()]
+        for pattern in patterns:
+            self._add_pattern(pattern)
+        self._build_fail_links()
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def _add_pattern(self, pattern: str):
+        pattern_id = len(self.patterns)
+        self.patterns.append(pattern)
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = next_node
+        self._output[node] += (pattern_id,)
+
+    def _build_fail_links(self):
+        # 按层次遍历，父节点的失配链接总是先于子节点确定
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                # 合并失配节点的输出，匹配时无需再沿失配链回溯
+                self._output[child] += self._output[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        扫描文本，按匹配结束位置的顺序逐个产出匹配结果
+        :param text: 待匹配文本
+        :return: (匹配起始下标, 模式编号) 的迭代器
+        """
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern_id in output[node]:
+                yield index - len(patterns[pattern_id]) + 1, pattern_id
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """
+        找出文本中出现的所有模式
+        :return: (匹配起始下标, 模式串) 列表
+        """
+        return [(start, self.patterns[pattern_id]) for start, pattern_id in self.iter_matches(text)]
@@ -1,13 +1,27 @@
 # 工具类模块 - 提供通用工具函数和日志配置
 import logging
 import os
+import threading
 from datetime import datetime
 
+# 日志是否已配置
+_logging_configured = False
+_logging_lock = threading.Lock()
+
 # 配置日志
 def setup_logging():
     """
     配置全局日志记录器
+    只在首次调用时生效：由程序入口或首次创建全局实例时调用，导入模块时不再创建日志文件
     """
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+        _logging_configured = True
+        _configure_logging()
+
+def _configure_logging():
     # 确保日志目录存在
     log_dir = os.path.join(os.getcwd(), "logs")
     if not os.path.exists(log_dir):
@@ -48,9 +62,5 @@ def setup_logging():
     # 记录日志初始化信息
     root_logger.info("日志系统初始化完成，历史调用日志已创建: " + history_log_file)
 
-# 初始化日志设置
-setup_logging()
-
 # 创建默认日志记录器
-logger = logging.getLogger(__name__)
-logger.info("utils模块初始化完成")
\ No newline at end of file
+logger = logging.getLogger(__name__)
\ No newline at end of file
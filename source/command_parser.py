@@ -1,149 +1,277 @@
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Tuple
+from pydantic import BaseModel
 # 导入日志记录器
 from source.base_layer.utils import logger
+# 导入实体索引
+from source.api_layer.entity_index import EntityIndex
+# 导入实体类型解析
+from source.api_layer.entity_record import entity_domain
+# 导入Home Assistant服务调用
+from source.api_layer.ha_transport import call_service, async_call_service, call_services
+# 导入多模式串匹配自动机
+from source.base_layer.text_matcher import AhoCorasickMatcher
+
+# 指令中出现的实体ID（如light.living_room，联邦模式下可带实例命名空间，如home:light.living_room）
+ENTITY_ID_PATTERN = re.compile(r'(?:[a-z0-9_]+:)?[a-z_]+\.[a-z0-9_]+')
+
+# "所有"类的模糊指令：(预编译正则, 实体类型, 服务)，按顺序匹配
+ALL_COMMAND_PATTERNS = [(re.compile(pattern), domain, service) for pattern, domain, service in [
+    (r'打开所有灯', 'light', 'turn_on'),
+    (r'关闭所有灯', 'light', 'turn_off'),
+    (r'打开所有开关', 'switch', 'turn_on'),
+    (r'关闭所有开关', 'switch', 'turn_off'),
+    (r'全部开灯', 'light', 'turn_on'),
+    (r'全部关灯', 'light', 'turn_off'),
+    (r'所有灯打开', 'light', 'turn_on'),
+    (r'所有灯关闭', 'light', 'turn_off'),
+]]
+
+# 普通指令：(预编译正则, 实体类型, 服务)，按顺序匹配
+DEVICE_COMMAND_PATTERNS = [(re.compile(pattern), domain, service) for pattern, domain, service in [
+    (r'打开\s*(.+?)灯', 'light', 'turn_on'),
+    (r'关闭\s*(.+?)灯', 'light', 'turn_off'),
+    (r'开灯', 'light', 'turn_on'),
+    (r'关灯', 'light', 'turn_off'),
+    (r'打开\s*(.+?)开关', 'switch', 'turn_on'),
+    (r'关闭\s*(.+?)开关', 'switch', 'turn_off'),
+    (r'开启\s*(.+?)', 'switch', 'turn_on'),
+    (r'关闭\s*(.+?)', 'switch', 'turn_off'),
+]]
+
+
+def command_service(command_text: str) -> Optional[str]:
+    """
+    根据指令中的动作词确定服务
+    :return: turn_on/turn_off，没有动作词时返回None
+    """
+    if '打开' in command_text or '开启' in command_text:
+        return 'turn_on'
+    if '关闭' in command_text or '关' in command_text:
+        return 'turn_off'
+    return None
+
+
+# 没有匹配到控制指令时的提示
+NO_MATCH_MESSAGE = "未找到匹配的设备控制指令或设备不存在"
+
+# 各匹配方式的置信度
+CONFIDENCE_ALL = 1.0
+CONFIDENCE_ENTITY_ID = 1.0
+CONFIDENCE_NAME = 0.9
+CONFIDENCE_PATTERN = 0.5
+
+
+class CommandPlan(BaseModel):
+    """
+    控制计划
+    由CommandParser.parse解析得到，解析过程不调用任何服务；通过CommandParser.execute执行
+    """
+    # 实体类型
+    domain: str
+    # 服务名称（turn_on/turn_off等）
+    service: str
+    # 目标实体ID
+    entity_ids: List[str] = []
+    # 匹配置信度（0~1）：明确的实体ID和"所有"类指令为1.0，实体名称为0.9，模糊的指令模板为0.5
+    confidence: float = 0.0
+    # 匹配方式：all/entity_id/name/pattern/router（快速路由）
+    source: str = ""
+
+    @property
+    def is_all(self) -> bool:
+        """
+        是否为"所有"类指令（作用于该类型的全部设备）
+        """
+        return self.source == "all"
+
 
 class CommandParser:
     """
     命令解析器类，负责解析和执行Home Assistant控制命令
     """
     
-    def __init__(self, entity_data: Dict[str, Any], url: str, headers: Dict[str, str]):
+    def __init__(self, entity_data: Dict[str, Any], url: str, headers: Dict[str, str], entity_index: Optional[EntityIndex] = None,
+                 service_caller: Optional[Callable[[str, str], str]] = None,
+                 async_service_caller: Optional[Callable[[str, str], Awaitable[str]]] = None,
+                 batch_service_caller: Optional[Callable[[List[str], str], Dict[str, str]]] = None):
         """
         初始化命令解析器
         :param entity_data: 实体数据
         :param url: Home Assistant URL
         :param headers: 请求头
+        :param entity_index: 共享的实体索引（由HomeAssistantManager维护），为None时根据实体数据自行构建
+        :param service_caller: 服务调用函数(entity_id, service)，为None时直接调用url对应的实例（多实例时由HomeAssistantManager按命名空间路由）
+        :param async_service_caller: 异步服务调用函数(entity_id, service)，为None时直接调用url对应的实例
+        :param batch_service_caller: 多实体服务调用函数(entity_ids, service) -> {entity_id: 执行结果}，为None时直接调用url对应的实例
         """
-        self.entity_data = entity_data
         self.url = url
         self.headers = headers
+        self.service_caller = service_caller
+        self.async_service_caller = async_service_caller
+        self.batch_service_caller = batch_service_caller
+        # 设备名称匹配自动机，实体索引的实体集合或名称变化时才重建
+        self._name_matcher: Optional[AhoCorasickMatcher] = None
+        self._matcher_names: List[str] = []
+        self._matcher_index: Optional[EntityIndex] = None
+        self._matcher_version: Optional[int] = None
+        self.shared_index = entity_index is not None
+        self.entity_index = entity_index if entity_index is not None else EntityIndex()
+        self.update_entity_data(entity_data)
         
     def update_entity_data(self, entity_data: Dict[str, Any]):
         """
         更新实体数据
-        :param entity_data: 新的实体数据
+        :param entity_data: 新的实体数据（完整实体数据或非传感器实体数据）
         """
         self.entity_data = entity_data
+        if not self.shared_index:
+            # 兼容传入完整实体数据和仅非传感器实体数据两种格式
+            non_sensor_data = (entity_data or {}).get("non_sensor_data", entity_data) or {}
+            self.entity_index = EntityIndex.from_entities(
+                entity for entities in non_sensor_data.values() for entity in entities
+            )
     
     def call_home_assistant_service(self, entity_id: str, service: str) -> str:
         """
-        调用Home Assistant服务
+        调用Home Assistant服务，通过共享连接池发送请求
         :param entity_id: 实体ID
         :param service: 服务名称（turn_on/turn_off等）
         :return: 执行结果
         """
-        try:
-            # 导入requests模块
-            import requests
-            
-            # 从entity_id中提取域（domain）
-            domain = entity_id.split(".")[0] if "." in entity_id else ""
-            
-            if not domain:
-                return f"无效的实体ID: {entity_id}"
-            
-            # 构建服务调用URL
-            service_url = f"{self.url}/api/services/{domain}/{service}"
-            
-            # 准备请求体
-            payload = {
-                "entity_id": entity_id
-            }
-            
-            # 发送请求
-            response = requests.post(
-                service_url,
-                headers=self.headers,
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code in [200, 201]:
-                return f"成功执行: {service} {entity_id}"
-            else:
-                return f"执行失败: {response.status_code} {response.text}"
-        except Exception as e:
-            return f"执行异常: {str(e)}"
+        if self.service_caller is not None:
+            return self.service_caller(entity_id, service)
+        return call_service(self.url, self.headers, entity_id, service)
+
+    async def async_call_home_assistant_service(self, entity_id: str, service: str) -> str:
+        """
+        异步调用Home Assistant服务
+        :param entity_id: 实体ID
+        :param service: 服务名称（turn_on/turn_off等）
+        :return: 执行结果
+        """
+        if self.async_service_caller is not None:
+            return await self.async_service_caller(entity_id, service)
+        return await async_call_service(self.url, self.headers, entity_id, service)
     
-    def parse_and_execute_command(self, command_text: str) -> str:
+    def call_home_assistant_services(self, entity_ids: List[str], service: str) -> Dict[str, str]:
         """
-        解析并执行控制指令
+        对多个实体调用同一服务，同类实体合并为一次请求，无法合并时有限并发地逐个调用
+        :param entity_ids: 实体ID列表
+        :param service: 服务名称（turn_on/turn_off等）
+        :return: 实体ID -> 执行结果
+        """
+        if self.batch_service_caller is not None:
+            return self.batch_service_caller(entity_ids, service)
+        return call_services(self.url, self.headers, entity_ids, service)
+
+    def _get_name_matcher(self) -> Tuple[AhoCorasickMatcher, List[str]]:
+        """
+        获取设备名称匹配自动机，模式为包含非传感器实体的friendly_name（小写）
+        :return: (自动机, 模式编号对应的原始名称)
+        """
+        index = self.entity_index
+        if self._name_matcher is None or self._matcher_index is not index or self._matcher_version != index.version:
+            names = [
+                name for name, entities in index.by_name.items()
+                if name and any(entity_domain(entity['entity_id']) != "sensor" for entity in entities)
+            ]
+            self._name_matcher = AhoCorasickMatcher(name.lower() for name in names)
+            self._matcher_names = names
+            self._matcher_index = index
+            self._matcher_version = index.version
+        return self._name_matcher, self._matcher_names
+
+    def match_entity_by_name(self, command_text: str) -> Optional[Dict[str, Any]]:
+        """
+        查找指令中提到名称的非传感器实体，只扫描一遍指令文本，耗时与实体数量无关
+        多个名称同时出现时取最长的名称（如"客厅灯带"优先于"客厅灯"），长度相同时取先出现的
         :param command_text: 指令文本
-        :return: 执行结果
+        :return: 实体信息，没有匹配时返回None
+        """
+        matcher, names = self._get_name_matcher()
+        best = None
+        for start, pattern_id in matcher.iter_matches(command_text.lower()):
+            key = (-len(matcher.patterns[pattern_id]), start, pattern_id)
+            if best is None or key < best:
+                best = key
+        if best is None:
+            return None
+        for entity in self.entity_index.by_name.get(names[best[2]], ()):
+            if entity_domain(entity['entity_id']) != "sensor":
+                return entity
+        return None
+
+    def parse(self, command_text: str) -> Optional[CommandPlan]:
+        """
+        解析控制指令，不调用任何服务
+        :param command_text: 指令文本
+        :return: 控制计划，没有匹配到控制指令或设备时返回None
         """
-        # 简单的指令解析规则
-        command_patterns = [
-            (r'打开\s*(.+?)灯', 'light', 'turn_on'),
-            (r'关闭\s*(.+?)灯', 'light', 'turn_off'),
-            (r'开灯', 'light', 'turn_on'),
-            (r'关灯', 'light', 'turn_off'),
-            (r'打开\s*(.+?)开关', 'switch', 'turn_on'),
-            (r'关闭\s*(.+?)开关', 'switch', 'turn_off'),
-            (r'开启\s*(.+?)', 'switch', 'turn_on'),
-            (r'关闭\s*(.+?)', 'switch', 'turn_off'),
-            # 支持模糊表达的规则
-            (r'打开所有灯', 'light', 'turn_on', True),
-            (r'关闭所有灯', 'light', 'turn_off', True),
-            (r'打开所有开关', 'switch', 'turn_on', True),
-            (r'关闭所有开关', 'switch', 'turn_off', True),
-            (r'全部开灯', 'light', 'turn_on', True),
-            (r'全部关灯', 'light', 'turn_off', True),
-            (r'所有灯打开', 'light', 'turn_on', True),
-            (r'所有灯关闭', 'light', 'turn_off', True),
-        ]
-        
         # 首先检查是否是"所有"类的模糊指令
-        for pattern, domain, service, is_all in [p for p in command_patterns if len(p) > 3 and p[3]]:
-            if re.search(pattern, command_text):
-                # 执行所有该类型设备的操作
-                if self.entity_data and self.entity_data.get('non_sensor_data') and domain in self.entity_data['non_sensor_data']:
-                    results = []
-                    for entity in self.entity_data['non_sensor_data'][domain]:
-                        result = self.call_home_assistant_service(entity.get('entity_id'), service)
-                        results.append(f"- {entity.get('friendly_name', entity.get('entity_id'))}: {result}")
-                    
-                    if results:
-                        action_name = "打开" if service == "turn_on" else "关闭"
-                        return f"已{action_name}所有{domain}设备：\n" + "\n".join(results)
-                    else:
-                        return f"没有找到{domain}类型的设备"
-        
-        # 检查是否包含明确的实体ID
-        if self.entity_data and self.entity_data.get('non_sensor_data'):
-            non_sensor_data = self.entity_data['non_sensor_data']
-            
-            # 遍历所有实体类型
-            for entity_type, entities in non_sensor_data.items():
-                for entity in entities:
-                    entity_id = entity.get('entity_id', '')
-                    friendly_name = entity.get('friendly_name', '').lower()
-                    
-                    # 检查实体名称是否在指令中
-                    if friendly_name and friendly_name in command_text.lower():
-                        if '打开' in command_text or '开启' in command_text:
-                            return self.call_home_assistant_service(entity_id, 'turn_on')
-                        elif '关闭' in command_text or '关' in command_text:
-                            return self.call_home_assistant_service(entity_id, 'turn_off')
-                    
-                    # 检查实体ID是否在指令中
-                    if entity_id and entity_id in command_text:
-                        if '打开' in command_text or '开启' in command_text:
-                            return self.call_home_assistant_service(entity_id, 'turn_on')
-                        elif '关闭' in command_text or '关' in command_text:
-                            return self.call_home_assistant_service(entity_id, 'turn_off')
-        
+        for pattern, domain, service in ALL_COMMAND_PATTERNS:
+            if pattern.search(command_text):
+                entity_ids = list(self.entity_index.by_domain.get(domain, ()))
+                if entity_ids:
+                    return CommandPlan(domain=domain, service=service, entity_ids=entity_ids,
+                                       confidence=CONFIDENCE_ALL, source="all")
+
+        service = command_service(command_text)
+        if service is not None:
+            # 检查是否包含明确的实体ID（通过索引直接查找）
+            for entity_id in ENTITY_ID_PATTERN.findall(command_text):
+                if self.entity_index.get(entity_id) and entity_domain(entity_id) != "sensor":
+                    return CommandPlan(domain=entity_domain(entity_id), service=service, entity_ids=[entity_id],
+                                       confidence=CONFIDENCE_ENTITY_ID, source="entity_id")
+
+            # 检查实体名称是否在指令中
+            entity = self.match_entity_by_name(command_text)
+            if entity is not None:
+                entity_id = entity['entity_id']
+                return CommandPlan(domain=entity_domain(entity_id), service=service, entity_ids=[entity_id],
+                                   confidence=CONFIDENCE_NAME, source="name")
+
         # 使用正则表达式匹配普通指令（非全部操作）
-        for pattern, domain, service in [p[:3] for p in command_patterns if len(p) <= 3 or not p[3]]:
-            match = re.search(pattern, command_text)
+        for pattern, domain, service in DEVICE_COMMAND_PATTERNS:
+            match = pattern.search(command_text)
             if match:
-                device_name = match.group(1) if len(match.groups()) > 0 else ''
-                
+                device_name = (match.group(1) if match.groups() else '').lower()
+
                 # 查找匹配的设备
-                if self.entity_data and self.entity_data.get('non_sensor_data') and domain in self.entity_data['non_sensor_data']:
-                    for entity in self.entity_data['non_sensor_data'][domain]:
-                        friendly_name = entity.get('friendly_name', '').lower()
-                        if device_name.lower() in friendly_name:
-                            return self.call_home_assistant_service(entity.get('entity_id'), service)
-        
-        return "未找到匹配的设备控制指令或设备不存在"
\ No newline at end of file
+                for entity in self.entity_index.get_domain_entities(domain):
+                    friendly_name = entity.get('friendly_name', '').lower()
+                    if device_name in friendly_name:
+                        return CommandPlan(domain=domain, service=service, entity_ids=[entity.get('entity_id')],
+                                           confidence=CONFIDENCE_PATTERN, source="pattern")
+
+        return None
+
+    def execute(self, plan: CommandPlan) -> str:
+        """
+        执行控制计划
+        :param plan: parse得到的控制计划
+        :return: 执行结果
+        """
+        if not plan.is_all and len(plan.entity_ids) == 1:
+            return self.call_home_assistant_service(plan.entity_ids[0], plan.service)
+
+        results = []
+        for entity_id, result in self.call_home_assistant_services(plan.entity_ids, plan.service).items():
+            entity = self.entity_index.get(entity_id)
+            name = entity.get('friendly_name', entity_id) if entity is not None else entity_id
+            results.append(f"- {name}: {result}")
+        action_name = "打开" if plan.service == "turn_on" else "关闭"
+        if plan.is_all:
+            return f"已{action_name}所有{plan.domain}设备：\n" + "\n".join(results)
+        return f"已{action_name}{len(plan.entity_ids)}个设备：\n" + "\n".join(results)
+
+    def parse_and_execute_command(self, command_text: str) -> str:
+        """
+        解析并执行控制指令
+        :param command_text: 指令文本
+        :return: 执行结果
+        """
+        plan = self.parse(command_text)
+        if plan is None:
+            return NO_MATCH_MESSAGE
+        return self.execute(plan)
@@ -0,0 +1,243 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Tuple, Optional, Callable
+# 导入日志记录器
+from source.base_layer.utils import logger
+
+# 一轮对话：(用户消息, 助手回复)
+Turn = Tuple[str, str]
+
+# 中日韩字符按每字一个token估算，其他文本按每4个字符一个token估算
+CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]')
+
+# 每条消息的固定开销（角色、分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 原样保留的对话超出预算需要截断时，每条消息至少保留的token数，仍超出时丢弃最早的轮次
+MIN_MESSAGE_TOKENS = 32
+
+# 摘要缓存的最大条目数
+SUMMARY_CACHE_SIZE = 256
+
+# 大模型调用失败时call_openai_api返回的错误信息前缀
+SUMMARY_ERROR_PREFIXES = ("调用OpenAI API失败", "初始化模型失败", "重新初始化模型失败")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数（不依赖分词器）
+    """
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    截断文本，使估算的token数不超过max_tokens，截断时以"…"结尾
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cost = 0.0
+    for index, char in enumerate(text):
+        cost += 1 if CJK_PATTERN.match(char) else 0.25
+        if cost > max_tokens - 1:
+            return text[:index] + "…"
+    return text
+
+
+class HistoryManager:
+    """
+    对话历史管理器
+    最近keep_turns轮对话原样保留，更早的轮次每累积keep_turns轮折叠一次，合并进增量更新的摘要；
+    折叠点成批移动，两次折叠之间保留的对话只追加、前缀不变，便于大模型后端的前缀缓存；
+    原样保留的对话超出token预算时提前折叠，仍超出时截断较早的消息，每轮输入大小与会话长度无关。
+    摘要按被折叠对话的哈希缓存，下一轮需要的摘要在本轮结束后于后台预先生成；
+    摘要生成失败时，未能合并进摘要的对话截断后原样保留
+    """
+
+    def __init__(self, summarizer: Callable[[str, int], str], token_budget: Optional[int] = None,
+                 keep_turns: Optional[int] = None, summary_max_length: Optional[int] = None):
+        """
+        初始化对话历史管理器
+        :param summarizer: 摘要函数 (文本, 摘要最大字数) -> 摘要，如llm_manager.generate_summary
+        :param token_budget: 摘要和原样保留的对话合计的token预算
+        :param keep_turns: 至少原样保留的最近轮数
+        :param summary_max_length: 摘要最大字数（字符数）
+        """
+        self.summarizer = summarizer
+        self.token_budget = token_budget if token_budget is not None else int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+        self.keep_turns = max(1, keep_turns if keep_turns is not None else int(os.getenv("HISTORY_KEEP_TURNS", "4")))
+        self.summary_max_length = summary_max_length if summary_max_length is not None \
+            else int(os.getenv("HISTORY_SUMMARY_MAX_LENGTH", "200"))
+        # 摘要的token数上限：estimate_tokens中每个字符最多计1个token（中日韩字符），其他字符更少
+        self.summary_max_tokens = estimate_tokens("字" * self.summary_max_length)
+        # 被折叠对话的哈希 -> 摘要
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        # 正在生成的摘要：被折叠对话的哈希 -> Future
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.summary_calls = 0
+
+    def prepare(self, history: List[Turn]) -> Tuple[str, List[Turn]]:
+        """
+        将完整的对话历史压缩为摘要和最近的对话，所需摘要尚未生成时同步等待
+        :param history: 完整的对话历史
+        :return: (较早对话的摘要, 原样保留的最近对话)
+        """
+        history = [(str(user or ""), str(assistant or "")) for user, assistant in history]
+        keys = self._prefix_keys(history)
+        # 决定折叠点时按摘要的token数上限预留，其余预算给原样保留的对话
+        fold = self._fold_count(len(history))
+        while fold < len(history) - self.keep_turns and \
+                self._turns_tokens(history[fold:]) > self.token_budget - self.summary_max_tokens:
+            fold += 1
+        folded, summary = self._summary_for(history, keys, fold)
+        if folded < fold:
+            logger.warning(f"对话摘要生成失败，{fold - folded} 轮较早的对话截断后原样保留")
+        turns_budget = max(self.token_budget - estimate_tokens(summary), 0)
+        return summary, self._truncate_turns(history[folded:], turns_budget)
+
+    def prefetch(self, history: List[Turn]):
+        """
+        在后台预先生成下一轮需要的摘要
+        :param history: 包含本轮对话的完整历史
+        """
+        history = [(str(user or ""), str(assistant or "")) for user, assistant in history]
+        fold = self._fold_count(len(history))
+        if fold > 0:
+            self._submit(history, self._prefix_keys(history), fold)
+
+    def _fold_count(self, turn_count: int) -> int:
+        """
+        按批折叠时需要折叠的轮数，原样保留的轮数在keep_turns ~ 2*keep_turns-1之间
+        """
+        return max(0, (turn_count - self.keep_turns) // self.keep_turns * self.keep_turns)
+
+    @staticmethod
+    def _prefix_keys(history: List[Turn]) -> List[str]:
+        """
+        每个对话前缀的哈希，keys[i]对应前i轮
+        """
+        keys = [""]
+        digest = hashlib.sha1()
+        for user, assistant in history:
+            digest.update(user.encode("utf-8"))
+            digest.update(b"\0")
+            digest.update(assistant.encode("utf-8"))
+            digest.update(b"\1")
+            keys.append(digest.hexdigest())
+        return keys
+
+    @staticmethod
+    def _turns_tokens(turns: List[Turn]) -> int:
+        return sum(estimate_tokens(user) + estimate_tokens(assistant) + 2 * MESSAGE_OVERHEAD_TOKENS
+                   for user, assistant in turns)
+
+    def _truncate_turns(self, turns: List[Turn], budget: int) -> List[Turn]:
+        """
+        原样保留的对话仍超出预算时，从较早的消息开始截断过长的消息；
+        轮数过多（如摘要生成失败）、截断后仍超出预算时，丢弃最早的轮次
+        """
+        if self._turns_tokens(turns) <= budget:
+            return turns
+        truncated = list(turns)
+        # 每条消息截断到最短也放不下时，先丢弃最早的轮次
+        while len(truncated) > 1 and len(truncated) * 2 * (MIN_MESSAGE_TOKENS + MESSAGE_OVERHEAD_TOKENS) > budget:
+            truncated.pop(0)
+        # 每条消息平均可用的token数
+        limit = max(budget // (2 * len(truncated)) - MESSAGE_OVERHEAD_TOKENS, MIN_MESSAGE_TOKENS)
+        for index, (user, assistant) in enumerate(truncated):
+            if self._turns_tokens(truncated) <= budget:
+                break
+            truncated[index] = (truncate_to_tokens(user, limit), truncate_to_tokens(assistant, limit))
+        return truncated
+
+    def _summary_for(self, history: List[Turn], keys: List[str], fold: int) -> Tuple[int, str]:
+        """
+        获取前fold轮对话的摘要，缓存中没有时生成（同步等待）
+        :return: (摘要实际涵盖的轮数, 摘要)，摘要生成失败时涵盖的轮数少于fold
+        """
+        if fold == 0:
+            return 0, ""
+        with self._lock:
+            summary = self._summaries.get(keys[fold])
+            if summary is not None:
+                self._summaries.move_to_end(keys[fold])
+                return fold, summary
+        return self._submit(history, keys, fold).result()
+
+    def _submit(self, history: List[Turn], keys: List[str], fold: int) -> Future:
+        """
+        提交生成前fold轮对话摘要的任务，相同的任务只提交一次
+        """
+        key = keys[fold]
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                if key in self._summaries:
+                    future = Future()
+                    future.set_result((fold, self._summaries[key]))
+                    return future
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+                future = self._executor.submit(self._fold, history[:fold], keys[:fold + 1])
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._pending_done(key))
+            return future
+
+    def _pending_done(self, key: str):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _fold(self, turns: List[Turn], keys: List[str]) -> Tuple[int, str]:
+        """
+        从已缓存的最长前缀摘要开始，每次合并keep_turns轮，增量更新摘要
+        :return: (摘要涵盖的轮数, 摘要)，摘要生成失败时返回已合并部分的摘要，失败不缓存，下一轮重试
+        """
+        start, summary = 0, ""
+        with self._lock:
+            for index in range(len(turns) - 1, 0, -1):
+                cached = self._summaries.get(keys[index])
+                if cached is not None:
+                    start, summary = index, cached
+                    break
+        while start < len(turns):
+            end = min(len(turns), start + self.keep_turns)
+            updated = self._summarize(summary, turns[start:end])
+            if updated is None:
+                break
+            summary, start = updated, end
+            with self._lock:
+                self._summaries[keys[end]] = summary
+                while len(self._summaries) > SUMMARY_CACHE_SIZE:
+                    self._summaries.popitem(last=False)
+        return start, summary
+
+    def _summarize(self, summary: str, turns: List[Turn]) -> Optional[str]:
+        """
+        把若干轮对话合并进已有摘要
+        :return: 新的摘要，失败时返回None
+        """
+        lines = [f"此前对话的摘要：{summary}", ""] if summary else []
+        lines.append("新的对话：")
+        for user, assistant in turns:
+            lines.append(f"用户: {user}")
+            lines.append(f"助手: {assistant}")
+        self.summary_calls += 1
+        try:
+            result = self.summarizer("\n".join(lines), self.summary_max_length)
+        except Exception as e:
+            logger.warning(f"生成对话摘要失败: {str(e)}")
+            return None
+        if not result or result.startswith(SUMMARY_ERROR_PREFIXES):
+            logger.warning(f"生成对话摘要失败: {result}")
+            return None
+        result = result.strip()
+        if len(result) > self.summary_max_length:
+            result = result[:self.summary_max_length - 1] + "…"
+        return result
@@ -2,7 +2,8 @@ import os
 import sys
 import json
 import asyncio
-from typing import Dict, List, Any, Tuple, Optional
+import threading
+from typing import Dict, List, Any, Tuple, Optional, AsyncIterator
 from datetime import datetime
 
 # 导入langgraph相关模块
@@ -12,16 +13,21 @@ from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from pydantic import BaseModel
 
-from source.api_layer.memory_manager import memory_manager
+from source.api_layer.memory_manager import get_memory_manager
 
 
 # 导入日志工具
 from source.base_layer.utils import logger
+# 导入延迟单例
+from source.base_layer.lazy_singleton import LazySingleton
 
 # 导入其他必要的模块
-from source.api_layer.llm_manager import llm_manager
-from source.api_layer.home_assistant import hass_manager
-from source.command_parser import CommandParser
+from source.api_layer.llm_manager import get_llm_manager
+from source.api_layer.home_assistant import get_hass_manager
+from source.command_parser import CommandParser, CommandPlan
+from source.intent_router import IntentRouter
+from source.history_manager import HistoryManager
+from source.api_layer.entity_record import RecordView
 
 # 导入dotenv
 from dotenv import load_dotenv
@@ -29,14 +35,27 @@ load_dotenv()
 
 # 读取环境变量
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "output")
+# 直接执行解析出的控制指令所需的最低置信度，低于该值时交由大模型处理
+COMMAND_MIN_CONFIDENCE = float(os.getenv("COMMAND_MIN_CONFIDENCE", "0"))
+# 智能体运行的标签，流式输出时据此从图事件中筛选智能体的大模型输出和工具调用
+AGENT_RUN_TAG = "ha_agent"
+# 运行图的配置
+GRAPH_CONFIG = {"configurable": {"thread_id": "home_assistant_thread"}}
+# 系统提示中固定不变的说明，放在最前面
+SYSTEM_PROMPT_HEADER = """你是一个智能家居助手，专门帮助用户控制和了解他们的Home Assistant智能家居设备。
+请根据用户的问题或请求，提供有用的回答。如果你无法回答，请坦诚告知。
+对于设备控制命令，请使用提供的工具。"""
+# 设备概览中每种类型列出的示例设备数
+OVERVIEW_EXAMPLES = 3
 
 # 定义状态类型
 class State(BaseModel):
     messages: List[Dict[str, Any]] = []
+    history_summary: str = ""
     memorized_messages: List[Dict[str, Any]] = []
     entity_data: Optional[Dict[str, Any]] = None
     response: str = ""
-    parsed_command: Optional[Dict[str, Any]] = None
+    parsed_command: Optional[CommandPlan] = None
     execution_result: str = ""
     analysis_summary: str = ""
     analysis_details: Optional[Dict[str, Any]] = None
@@ -49,10 +68,27 @@ class HomeAssistantLLMControllerLangGraph:
     
     def __init__(self):
         # 确保hass_manager已初始化，获取必要的参数
+        hass_manager = get_hass_manager()
         self.command_parser = CommandParser(
             entity_data=hass_manager.entity_data.get("non_sensor_data", {}),
             url=hass_manager.url,
-            headers=hass_manager.headers
+            headers=hass_manager.headers,
+            entity_index=hass_manager.entity_index,
+            service_caller=hass_manager.call_home_assistant_service,
+            async_service_caller=hass_manager.async_call_home_assistant_service,
+            batch_service_caller=hass_manager.call_home_assistant_services
+        )
+        # 快速路由：高频的开关类控制指令直接执行，不经过LangGraph和大模型
+        self.intent_router = IntentRouter(hass_manager.entity_index)
+        # 编译好的智能体按(模型实例, 工具目录版本)缓存，所有会话共享，模型或工具变化时才重建
+        self._agent_cache: Optional[Tuple[Any, int, Any]] = None
+        self._agent_lock = threading.Lock()
+        self.agent_builds = 0
+        # 系统提示片段缓存：片段名称 -> (版本, 文本)
+        self._prompt_segments: Dict[str, Tuple[Any, str]] = {}
+        # 对话历史管理：最近几轮原样保留，更早的轮次折叠为摘要，每轮输入大小受token预算限制
+        self.history_manager = HistoryManager(
+            lambda text, max_length: get_llm_manager().generate_summary(text, max_length)
         )
         
         # 初始化LangGraph
@@ -70,7 +106,7 @@ class HomeAssistantLLMControllerLangGraph:
 
         to_memorize_messages = [msg for msg in state.messages if msg not in state.memorized_messages]
 
-        memory_manager.memorize_messages(to_memorize_messages)
+        get_memory_manager().memorize_messages(to_memorize_messages)
         
         # 返回状态，确保LangGraph流程正常继续
         return state
@@ -113,6 +149,7 @@ class HomeAssistantLLMControllerLangGraph:
         logger.info("分析用户消息")
         # 确保有最新的实体数据
         if not state.entity_data:
+            hass_manager = get_hass_manager()
             state.entity_data = {
                 "sensor_data": hass_manager.entity_data.get("sensor_data", {}),
                 "non_sensor_data": hass_manager.entity_data.get("non_sensor_data", {})
@@ -133,14 +170,8 @@ class HomeAssistantLLMControllerLangGraph:
         last_message = state.messages[-1] if state.messages else {"content": ""}
         user_message = last_message.get("content", "")
         
-        # 尝试解析命令
-        parsed_result = self.command_parser.parse_and_execute_command(user_message)
-        
-        # 将字符串结果包装成字典格式
-        parsed_command = {
-            "message": parsed_result,
-            "should_execute": "成功执行" in parsed_result  # 如果包含"成功执行"，认为是可执行命令
-        }
+        # 只解析命令，不调用服务；命令在execute_command节点中执行一次
+        parsed_command = self.command_parser.parse(user_message)
         
         return {"parsed_command": parsed_command}
     
@@ -148,7 +179,7 @@ class HomeAssistantLLMControllerLangGraph:
         """
         决定是否执行命令
         """
-        if state.parsed_command and state.parsed_command.get("should_execute", False):
+        if state.parsed_command and state.parsed_command.confidence >= COMMAND_MIN_CONFIDENCE:
             return "execute"
         return "respond"
     
@@ -158,15 +189,11 @@ class HomeAssistantLLMControllerLangGraph:
         """
         logger.info(f"执行命令: {state.parsed_command}")
         
-        # 获取最新的用户消息
-        last_message = state.messages[-1] if state.messages else {"content": ""}
-        user_message = last_message.get("content", "")
+        # 执行解析得到的控制计划
+        result = self.command_parser.execute(state.parsed_command)
         
-        # 实际执行命令
-        result = self.command_parser.parse_and_execute_command(user_message)
-        
-        # 重新获取实体数据以确保是最新的
-        hass_manager.update_entity_data()
+        # 执行成功的实体已在当前快照中乐观更新，无需重新拉取全部实体
+        hass_manager = get_hass_manager()
         updated_entity_data = {
             "sensor_data": hass_manager.entity_data.get("sensor_data", {}),
             "non_sensor_data": hass_manager.entity_data.get("non_sensor_data", {})
@@ -177,11 +204,30 @@ class HomeAssistantLLMControllerLangGraph:
             "entity_data": updated_entity_data
         }
         
-    def _create_react_agent(self, tools):
+    def _create_react_agent(self, tools, llm_model=None):
         # 使用llm_manager中已配置好的模型，确保整个应用使用统一的模型配置
-        llm_model = llm_manager.get_chat_model()
+        if llm_model is None:
+            llm_model = get_llm_manager().get_chat_model()
         agent = create_agent(llm_model, tools)
         return agent
+
+    def _get_react_agent(self, tools_version: int, tools):
+        """
+        获取编译好的智能体，模型实例和工具目录版本都未变化时复用上一次构建的智能体
+        :param tools_version: 工具目录版本
+        :param tools: 工具列表
+        """
+        llm_model = get_llm_manager().get_chat_model()
+        with self._agent_lock:
+            cached = self._agent_cache
+            if cached is not None and cached[0] is llm_model and cached[1] == tools_version:
+                return cached[2]
+            agent = self._create_react_agent(tools, llm_model)
+            # 缓存中保留模型实例的引用，模型被替换后按对象身份即可识别
+            self._agent_cache = (llm_model, tools_version, agent)
+            self.agent_builds += 1
+            logger.info(f"智能体已重建（工具目录版本 {tools_version}）")
+            return agent
     
     async def _generate_response_async(self, state: State) -> Dict[str, Any]:
         """
@@ -202,9 +248,9 @@ class HomeAssistantLLMControllerLangGraph:
                                   *state.messages]
             
             # 使用hass_manager中的方法获取MCP工具
-            tools = await hass_manager.get_mcp_tools()
-            agent = self._create_react_agent(tools)
-            response = await agent.ainvoke({"messages": to_invoke_messages})
+            tools_version, tools = await get_hass_manager().get_mcp_tool_catalog()
+            agent = self._get_react_agent(tools_version, tools)
+            response = await agent.ainvoke({"messages": to_invoke_messages}, config={"tags": [AGENT_RUN_TAG]})
             print(f"agent.ainvoke: {response}")
             formatted_msgs = []
             for msg in response["messages"]:
@@ -246,31 +292,64 @@ class HomeAssistantLLMControllerLangGraph:
     def _build_system_prompt(self, entity_data: Dict[str, Any], state: State, user_message: str) -> str:
         """
         构建系统提示，包含实体信息
+        片段按变化频率从低到高排列：固定说明、设备清单（实体增删或改名时变化）、记忆信息、较早对话的摘要、
+        设备当前状态（快照变化时变化），
+        设备片段按实体索引版本和快照版本缓存，记忆片段按记忆管理器的版本缓存；
+        前缀保持稳定，支持前缀缓存的OpenAI兼容后端可以命中缓存
         """
-        # 填充记忆
-        retrieved_prompt = memory_manager.retrieve_memory_info()
+        index_version, snapshot_version = self._entity_versions(entity_data)
         
         # 生成设备概览
-        device_overview = self._generate_device_overview(entity_data)
-        
-        system_prompt = f"""
-你是一个智能家居助手，专门帮助用户控制和了解他们的Home Assistant智能家居设备。
-
-当前可用设备概览：
-{device_overview}
+        device_inventory = self._cached_segment("device_inventory", index_version,
+                                                lambda: self._generate_device_inventory(entity_data))
+        device_states = self._cached_segment("device_states", snapshot_version,
+                                             lambda: self._generate_device_states(entity_data))
+        
+        # 填充记忆（先读取版本再取内容，取内容期间版本变化时下一轮重新生成）
+        memory_manager = get_memory_manager()
+        memory_version = memory_manager.version
+        retrieved_prompt = memory_manager.retrieve_memory_info()
+        memory = self._cached_segment("memory", memory_version,
+                                      lambda: f"这里是和用户有关的记忆信息:\n{retrieved_prompt.strip()}" if retrieved_prompt else "")
+        
+        segments = [SYSTEM_PROMPT_HEADER, f"当前可用设备概览：\n{device_inventory}"]
+        if memory:
+            segments.append(memory)
+        if state.history_summary:
+            segments.append(f"此前对话的摘要：\n{state.history_summary}")
+        if device_states:
+            segments.append(f"设备当前状态：\n{device_states}")
+        return "\n\n".join(segments)
 
-{'这里是和用户有关的记忆信息:' if retrieved_prompt else ''}
-{retrieved_prompt}
+    def _entity_versions(self, entity_data: Dict[str, Any]) -> Tuple[Optional[int], Optional[int]]:
+        """
+        实体数据对应的(实体索引版本, 快照版本)，不是当前快照的实体数据时返回(None, None)，不使用缓存
+        """
+        hass_manager = get_hass_manager()
+        if entity_data.get("non_sensor_data") is not hass_manager.entity_data.get("non_sensor_data") \
+                or entity_data.get("sensor_data") is not hass_manager.entity_data.get("sensor_data"):
+            return None, None
+        return hass_manager.entity_index.version, hass_manager.snapshot_version
 
-请根据用户的问题或请求，提供有用的回答。如果你无法回答，请坦诚告知。
-对于设备控制命令，请使用提供的工具。
+    def _cached_segment(self, name: str, version: Optional[int], build) -> str:
         """
-        
-        return system_prompt
+        获取系统提示片段，版本未变化时直接复用
+        :param name: 片段名称
+        :param version: 片段版本，None表示不缓存
+        :param build: 生成片段的函数
+        """
+        if version is None:
+            return build()
+        cached = self._prompt_segments.get(name)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        text = build()
+        self._prompt_segments[name] = (version, text)
+        return text
     
-    def _generate_device_overview(self, entity_data: Dict[str, Any]) -> str:
+    def _generate_device_inventory(self, entity_data: Dict[str, Any]) -> str:
         """
-        生成设备概览
+        生成设备清单（各类型设备数量及示例设备名称，不含状态）
         """
         overview = []
         
@@ -280,13 +359,11 @@ class HomeAssistantLLMControllerLangGraph:
         for device_type, entities in non_sensor_data.items():
             if entities:
                 overview.append(f"- {device_type}设备: {len(entities)}个")
-                # 只列出前3个设备作为示例
-                for i, entity in enumerate(entities[:3]):
-                    name = entity.get("friendly_name", entity.get("entity_id", "未知设备"))
-                    state = entity.get("state", "未知状态")
-                    overview.append(f"  - {name}: 当前状态为{state}")
-                if len(entities) > 3:
-                    overview.append(f"  - ... 等{len(entities) - 3}个设备")
+                # 只列出前几个设备作为示例
+                for entity in entities[:OVERVIEW_EXAMPLES]:
+                    overview.append(f"  - {entity.get('friendly_name', entity.get('entity_id', '未知设备'))}")
+                if len(entities) > OVERVIEW_EXAMPLES:
+                    overview.append(f"  - ... 等{len(entities) - OVERVIEW_EXAMPLES}个设备")
         
         # 获取传感器数据
         sensor_data = entity_data.get("sensor_data", {})
@@ -303,6 +380,18 @@ class HomeAssistantLLMControllerLangGraph:
             overview.append("暂无可用设备信息")
         
         return "\n".join(overview)
+
+    def _generate_device_states(self, entity_data: Dict[str, Any]) -> str:
+        """
+        生成设备清单中示例设备的当前状态
+        """
+        states = []
+        for entities in entity_data.get("non_sensor_data", {}).values():
+            for entity in entities[:OVERVIEW_EXAMPLES]:
+                name = entity.get("friendly_name", entity.get("entity_id", "未知设备"))
+                state = entity.get("state", "未知状态")
+                states.append(f"- {name}: 当前状态为{state}")
+        return "\n".join(states)
     
     async def process_home_assistant_message(self, message: str, history: List[Tuple[str, str]] = None) -> str:
         """
@@ -312,39 +401,119 @@ class HomeAssistantLLMControllerLangGraph:
         :return: 响应消息
         """
         try:
-            # 构建消息历史
-            messages = []
-            if history:
-                for user_msg, assistant_msg in history:
-                    messages.append({"role": "user", "content": user_msg})
-                    messages.append({"role": "assistant", "content": assistant_msg})
-            
-            # 添加最新消息
-            messages.append({"role": "user", "content": message})
-            
-            # 获取最新的实体数据
-            hass_manager.update_entity_data()
-            entity_data = {
-                "sensor_data": hass_manager.entity_data.get("sensor_data", {}),
-                "non_sensor_data": hass_manager.entity_data.get("non_sensor_data", {})
-            }
+            history_summary, messages = await self._build_messages(message, history)
             
-            # 运行图
-            config = {"configurable": {"thread_id": "home_assistant_thread"}}
-            result = await self.compiled_graph.ainvoke(
-                {
-                    "messages": messages,
-                    "entity_data": entity_data
-                },
-                config=config
-            )
+            # 快速路由命中时直接返回执行结果
+            response = await self._route_fast(message, messages)
+            if response is None:
+                # 运行图
+                result = await self.compiled_graph.ainvoke(self._graph_input(messages, history_summary), config=GRAPH_CONFIG)
+                response = result.get("response", "抱歉，我无法处理您的请求")
             
-            return result.get("response", "抱歉，我无法处理您的请求")
+            self._prefetch_history(message, history, response)
+            return response
             
         except Exception as e:
             error_msg = f"处理消息时出错: {str(e)}"
             logger.error(error_msg)
             return error_msg
+
+    async def stream_home_assistant_message(self, message: str, history: List[Tuple[str, str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理Home Assistant相关消息，边生成边产出事件：
+        {"type": "token", "content": 文本片段}、{"type": "tool_start"/"tool_end", "id": 调用ID, "name": 工具名称}，
+        最后产出 {"type": "final", "content": 完整回复}
+        :param message: 用户消息
+        :param history: 历史对话
+        """
+        response = "抱歉，我无法处理您的请求"
+        try:
+            history_summary, messages = await self._build_messages(message, history)
+            
+            fast_response = await self._route_fast(message, messages)
+            if fast_response is not None:
+                response = fast_response
+            else:
+                async for event in self.compiled_graph.astream_events(self._graph_input(messages, history_summary), config=GRAPH_CONFIG, version="v2"):
+                    kind = event["event"]
+                    if kind == "on_chain_end" and not event.get("parent_ids"):
+                        # 整个图运行结束，输出为最终状态
+                        output = event["data"].get("output")
+                        if isinstance(output, dict) and output.get("response"):
+                            response = output["response"]
+                    elif AGENT_RUN_TAG not in event.get("tags", ()):
+                        continue
+                    elif kind == "on_chat_model_stream":
+                        content = event["data"]["chunk"].content
+                        if isinstance(content, str) and content:
+                            yield {"type": "token", "content": content}
+                    elif kind in ("on_tool_start", "on_tool_end"):
+                        yield {"type": kind[len("on_"):], "id": event["run_id"], "name": event["name"]}
+            self._prefetch_history(message, history, response)
+        except Exception as e:
+            response = f"处理消息时出错: {str(e)}"
+            logger.error(response)
+        yield {"type": "final", "content": response}
+
+    async def _build_messages(self, message: str, history: Optional[List[Tuple[str, str]]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        由历史对话和最新消息构建消息列表
+        较早的对话折叠为摘要，只有最近的对话原样放入消息列表
+        :return: (较早对话的摘要, 消息列表)
+        """
+        history_summary, recent_history = "", []
+        if history:
+            # 所需摘要尚未生成时需要调用大模型，放到线程中执行
+            history_summary, recent_history = await asyncio.to_thread(self.history_manager.prepare, history)
+        
+        messages = []
+        for user_msg, assistant_msg in recent_history:
+            messages.append({"role": "user", "content": user_msg})
+            messages.append({"role": "assistant", "content": assistant_msg})
+        
+        # 添加最新消息
+        messages.append({"role": "user", "content": message})
+        return history_summary, messages
+
+    def _prefetch_history(self, message: str, history: Optional[List[Tuple[str, str]]], response: str):
+        """
+        本轮结束后在后台预先生成下一轮需要的对话摘要
+        """
+        self.history_manager.prefetch(list(history or []) + [(message, response)])
+
+    async def _route_fast(self, message: str, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        刷新实体数据后尝试快速路由，命中时直接执行并在后台保存对话记忆
+        :return: 执行结果，未命中时返回None
+        """
+        # 获取最新的实体数据（陈旧度预算内复用同一快照），可能需要REST拉取和分类，放到线程中执行
+        await asyncio.to_thread(get_hass_manager().update_entity_data)
+        
+        plan = self.intent_router.route(message)
+        if plan is None:
+            return None
+        response = await asyncio.to_thread(self.command_parser.execute, plan)
+        threading.Thread(
+            target=get_memory_manager().memorize_messages,
+            args=(messages,),
+            name="memorize-messages", daemon=True
+        ).start()
+        return response
+
+    def _graph_input(self, messages: List[Dict[str, Any]], history_summary: str = "") -> Dict[str, Any]:
+        """
+        运行图的输入状态
+        """
+        hass_manager = get_hass_manager()
+        entity_data = {
+            "sensor_data": hass_manager.entity_data.get("sensor_data", {}),
+            "non_sensor_data": hass_manager.entity_data.get("non_sensor_data", {})
+        }
+        return {
+            "messages": messages,
+            "history_summary": history_summary,
+            "entity_data": entity_data
+        }
     
     def analyze_entities(self, sensor_data: Dict[str, Any], non_sensor_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
         """
@@ -372,7 +541,7 @@ class HomeAssistantLLMControllerLangGraph:
             ]
             
             # 调用大模型分析
-            analysis_result = llm_manager.call_openai_api(messages, temperature=0.3)
+            analysis_result = get_llm_manager().call_openai_api(messages, temperature=0.3)
             
             # 生成简短摘要
             summary_prompt = f"""
@@ -385,7 +554,7 @@ class HomeAssistantLLMControllerLangGraph:
                 {"role": "user", "content": summary_prompt}
             ]
             
-            summary = llm_manager.call_openai_api(summary_messages, temperature=0.1)
+            summary = get_llm_manager().call_openai_api(summary_messages, temperature=0.1)
             
             # 解析分析结果为结构化数据
             analysis = {
@@ -421,15 +590,24 @@ class HomeAssistantLLMControllerLangGraph:
         
         # 添加传感器信息
         description.append("## 传感器")
-        numeric_sensors = sensor_data.get("numeric_sensors", [])
+        numeric_table = sensor_data.get("numeric_table")
         text_sensors = sensor_data.get("text_sensors", [])
         
-        description.append(f"### 数值传感器 ({len(numeric_sensors)})")
-        for sensor in numeric_sensors[:5]:
-            name = sensor.get("friendly_name", sensor.get("entity_id", "未知传感器"))
-            state = sensor.get("state", "未知")
-            unit = sensor.get("unit_of_measurement", "")
-            description.append(f"- {name}: {state}{unit}")
+        if numeric_table is not None:
+            # 数值传感器直接读取列式表
+            numeric_frame = numeric_table.sorted_frame
+            description.append(f"### 数值传感器 ({len(numeric_frame)})")
+            for row in numeric_frame.head(5).itertuples():
+                name = row.friendly_name or row.Index
+                description.append(f"- {name}: {row.state}{row.unit}")
+        else:
+            numeric_sensors = sensor_data.get("numeric_sensors", [])
+            description.append(f"### 数值传感器 ({len(numeric_sensors)})")
+            for sensor in numeric_sensors[:5]:
+                name = sensor.get("friendly_name", sensor.get("entity_id", "未知传感器"))
+                state = sensor.get("state", "未知")
+                unit = sensor.get("unit_of_measurement", "")
+                description.append(f"- {name}: {state}{unit}")
         
         description.append(f"### 文本传感器 ({len(text_sensors)})")
         for sensor in text_sensors[:5]:
@@ -443,7 +621,7 @@ class HomeAssistantLLMControllerLangGraph:
         """
         计算实体数量
         """
-        if isinstance(data, list):
+        if isinstance(data, (list, RecordView)):
             return len(data)
         elif isinstance(data, dict):
             total = 0
@@ -486,6 +664,19 @@ class HomeAssistantLLMControllerLangGraph:
             logger.error(error_msg)
             return None, None
 
-# 创建全局实例供其他模块使用
-hass_llm_controller_langgraph = HomeAssistantLLMControllerLangGraph()
-logger.info("全局实例 hass_llm_controller_langgraph 已创建")
\ No newline at end of file
+# 全局实例供其他模块使用，首次使用时创建（创建时会初始化hass_manager并编译LangGraph）
+_hass_llm_controller_langgraph = LazySingleton(HomeAssistantLLMControllerLangGraph, "hass_llm_controller_langgraph")
+
+
+def get_hass_llm_controller() -> HomeAssistantLLMControllerLangGraph:
+    """
+    获取全局HomeAssistantLLMControllerLangGraph实例，首次调用时创建
+    """
+    return _hass_llm_controller_langgraph.get()
+
+
+def __getattr__(name: str):
+    # 兼容 from ... import hass_llm_controller_langgraph 的旧用法，访问时才创建实例
+    if name == "hass_llm_controller_langgraph":
+        return get_hass_llm_controller()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,239 @@
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Any, Optional, Tuple
+# 导入日志记录器
+from source.base_layer.utils import logger
+# 导入多模式串匹配自动机
+from source.base_layer.text_matcher import AhoCorasickMatcher
+# 导入实体索引
+from source.api_layer.entity_index import EntityIndex
+# 导入实体类型解析
+from source.api_layer.entity_record import entity_domain
+# 导入控制计划
+from source.command_parser import CommandPlan, ENTITY_ID_PATTERN
+
+# 支持turn_on/turn_off的实体类型，快速路由只控制这些类型
+CONTROLLABLE_DOMAINS = {
+    'light', 'switch', 'fan', 'input_boolean', 'humidifier', 'climate',
+    'media_player', 'siren', 'remote', 'automation',
+}
+
+# 意图关键词 -> 服务（归一化后的文本中按最长匹配识别）
+INTENT_KEYWORDS = {
+    '打开': 'turn_on', '开启': 'turn_on', '启动': 'turn_on', '开': 'turn_on',
+    'turnon': 'turn_on', 'switchon': 'turn_on',
+    '关闭': 'turn_off', '关掉': 'turn_off', '关上': 'turn_off', '停止': 'turn_off', '关': 'turn_off',
+    'turnoff': 'turn_off', 'switchoff': 'turn_off',
+}
+
+# 设备类型关键词 -> 实体类型
+DEVICE_TYPE_KEYWORDS = {
+    '灯': 'light', '灯光': 'light', '灯带': 'light', 'light': 'light', 'lights': 'light',
+    '开关': 'switch', '插座': 'switch', 'switch': 'switch',
+    '风扇': 'fan', '电扇': 'fan', 'fan': 'fan',
+    '空调': 'climate', '加湿器': 'humidifier',
+}
+
+# "所有"类修饰词
+ALL_KEYWORDS = ('所有', '全部', '全都', 'all')
+
+# 归一化时去除的语气词和虚词
+FILLER_WORDS = ('请', '帮我', '帮忙', '麻烦', '一下', '给我', '把', '将', '的', '吧', '呀', '啊', 'please')
+
+# 槽位和意图之外允许剩余的连接词，剩余其他内容时不走快速路由
+CONNECTOR_WORDS = ('和', '跟', '与', '以及', '还有', '都', '了', 'and')
+
+# 出现这些内容的消息视为询问而不是控制指令
+QUESTION_MARKERS = ('吗', '?', '是否', '有没有', '什么', '多少', '怎么', '为什么', '哪')
+
+# 归一化时去除的空白和标点
+PUNCTUATION_PATTERN = re.compile(r'[\s,.!;:~，。！；：、…“”‘’"\'()（）]+')
+
+
+def normalize_text(text: str) -> str:
+    """
+    归一化文本：全角转半角、转小写，去除空白、标点和语气词
+    实体名称和用户消息使用同一规则归一化，两者可以直接比较
+    """
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = PUNCTUATION_PATTERN.sub('', text)
+    for word in FILLER_WORDS:
+        text = text.replace(word, '')
+    return text
+
+
+def _strip_spans(text: str, spans: List[Tuple[int, int]]) -> str:
+    """
+    去掉文本中的若干区间（区间互不重叠）
+    """
+    parts = []
+    position = 0
+    for start, end in sorted(spans):
+        parts.append(text[position:start])
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def _select_spans(matches: List[Tuple[int, int, Any]]) -> List[Tuple[int, int, Any]]:
+    """
+    从所有匹配中贪心选出互不重叠的匹配，优先选择更长的匹配
+    :param matches: (起始下标, 结束下标, 匹配对象) 列表
+    """
+    selected = []
+    for match in sorted(matches, key=lambda m: (m[0] - m[1], m[0])):
+        if all(match[1] <= other[0] or match[0] >= other[1] for other in selected):
+            selected.append(match)
+    return sorted(selected)
+
+
+class IntentRouter:
+    """
+    快速路由
+    在调用大模型之前，用归一化的关键词和槽位（设备名称、区域分组、设备类型）匹配高频的开关类控制指令，
+    完整识别时直接生成控制计划，不经过LangGraph和大模型；只要有无法解释的内容就交由大模型处理，保证确定性
+    """
+
+    def __init__(self, entity_index: EntityIndex):
+        """
+        初始化快速路由
+        :param entity_index: 共享的实体索引
+        """
+        self.entity_index = entity_index
+        self.intent_matcher = AhoCorasickMatcher(INTENT_KEYWORDS)
+        self.device_type_matcher = AhoCorasickMatcher(DEVICE_TYPE_KEYWORDS)
+        self.all_matcher = AhoCorasickMatcher(ALL_KEYWORDS)
+        # 设备名称和区域分组的匹配自动机，实体索引的实体集合或名称变化时才重建
+        self._name_matcher: Optional[AhoCorasickMatcher] = None
+        self._name_targets: List[List[str]] = []
+        self._group_matcher: Optional[AhoCorasickMatcher] = None
+        self._group_names: List[str] = []
+        self._matcher_version: Optional[int] = None
+        self._lock = threading.Lock()
+        self.total = 0
+        self.hits = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        快速路由命中率（直接处理的消息占全部消息的比例）
+        """
+        return self.hits / self.total if self.total else 0.0
+
+    def _refresh_matchers(self):
+        """
+        实体索引变化后重建设备名称和区域分组的匹配自动机
+        """
+        index = self.entity_index
+        if self._name_matcher is not None and self._matcher_version == index.version:
+            return
+        # 归一化名称 -> 实体ID（同名实体一起控制）
+        targets: Dict[str, List[str]] = {}
+        for name, entities in index.by_name.items():
+            normalized = normalize_text(name)
+            if not normalized:
+                continue
+            for entity in entities:
+                if entity_domain(entity['entity_id']) in CONTROLLABLE_DOMAINS:
+                    targets.setdefault(normalized, []).append(entity['entity_id'])
+        groups = sorted({
+            group_name for domain in CONTROLLABLE_DOMAINS
+            for group_name in index.get_domain_groups(domain) if group_name != '其他'
+        })
+        self._name_matcher = AhoCorasickMatcher(targets)
+        self._name_targets = list(targets.values())
+        self._group_matcher = AhoCorasickMatcher(normalize_text(group_name) for group_name in groups)
+        self._group_names = groups
+        self._matcher_version = index.version
+
+    def route(self, message: str) -> Optional[CommandPlan]:
+        """
+        识别开关类控制指令
+        :param message: 用户消息
+        :return: 控制计划，不能完整识别时返回None（交由大模型处理）
+        """
+        with self._lock:
+            self._refresh_matchers()
+            plan = self._route(message)
+            self.total += 1
+            if plan is not None:
+                self.hits += 1
+        if plan is not None:
+            logger.info(f"快速路由命中: {plan.service} {plan.entity_ids}，命中率 {self.hit_rate:.1%} ({self.hits}/{self.total})")
+        return plan
+
+    def _route(self, message: str) -> Optional[CommandPlan]:
+        text = unicodedata.normalize('NFKC', message).lower()
+        if any(marker in text for marker in QUESTION_MARKERS):
+            return None
+
+        # 明确的实体ID
+        entity_ids = [entity_id for entity_id in ENTITY_ID_PATTERN.findall(text)
+                      if self.entity_index.get(entity_id) and entity_domain(entity_id) in CONTROLLABLE_DOMAINS]
+        for entity_id in entity_ids:
+            text = text.replace(entity_id, '')
+        text = normalize_text(text)
+
+        # 设备名称槽位
+        name_matches = _select_spans([
+            (start, start + len(self._name_matcher.patterns[pattern_id]), pattern_id)
+            for start, pattern_id in self._name_matcher.iter_matches(text)
+        ])
+        for _, _, pattern_id in name_matches:
+            entity_ids.extend(self._name_targets[pattern_id])
+        text = _strip_spans(text, [(start, end) for start, end, _ in name_matches])
+
+        # 区域分组 + 设备类型槽位（如"客厅的灯"、"所有灯"）
+        type_matches = _select_spans([
+            (start, start + len(self.device_type_matcher.patterns[pattern_id]), DEVICE_TYPE_KEYWORDS[self.device_type_matcher.patterns[pattern_id]])
+            for start, pattern_id in self.device_type_matcher.iter_matches(text)
+        ])
+        is_all = False
+        if type_matches:
+            domains = {domain for _, _, domain in type_matches}
+            if len(domains) != 1:
+                return None
+            domain = domains.pop()
+            group_matches = _select_spans([
+                (start, start + len(self._group_matcher.patterns[pattern_id]), self._group_names[pattern_id])
+                for start, pattern_id in self._group_matcher.iter_matches(text)
+            ])
+            all_matches = _select_spans([
+                (start, start + len(self.all_matcher.patterns[pattern_id]), None)
+                for start, pattern_id in self.all_matcher.iter_matches(text)
+            ])
+            if group_matches:
+                for _, _, group_name in group_matches:
+                    entity_ids.extend(entity['entity_id'] for entity in self.entity_index.get_group_entities(domain, group_name))
+            elif all_matches and not entity_ids:
+                entity_ids.extend(self.entity_index.by_domain.get(domain, ()))
+                is_all = True
+            else:
+                return None
+            text = _strip_spans(text, [(start, end) for start, end, _ in type_matches + group_matches + all_matches])
+
+        if not entity_ids:
+            return None
+
+        # 意图：剩余文本中只能有一种动作
+        intent_matches = _select_spans([
+            (start, start + len(self.intent_matcher.patterns[pattern_id]), INTENT_KEYWORDS[self.intent_matcher.patterns[pattern_id]])
+            for start, pattern_id in self.intent_matcher.iter_matches(text)
+        ])
+        services = {service for _, _, service in intent_matches}
+        if len(services) != 1:
+            return None
+        text = _strip_spans(text, [(start, end) for start, end, _ in intent_matches])
+
+        # 槽位和意图之外只允许剩余连接词
+        for word in CONNECTOR_WORDS:
+            text = text.replace(word, '')
+        if text:
+            return None
+
+        entity_ids = list(dict.fromkeys(entity_ids))
+        domain = entity_domain(entity_ids[0])
+        if is_all:
+            return CommandPlan(domain=domain, service=services.pop(), entity_ids=entity_ids, confidence=1.0, source="all")
+        return CommandPlan(domain=domain, service=services.pop(), entity_ids=entity_ids, confidence=1.0, source="router")
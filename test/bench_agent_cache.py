@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 只构建模型实例，不发起请求
+os.environ.setdefault("QWEN_API_KEY", "bench")
+
+from langchain.agents import create_agent
+from langchain_core.tools import StructuredTool
+
+from source.api_layer.llm_manager import get_llm_manager
+from source.home_assistant_llm_controller_langgraph import HomeAssistantLLMControllerLangGraph
+
+# 工具目录规模
+SIZES = [5, 20, 50]
+
+# 每个规模模拟的对话轮数
+TURNS = 50
+
+
+def generate_tools(count: int):
+    """
+    生成模拟的MCP工具
+    """
+    def make_tool(i: int):
+        def call(name: str, area: str = "") -> str:
+            return f"tool{i}: {name} {area}"
+        return StructuredTool.from_function(call, name=f"HassTool{i}", description=f"模拟工具{i}")
+    return [make_tool(i) for i in range(count)]
+
+
+def create_controller() -> HomeAssistantLLMControllerLangGraph:
+    """
+    只初始化智能体缓存的控制器，不连接Home Assistant
+    """
+    controller = HomeAssistantLLMControllerLangGraph.__new__(HomeAssistantLLMControllerLangGraph)
+    controller._agent_cache = None
+    controller._agent_lock = threading.Lock()
+    controller.agent_builds = 0
+    return controller
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    for _ in range(TURNS):
+        func()
+    return time.perf_counter() - start
+
+
+def main():
+    llm_model = get_llm_manager().get_chat_model()
+    print(f"{'工具数':>6} {'每轮构建(ms/轮)':>16} {'首轮构建(ms)':>12} {'缓存(ms/轮)':>12} {'加速':>10}")
+    for size in SIZES:
+        tools = generate_tools(size)
+        controller = create_controller()
+        legacy_time = timed(lambda: create_agent(llm_model, tools))
+        # 首轮构建一次，之后各轮复用
+        start = time.perf_counter()
+        controller._get_react_agent(1, tools)
+        first_time = time.perf_counter() - start
+        cached_time = timed(lambda: controller._get_react_agent(1, tools))
+        assert controller.agent_builds == 1
+        # 工具目录版本变化时重建
+        controller._get_react_agent(2, tools)
+        assert controller.agent_builds == 2
+        print(f"{size:>6} {legacy_time / TURNS * 1000:>16.3f} {first_time * 1000:>12.3f} "
+              f"{cached_time / TURNS * 1000:>12.4f} {legacy_time / cached_time:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.command_parser import CommandParser
+from source.api_layer.entity_index import EntityIndex
+
+# 基准规模
+SIZES = [100, 1_000, 10_000]
+
+# 每个规模测试的指令数
+COMMANDS = 200
+
+
+def legacy_match_entity_by_name(index: EntityIndex, command_text: str):
+    """
+    原始实现：逐个名称做小写子串判断，耗时与实体数量成正比
+    """
+    lowered_command = command_text.lower()
+    for friendly_name, entities in index.by_name.items():
+        if not friendly_name or friendly_name.lower() not in lowered_command:
+            continue
+        for entity in entities:
+            if not entity["entity_id"].startswith("sensor."):
+                return entity
+    return None
+
+
+def generate_entities(count: int, seed: int = 0):
+    """
+    生成模拟实体，名称互不为子串
+    """
+    rng = random.Random(seed)
+    return [{
+        "entity_id": f"{rng.choice(['light', 'switch', 'sensor'])}.device_{i}",
+        "friendly_name": f"设备{i}号",
+        "state": "on"
+    } for i in range(count)]
+
+
+def generate_commands(entities, seed: int = 0):
+    rng = random.Random(seed)
+    commands = []
+    for _ in range(COMMANDS):
+        if rng.random() < 0.8:
+            commands.append(f"请帮我打开{rng.choice(entities)['friendly_name']}，谢谢")
+        else:
+            commands.append("请帮我打开不存在的设备")
+    return commands
+
+
+def timed(func, commands):
+    start = time.perf_counter()
+    results = [func(command) for command in commands]
+    return time.perf_counter() - start, results
+
+
+def main():
+    print(f"{'实体数':>8} {'原始实现(ms/条)':>16} {'自动机(ms/条)':>14} {'构建自动机(ms)':>15} {'加速':>8}")
+    for size in SIZES:
+        entities = generate_entities(size)
+        commands = generate_commands(entities)
+        index = EntityIndex.from_entities(entities)
+        parser = CommandParser({}, "", {}, entity_index=index)
+        start = time.perf_counter()
+        parser._get_name_matcher()
+        build_time = time.perf_counter() - start
+        legacy_time, legacy_results = timed(lambda command: legacy_match_entity_by_name(index, command), commands)
+        new_time, new_results = timed(parser.match_entity_by_name, commands)
+        # 新旧实现结果必须一致
+        assert legacy_results == new_results
+        print(f"{size:>8} {legacy_time / COMMANDS * 1000:>16.4f} {new_time / COMMANDS * 1000:>14.4f} "
+              f"{build_time * 1000:>15.2f} {legacy_time / new_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import gc
+import json
+import random
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.api_layer.entity_classifier import EntityClassifier
+from source.api_layer.entity_grouping import EntityGrouper
+
+# 基准规模
+SIZES = [10_000, 100_000]
+
+# 目标：实体快照常驻内存不超过原始实现的一半
+TARGET_RATIO = 0.5
+
+
+def legacy_classify(all_entities, group_func):
+    """
+    原始实现（基线）的分类结果：每个实体一个字典，传感器复制一份额外属性，
+    并同时保存在分类列表和分组字典中；基线没有哈希索引
+    """
+    sensor_data = {"numeric_sensors": [], "text_sensors": [], "invalid_sensors": []}
+    non_sensor_data = {}
+    for entity in all_entities:
+        entity_id = entity["entity_id"]
+        attributes = entity.get("attributes", {})
+        entity_type = entity_id.split(".")[0]
+        last_updated = entity["last_updated"][:19].replace("T", " ")
+        if entity_type != "sensor":
+            entity_info = {
+                "entity_id": entity_id,
+                "friendly_name": attributes.get("friendly_name", "未命名"),
+                "state": entity["state"],
+                "last_updated": last_updated
+            }
+            if entity_type in ("light", "event"):
+                entity_info["external_attributes"] = attributes
+            non_sensor_data.setdefault(entity_type, []).append(entity_info)
+            continue
+        sensor_info = {
+            "entity_id": entity_id,
+            "friendly_name": attributes.get("friendly_name", "未命名"),
+            "state": entity["state"],
+            "unit": attributes.get("unit_of_measurement", "无单位"),
+            "unit_of_measurement": attributes.get("unit_of_measurement", ""),
+            "last_updated": last_updated,
+            "external_attributes": {k: v for k, v in attributes.items() if k not in ["friendly_name", "unit_of_measurement"]}
+        }
+        try:
+            float(''.join(filter(lambda c: c.isdigit() or c == '.', entity["state"])))
+            sensor_data["numeric_sensors"].append(sensor_info)
+        except ValueError:
+            sensor_data["text_sensors"].append(sensor_info)
+    for bucket in ("numeric_sensors", "text_sensors", "invalid_sensors"):
+        grouped = {}
+        for sensor in sensor_data[bucket]:
+            grouped.setdefault(group_func(sensor), []).append(sensor)
+        sensor_data[f"{bucket}_by_group"] = grouped
+    return sensor_data, non_sensor_data
+
+
+def generate_payload(count: int, seed: int = 0) -> str:
+    """
+    生成模拟的 /api/states 响应
+    """
+    rng = random.Random(seed)
+    states = []
+    for i in range(count):
+        domain = rng.choice(["sensor"] * 6 + ["light", "switch", "binary_sensor", "event"])
+        attributes = {"friendly_name": f"{rng.choice(['客厅', '卧室', '厨房'])}设备{i}"}
+        if domain == "sensor":
+            attributes.update({
+                "unit_of_measurement": rng.choice(["W", "°C", "%", "kWh"]),
+                "device_class": "power",
+                "state_class": "measurement",
+                "icon": "mdi:flash"
+            })
+        elif domain == "light":
+            attributes.update({"supported_color_modes": ["brightness"], "brightness": 128, "color_mode": "brightness"})
+        states.append({
+            "entity_id": f"{domain}.device_{i}",
+            "state": f"{rng.random() * 100:.1f}" if domain == "sensor" else "on",
+            "attributes": attributes,
+            "last_changed": "2024-01-01T00:00:00.123456+00:00",
+            "last_updated": "2024-01-01T00:00:00.123456+00:00",
+            "context": {"id": "01HABCDEFGHJKMNPQRSTVWXYZ0", "parent_id": None, "user_id": None}
+        })
+    return json.dumps(states)
+
+
+def retained_memory(build, payload: str) -> int:
+    """
+    测量由原始响应构建的实体快照在原始数据释放后仍占用的内存
+    """
+    gc.collect()
+    tracemalloc.start()
+    all_entities = json.loads(payload)
+    snapshot = build(all_entities)
+    del all_entities
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del snapshot
+    return size
+
+
+def main():
+    # EntityRecord一列包含按ID、名称、类型和分组的哈希索引，占比均相对于基线
+    print(f"{'实体数':>8} {'基线(MB)':>10} {'EntityRecord+索引(MB)':>22} {'相对基线':>8}")
+    for size in SIZES:
+        payload = generate_payload(size)
+        grouper = EntityGrouper()
+        legacy = retained_memory(lambda entities: legacy_classify(entities, grouper.get_group_name), payload)
+
+        def build(entities):
+            classifier = EntityClassifier(group_func=grouper.get_group_name)
+            classifier.classify(entities)
+            return classifier
+
+        compact = retained_memory(build, payload)
+        ratio = compact / legacy
+        status = "达到" if ratio <= TARGET_RATIO else "未达到"
+        print(f"{size:>8} {legacy / 1e6:>10.1f} {compact / 1e6:>22.1f} {ratio:>8.2f}  {status}{TARGET_RATIO:g}x目标")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import gc
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.api_layer.entity_grouping import EntityGrouper, LOCATION_KEYWORDS, NAME_SEPARATORS
+
+# 基准规模
+SIZES = [1_000, 10_000, 100_000]
+
+
+def legacy_group_name(entity):
+    """
+    原始实现的分组规则：逐个关键词做子串判断，每次都重新计算
+    """
+    group_name = "其他"
+    friendly_name = entity.get("friendly_name", "")
+    if friendly_name:
+        for keyword in LOCATION_KEYWORDS:
+            if keyword in friendly_name:
+                group_name = keyword
+                break
+        if group_name == "其他":
+            for sep in NAME_SEPARATORS:
+                if sep in friendly_name:
+                    parts = friendly_name.split(sep, 1)
+                    if parts:
+                        group_name = parts[0].strip()
+                        break
+    if group_name == "其他":
+        entity_id = entity.get("entity_id", "")
+        if "." in entity_id:
+            entity_type, entity_name = entity_id.split(".", 1)
+            if "_" in entity_name:
+                parts = entity_name.split("_")
+                if parts:
+                    if len(parts) > 1:
+                        group_name = parts[0] + "_" + parts[1]
+                    else:
+                        group_name = parts[0]
+    return group_name
+
+
+def legacy_group_entities_by_name(entities):
+    """
+    原始实现：每次调用都重新计算所有实体的分组
+    """
+    grouped_entities = {}
+    for entity in entities:
+        group_name = legacy_group_name(entity)
+        if group_name not in grouped_entities:
+            grouped_entities[group_name] = []
+        grouped_entities[group_name].append(entity)
+
+    sorted_groups = {}
+    for group in sorted(grouped_entities.keys()):
+        sorted_groups[group] = sorted(grouped_entities[group], key=lambda s: s.get("friendly_name", s.get("entity_id", "")))
+    return sorted_groups
+
+
+def generate_entities(count: int, seed: int = 0):
+    """
+    生成模拟实体，名称混合位置关键词、分隔符和纯英文ID
+    """
+    rng = random.Random(seed)
+    devices = ["主灯", "筒灯", "温度", "湿度", "插座", "窗帘", "空调", "人体感应"]
+    entities = []
+    for i in range(count):
+        style = rng.random()
+        if style < 0.6:
+            name = f"{rng.choice(LOCATION_KEYWORDS)}{rng.choice(devices)}{i}"
+        elif style < 0.8:
+            name = f"Zone{i % 50}-{rng.choice(devices)}"
+        else:
+            name = ""
+        entities.append({
+            "entity_id": f"{rng.choice(['light', 'switch', 'sensor'])}.area_{i % 97}_device_{i}",
+            "friendly_name": name,
+            "state": "on"
+        })
+    return entities
+
+
+def timed(funcs, *args, repeat: int = 15):
+    """
+    多个实现交替运行多次，各自取最短耗时，与timeit一样计时期间关闭垃圾回收
+    :return: [(最短耗时, 结果), ...]，与funcs一一对应
+    """
+    best = [None] * len(funcs)
+    results = [None] * len(funcs)
+    for _ in range(repeat):
+        for index, func in enumerate(funcs):
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                results[index] = func(*args)
+                elapsed = time.perf_counter() - start
+            finally:
+                gc.enable()
+            best[index] = elapsed if best[index] is None else min(best[index], elapsed)
+    return list(zip(best, results))
+
+
+def cold(func):
+    """
+    每次使用新的分组器，测量缓存为空时的耗时
+    """
+    return lambda entities: func(EntityGrouper(), entities)
+
+
+def renamed_copies(func, grouper):
+    """
+    每次传入新的实体对象（名称不变），测量只命中名称缓存时的耗时
+    """
+    return lambda entities: func(grouper, [dict(entity) for entity in entities])
+
+
+def main():
+    print(f"{'实体数':>8} {'场景':<8} {'原始实现(s)':>12} {'未缓存(s)':>10} {'名称缓存(s)':>12} {'结果缓存(s)':>12} "
+          f"{'未缓存加速':>10} {'名称缓存加速':>12} {'结果缓存加速':>12}")
+    for size in SIZES:
+        entities = generate_entities(size)
+        scenarios = [
+            # 完整分组：group_entities_by_name
+            ("完整分组", legacy_group_entities_by_name, EntityGrouper.group_entities),
+        ]
+        for label, legacy_func, func in scenarios:
+            grouper = EntityGrouper()
+            func(grouper, entities)
+            # 名称缓存场景包含复制实体的耗时，因此偏保守
+            (legacy_time, legacy_result), (cold_time, cold_result), (named_time, named_result), (warm_time, warm_result) = \
+                timed([legacy_func, cold(func), renamed_copies(func, grouper), lambda entities: func(grouper, entities)], entities)
+            # 新旧实现结果必须一致
+            assert legacy_result == cold_result == warm_result
+            assert {group: [entity["entity_id"] for entity in members] for group, members in named_result.items()} == \
+                {group: [entity["entity_id"] for entity in members] for group, members in legacy_result.items()}
+            print(f"{size:>8} {label:<8} {legacy_time:>12.4f} {cold_time:>10.4f} {named_time:>12.4f} {warm_time:>12.4f} "
+                  f"{legacy_time / cold_time:>9.2f}x {legacy_time / named_time:>11.2f}x {legacy_time / warm_time:>11.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.history_manager import HistoryManager, estimate_tokens
+
+# 模拟的会话长度（轮）
+TURNS = 200
+
+# 模拟摘要调用的耗时（秒）
+SUMMARY_LATENCY = 0.01
+
+
+def summarize(text: str, max_length: int) -> str:
+    """
+    模拟llm_manager.generate_summary，返回固定长度的摘要
+    """
+    time.sleep(SUMMARY_LATENCY)
+    return "用户先后控制了客厅、卧室和厨房的设备，并询问了温度。"[:max_length]
+
+
+def turn(i: int):
+    return f"第{i}轮：请帮我打开客厅的灯，然后把空调调到26度", f"好的，已经打开客厅的灯并将空调设置为26度。（第{i}轮）" * 3
+
+
+def main():
+    manager = HistoryManager(summarize)
+    history = []
+    print(f"{'轮数':>6} {'全量历史(tokens)':>16} {'发送(tokens)':>12} {'原样保留(轮)':>12} {'摘要调用':>8}")
+    for i in range(1, TURNS + 1):
+        summary, recent = manager.prepare(history)
+        sent = estimate_tokens(summary) + manager._turns_tokens(recent)
+        assert sent <= manager.token_budget
+        history.append(turn(i))
+        manager.prefetch(history)
+        if i in (1, 10, 50, 100, TURNS):
+            full = manager._turns_tokens(history[:-1])
+            print(f"{i:>6} {full:>16} {sent:>12} {len(recent):>12} {manager.summary_calls:>8}")
+
+
+if __name__ == "__main__":
+    main()
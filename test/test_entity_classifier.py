@@ -0,0 +1,171 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.api_layer.entity_classifier import EntityClassifier
+from source.api_layer.home_assistant import HomeAssistantManager
+
+
+def make_entity(entity_id: str, state: str, updated: str = "2024-01-01T00:00:00+00:00", **attributes):
+    attributes.setdefault("friendly_name", entity_id)
+    return {"entity_id": entity_id, "state": state, "last_updated": updated, "attributes": attributes}
+
+
+def group_by_prefix(record) -> str:
+    """
+    按友好名称的第一个字分组
+    """
+    return record["friendly_name"][:1]
+
+
+def classify(entities):
+    classifier = EntityClassifier(group_by_prefix)
+    sensor_data, non_sensor_data = classifier.classify(entities)
+    return classifier, sensor_data, non_sensor_data
+
+
+def test_numeric_and_text_sensors():
+    _, sensor_data, _ = classify([
+        make_entity("sensor.humidity", "25.5%"),
+        make_entity("sensor.outdoor", "-3.2°C"),
+        make_entity("sensor.date", "2024-01-01"),
+        make_entity("sensor.range", "10-20"),
+        make_entity("sensor.timestamp", "2024-01-01T10:00:00+00:00"),
+        make_entity("sensor.mode", "auto"),
+        make_entity("sensor.offline", "unavailable"),
+    ])
+    numeric = {record["entity_id"]: record.value for record in sensor_data["numeric_sensors"]}
+    text = {record["entity_id"] for record in sensor_data["text_sensors"]}
+    assert numeric == {"sensor.humidity": 25.5, "sensor.outdoor": -3.2}
+    # 日期、范围和时间戳中间的"-"不是负号，应为文本型
+    assert text == {"sensor.date", "sensor.range", "sensor.timestamp", "sensor.mode"}
+    assert [record["entity_id"] for record in sensor_data["invalid_sensors"]] == ["sensor.offline"]
+
+
+def test_numeric_sensor_renders_original_state():
+    _, sensor_data, _ = classify([
+        make_entity("sensor.energy", "123456789.5", unit_of_measurement="kWh", friendly_name="电表"),
+        make_entity("sensor.voltage", "230.123456789", unit_of_measurement="V", friendly_name="电压"),
+    ])
+    frame = sensor_data["numeric_table"].frame
+    assert frame.loc["sensor.energy", "value"] == 123456789.5
+    assert frame.loc["sensor.energy", "state"] == "123456789.5"
+
+    summary = "\n".join(HomeAssistantManager._summarize_sensors(sensor_data))
+    assert "电表 (当前值: 123456789.5kWh)" in summary
+    assert "电压 (当前值: 230.123456789V)" in summary
+    assert "e+" not in summary
+
+
+def test_llm_entity_description_renders_original_state():
+    pytest.importorskip("langgraph")
+    from source.home_assistant_llm_controller_langgraph import HomeAssistantLLMControllerLangGraph
+    _, sensor_data, non_sensor_data = classify([
+        make_entity("sensor.energy", "123456789.5", unit_of_measurement="kWh", friendly_name="电表"),
+    ])
+    controller = HomeAssistantLLMControllerLangGraph.__new__(HomeAssistantLLMControllerLangGraph)
+    description = controller._prepare_entity_description(sensor_data, non_sensor_data)
+    assert "- 电表: 123456789.5kWh" in description
+
+
+def snapshot_of(classifier: EntityClassifier):
+    """
+    分类结果中各列表和分组字典的实体ID（保持顺序），用于和全量重建的结果比较
+    """
+    sensor_data, non_sensor_data = classifier.sensor_data, classifier.non_sensor_data
+    result = {}
+    for bucket in ("numeric_sensors", "text_sensors", "invalid_sensors"):
+        result[bucket] = [record["entity_id"] for record in sensor_data[bucket]]
+        result[f"{bucket}_by_group"] = [
+            (group_name, [record["entity_id"] for record in records])
+            for group_name, records in sensor_data[f"{bucket}_by_group"].items()
+        ]
+    for domain, records in non_sensor_data.items():
+        result[domain] = [record["entity_id"] for record in records]
+        result[f"{domain}_groups"] = [
+            (group_name, [record["entity_id"] for record in records])
+            for group_name, records in classifier.index.get_domain_groups(domain).items()
+        ]
+    result["numeric_table"] = sorted(sensor_data["numeric_table"].frame["state"].items())
+    return result
+
+
+BASE_ENTITIES = [
+    make_entity("light.living_room", "on", friendly_name="客厅灯"),
+    make_entity("light.bedroom", "off", friendly_name="卧室灯"),
+    make_entity("light.bedside", "off", friendly_name="卧室床头灯"),
+    make_entity("switch.kitchen", "on", friendly_name="厨房插座"),
+    make_entity("sensor.living_room_temperature", "25.5", friendly_name="客厅温度"),
+    make_entity("sensor.bedroom_temperature", "22", friendly_name="卧室温度"),
+    # 同组同名的传感器，移除时需要按对象而不是名称定位
+    make_entity("sensor.bedroom_humidity_1", "40", friendly_name="卧室湿度"),
+    make_entity("sensor.bedroom_humidity_2", "41", friendly_name="卧室湿度"),
+    make_entity("sensor.kitchen_mode", "auto", friendly_name="厨房模式"),
+    make_entity("sensor.offline", "unknown", friendly_name="离线传感器"),
+]
+
+
+def apply_changes(entities):
+    """
+    修改一个实体的状态、重命名一个实体（分组变化）、移除两个实体并新增一个实体
+    """
+    changed = []
+    for entity in entities:
+        entity_id = entity["entity_id"]
+        if entity_id in ("switch.kitchen", "sensor.bedroom_humidity_1"):
+            continue
+        if entity_id == "light.bedroom":
+            entity = make_entity(entity_id, "on", updated="2024-01-01T00:01:00+00:00", friendly_name="卧室灯")
+        elif entity_id == "light.living_room":
+            entity = make_entity(entity_id, "on", updated="2024-01-01T00:01:00+00:00", friendly_name="书房灯")
+        elif entity_id == "sensor.living_room_temperature":
+            entity = make_entity(entity_id, "26.0", updated="2024-01-01T00:01:00+00:00", friendly_name="客厅温度")
+        changed.append(entity)
+    changed.append(make_entity("sensor.study_temperature", "23.5", friendly_name="书房温度"))
+    return changed
+
+
+def test_incremental_classification_matches_full_rebuild():
+    classifier, _, _ = classify(BASE_ENTITIES)
+    entities = apply_changes(BASE_ENTITIES)
+    classifier.classify(entities)
+
+    rebuilt, _, _ = classify(entities)
+    assert snapshot_of(classifier) == snapshot_of(rebuilt)
+    # 修改1个、重命名1个、移除2个、新增1个、数值变化1个
+    assert classifier.changed_count == 6
+    assert "switch" not in classifier.non_sensor_data
+    assert classifier.index.get("switch.kitchen") is None
+
+
+def test_unchanged_entities_are_skipped():
+    classifier, _, _ = classify(BASE_ENTITIES)
+    classifier.classify(BASE_ENTITIES)
+    assert classifier.changed_count == 0
+    assert classifier.changed_domains == set()
+
+
+def test_sensor_moving_between_buckets():
+    classifier, _, _ = classify(BASE_ENTITIES)
+    entities = [
+        make_entity("sensor.kitchen_mode", "12", updated="2024-01-01T00:01:00+00:00", friendly_name="厨房模式")
+        if entity["entity_id"] == "sensor.kitchen_mode" else
+        make_entity("sensor.bedroom_temperature", "unavailable", updated="2024-01-01T00:01:00+00:00", friendly_name="卧室温度")
+        if entity["entity_id"] == "sensor.bedroom_temperature" else entity
+        for entity in BASE_ENTITIES
+    ]
+    classifier.classify(entities)
+    rebuilt, _, _ = classify(entities)
+
+    incremental, full = snapshot_of(classifier), snapshot_of(rebuilt)
+    # 换了分类的实体追加在新分类末尾，平铺列表只比较成员；分组字典和列式表要求完全一致
+    for key in full:
+        if key.endswith("_sensors"):
+            assert sorted(incremental[key]) == sorted(full[key])
+        else:
+            assert incremental[key] == full[key]
+    assert "sensor.kitchen_mode" in incremental["numeric_sensors"]
+    assert "sensor.bedroom_temperature" in incremental["invalid_sensors"]
@@ -0,0 +1,123 @@
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.api_layer.entity_grouping import EntityGrouper, LocationMatcher
+from source.api_layer.entity_record import EntityRecord
+
+
+def make_entity(entity_id: str, friendly_name: str = ""):
+    return {"entity_id": entity_id, "friendly_name": friendly_name, "state": "on"}
+
+
+@pytest.mark.parametrize("entity_id, friendly_name, group_name", [
+    # 位置关键词，靠前的关键词优先
+    ("light.a", "客厅吊灯", "客厅"),
+    ("light.b", "主卧卧室灯", "卧室"),
+    # 与更优先的关键词重叠："主卧室"中先出现"主卧"，但"卧室"更优先
+    ("light.e", "主卧室灯", "卧室"),
+    ("light.f", "次卧客厅灯", "客厅"),
+    # 分隔符前的部分
+    ("light.c", "Office-Lamp", "Office"),
+    ("light.d", "阳光房 顶灯", "阳光房"),
+    # 名称无法提取时使用entity_id的前两段
+    ("sensor.living_room_temperature", "", "living_room"),
+    ("sensor.temperature", "温度", "其他"),
+])
+def test_compute_group_name(entity_id, friendly_name, group_name):
+    assert EntityGrouper().compute_group_name(entity_id, friendly_name) == group_name
+
+
+def reference_match(keywords, text):
+    """
+    逐个关键词做子串判断，作为匹配器结果的参照
+    """
+    return next((keyword for keyword in keywords if keyword and keyword in text), None)
+
+
+def test_location_matcher_matches_reference():
+    rng = random.Random(0)
+    for _ in range(500):
+        keywords = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 3))) for _ in range(rng.randint(1, 6))]
+        matcher = LocationMatcher(keywords)
+        for _ in range(10):
+            text = "".join(rng.choice("abc\n") for _ in range(rng.randint(0, 12)))
+            assert matcher.match(text) == reference_match(keywords, text)
+
+
+def test_group_entities_sorted():
+    grouper = EntityGrouper()
+    entities = [
+        make_entity("light.c", "卧室灯"),
+        make_entity("light.a", "客厅台灯"),
+        make_entity("light.b", "卧室床头灯"),
+        make_entity("light.d", "客厅吊灯"),
+    ]
+    grouped = grouper.group_entities(entities)
+    assert list(grouped) == sorted(["卧室", "客厅"])
+    assert [entity["friendly_name"] for entity in grouped["卧室"]] == sorted(["卧室床头灯", "卧室灯"])
+    assert [entity["friendly_name"] for entity in grouped["客厅"]] == sorted(["客厅吊灯", "客厅台灯"])
+
+
+def test_group_entities_cached_by_entity_objects():
+    grouper = EntityGrouper()
+    entities = [make_entity("light.a", "客厅灯"), make_entity("light.b", "卧室灯")]
+    first = grouper.group_entities(entities)
+    # 同一组实体对象（即使是新的列表）直接复用结果
+    assert grouper.group_entities(list(entities)) is first
+
+    # 实体被替换为新对象时重新分组
+    changed = [entities[0], make_entity("light.b", "书房灯")]
+    second = grouper.group_entities(changed)
+    assert second is not first
+    assert list(second) == sorted(["客厅", "书房"])
+    assert [entity["entity_id"] for entity in second["书房"]] == ["light.b"]
+    assert grouper.group_entities(entities) is first
+
+
+def test_result_cache_is_bounded():
+    grouper = EntityGrouper(result_cache_size=2)
+    lists = [[make_entity(f"light.{i}", f"客厅灯{i}")] for i in range(3)]
+    results = [grouper.group_entities(entities) for entities in lists]
+    assert len(grouper._results) == 2
+    # 最早的结果已被淘汰，重新计算
+    assert grouper.group_entities(lists[0]) is not results[0]
+    assert grouper.group_entities(lists[2]) is results[2]
+
+
+def test_entity_record_group_name_is_reused():
+    grouper = EntityGrouper()
+    record = EntityRecord("light.a", "on", "2024-01-01T00:00:00+00:00", {"friendly_name": "客厅灯"}, "light")
+    record.set_group_name("自定义分组")
+    assert list(grouper.group_entities([record])) == ["自定义分组"]
+
+
+def test_name_cache_reused_until_name_changes():
+    grouper = EntityGrouper()
+    grouper.group_entities([make_entity("light.a", "客厅灯"), make_entity("light.b")])
+    assert grouper._name_groups == {"客厅灯": "客厅", "": None}
+
+    # 新的实体对象、名称不变时直接使用缓存的分组，缓存中没有按entity_id分组的结果
+    grouper._name_groups["客厅灯"] = "缓存分组"
+    grouped = grouper.group_entities([make_entity("light.a", "客厅灯"), make_entity("light.b_c")])
+    assert list(grouped) == ["b_c", "缓存分组"]
+    assert grouper.get_group_name(make_entity("light.x", "客厅灯")) == "缓存分组"
+
+    # 名称变化后重新计算
+    grouped = grouper.group_entities([make_entity("light.a", "书房灯")])
+    assert list(grouped) == ["书房"]
+    assert grouper._name_groups["书房灯"] == "书房"
+
+
+def test_group_entities_without_friendly_name():
+    grouper = EntityGrouper()
+    entities = [{"entity_id": "light.kitchen_b"}, {"entity_id": "light.kitchen_a"}, make_entity("light.c", "客厅灯")]
+    grouped = grouper.group_entities(entities)
+    # 没有friendly_name的实体按entity_id分组并排序
+    assert [entity["entity_id"] for entity in grouped["kitchen_a"]] == ["light.kitchen_a"]
+    assert [entity["entity_id"] for entity in grouped["kitchen_b"]] == ["light.kitchen_b"]
+    assert list(grouped) == sorted(["kitchen_a", "kitchen_b", "客厅"])
@@ -0,0 +1,129 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.history_manager import HistoryManager, estimate_tokens, truncate_to_tokens
+
+
+class RecordingSummarizer:
+    """
+    记录每次调用的摘要函数，摘要为已合并的轮次编号
+    """
+
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, text: str, max_length: int) -> str:
+        self.calls.append(text)
+        if self.fail:
+            return "调用OpenAI API失败: 连接超时"
+        rounds = [line.split("：", 1)[0][len("用户: "):] for line in text.splitlines() if line.startswith("用户: ")]
+        previous = text.split("\n", 1)[0][len("此前对话的摘要："):] if text.startswith("此前对话的摘要：") else ""
+        return ",".join(filter(None, [previous] + rounds))
+
+
+def make_history(count: int, size: int = 1):
+    return [(f"第{i}轮：" + "开灯" * size, "好的" * size) for i in range(count)]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("打开客厅灯") == 5
+    assert estimate_tokens("turn on the light") == 5
+    assert estimate_tokens(truncate_to_tokens("客厅" * 100, 20)) <= 20
+
+
+def test_short_history_is_kept_verbatim():
+    summarizer = RecordingSummarizer()
+    manager = HistoryManager(summarizer, token_budget=3000, keep_turns=4)
+    history = make_history(7)
+    assert manager.prepare(history) == ("", history)
+    assert summarizer.calls == []
+
+
+def test_folds_in_batches_of_keep_turns():
+    summarizer = RecordingSummarizer()
+    manager = HistoryManager(summarizer, token_budget=3000, keep_turns=4)
+    history = make_history(8)
+    summary, recent = manager.prepare(history)
+    assert summary == "第0轮,第1轮,第2轮,第3轮"
+    assert recent == history[4:]
+
+    # 折叠点成批移动，下一批之前保留的对话只追加，摘要直接复用
+    for count in (9, 10, 11):
+        assert manager.prepare(make_history(count)) == (summary, make_history(count)[4:])
+    assert len(summarizer.calls) == 1
+
+    # 下一批在上一个摘要的基础上增量合并
+    summary, recent = manager.prepare(make_history(12))
+    assert summary == "第0轮,第1轮,第2轮,第3轮,第4轮,第5轮,第6轮,第7轮"
+    assert len(recent) == 4
+    assert len(summarizer.calls) == 2
+    assert summarizer.calls[1].startswith("此前对话的摘要：第0轮,第1轮,第2轮,第3轮")
+
+
+def test_prefetch_prepares_next_summary():
+    summarizer = RecordingSummarizer()
+    manager = HistoryManager(summarizer, token_budget=3000, keep_turns=2)
+    history = make_history(4)
+    manager.prefetch(history)
+    manager._executor.shutdown(wait=True)
+    assert len(summarizer.calls) == 1
+    manager._executor = None
+    assert manager.prepare(history) == ("第0轮,第1轮", history[2:])
+    assert len(summarizer.calls) == 1
+
+
+def test_input_stays_within_budget():
+    summarizer = RecordingSummarizer()
+    manager = HistoryManager(summarizer, token_budget=400, keep_turns=2, summary_max_length=50)
+    for count in range(1, 40):
+        summary, recent = manager.prepare(make_history(count, size=30))
+        assert len(recent) >= min(count, 2)
+        assert estimate_tokens(summary) + manager._turns_tokens(recent) <= manager.token_budget
+
+
+def test_long_messages_are_truncated_to_budget():
+    manager = HistoryManager(RecordingSummarizer(), token_budget=500, keep_turns=2, summary_max_length=100)
+    history = [("开" * 2000, "好" * 2000)] * 2
+    summary, recent = manager.prepare(history)
+    assert summary == ""
+    assert len(recent) == 2
+    assert manager._turns_tokens(recent) <= 500
+    assert recent[0][0].endswith("…")
+
+
+def test_summary_is_limited_to_max_length_characters():
+    manager = HistoryManager(lambda text, max_length: "摘" * 500, token_budget=3000, keep_turns=1, summary_max_length=20)
+    summary, _ = manager.prepare(make_history(2))
+    assert len(summary) == 20
+    assert summary.endswith("…")
+
+
+def test_failed_summary_keeps_turns_verbatim():
+    summarizer = RecordingSummarizer(fail=True)
+    manager = HistoryManager(summarizer, token_budget=3000, keep_turns=2)
+    history = make_history(6)
+    # 摘要生成失败时，较早的对话不丢弃
+    assert manager.prepare(history) == ("", history)
+    # 失败不缓存，下一轮重试
+    manager.prepare(history)
+    assert len(summarizer.calls) == 2
+
+    summarizer.fail = False
+    summary, recent = manager.prepare(history)
+    assert summary == "第0轮,第1轮,第2轮,第3轮"
+    assert recent == history[4:]
+
+
+def test_failed_summary_still_bounded():
+    manager = HistoryManager(RecordingSummarizer(fail=True), token_budget=600, keep_turns=2)
+    history = make_history(200, size=20)
+    summary, recent = manager.prepare(history)
+    assert summary == ""
+    assert manager._turns_tokens(recent) <= 600
+    # 保留的是最近的对话
+    assert recent[-1][0].startswith("第199轮")
+    assert len(recent) >= 2
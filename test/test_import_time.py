@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入耗时预算（秒），可通过环境变量调整
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "3.0"))
+
+# 需要检查的模块
+MODULES = [
+    "source.api_layer.ha_transport",
+    "source.api_layer.home_assistant",
+    "source.api_layer.llm_manager",
+    "source.api_layer.memory_manager",
+    "source.api_layer.qwen_speech_model",
+    "source.command_parser",
+    "source.intent_router",
+    "source.home_assistant_llm_controller_langgraph",
+]
+
+# 延迟单例：(模块, 单例变量名)
+LAZY_SINGLETONS = [
+    ("source.api_layer.ha_transport", "_ha_transport"),
+    ("source.api_layer.home_assistant", "_hass_manager"),
+    ("source.api_layer.llm_manager", "_llm_manager"),
+    ("source.api_layer.memory_manager", "_memory_manager"),
+    ("source.api_layer.qwen_speech_model", "_qwen_speech_manager"),
+    ("source.home_assistant_llm_controller_langgraph", "_hass_llm_controller_langgraph"),
+]
+
+# 在全新的解释器中导入模块，输出耗时及导入后已创建的全局实例
+CHECK_SCRIPT = """
+import sys, json, time, importlib
+modules, singletons = json.loads(sys.argv[1])
+start = time.perf_counter()
+for name in modules:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - start
+created = [f"{module}.{attr}" for module, attr in singletons if getattr(sys.modules[module], attr).is_created]
+from source.base_layer import utils
+print(json.dumps({"elapsed": elapsed, "created": created, "logging_configured": utils._logging_configured}))
+"""
+
+
+def measure_import() -> dict:
+    """
+    在临时工作目录中用新的解释器导入所有模块
+    :return: {"elapsed": 耗时, "created": 已创建的全局实例, "logging_configured": 是否已配置日志, "created_files": 工作目录中新建的文件}
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+        output = subprocess.run(
+            [sys.executable, "-c", CHECK_SCRIPT, json.dumps([MODULES, LAZY_SINGLETONS])],
+            cwd=work_dir, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["created_files"] = sorted(os.listdir(work_dir))
+    return result
+
+
+def test_import_time():
+    result = measure_import()
+    assert result["elapsed"] <= IMPORT_TIME_BUDGET, f"导入耗时 {result['elapsed']:.2f}s 超出预算 {IMPORT_TIME_BUDGET:.2f}s"
+    assert not result["created"], f"导入时创建了全局实例: {result['created']}"
+    assert not result["logging_configured"], "导入时配置了日志"
+    assert not result["created_files"], f"导入时创建了文件: {result['created_files']}"
+
+
+if __name__ == "__main__":
+    result = measure_import()
+    print(f"导入耗时: {result['elapsed']:.3f}s (预算 {IMPORT_TIME_BUDGET:.2f}s)")
+    print(f"已创建的全局实例: {result['created'] or '无'}")
+    print(f"日志已配置: {result['logging_configured']}")
+    print(f"新建的文件: {result['created_files'] or '无'}")
+    try:
+        test_import_time()
+    except AssertionError as e:
+        print(f"检查失败: {e}")
+        sys.exit(1)
+    print("检查通过")
@@ -0,0 +1,90 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.api_layer.entity_index import EntityIndex
+from source.intent_router import IntentRouter
+
+# (实体ID, 友好名称, 分组)
+ENTITIES = [
+    ("light.living_room_ceiling", "客厅吊灯", "客厅"),
+    ("light.living_room_desk", "客厅台灯", "客厅"),
+    ("light.bedroom", "卧室灯", "卧室"),
+    ("switch.kitchen_plug", "厨房插座", "厨房"),
+    ("fan.bedroom", "卧室风扇", "卧室"),
+    ("sensor.living_room_temperature", "客厅温度", "客厅"),
+]
+
+
+@pytest.fixture
+def router() -> IntentRouter:
+    groups = {entity_id: group_name for entity_id, _, group_name in ENTITIES}
+    index = EntityIndex.from_entities(
+        [{"entity_id": entity_id, "friendly_name": name, "state": "off"} for entity_id, name, _ in ENTITIES],
+        group_func=lambda entity: groups[entity["entity_id"]]
+    )
+    return IntentRouter(index)
+
+
+def test_device_name_hit(router):
+    plan = router.route("请帮我打开客厅吊灯")
+    assert (plan.domain, plan.service, plan.entity_ids, plan.source) == \
+        ("light", "turn_on", ["light.living_room_ceiling"], "router")
+
+
+def test_multiple_device_names(router):
+    plan = router.route("关掉卧室灯和厨房插座")
+    assert plan.service == "turn_off"
+    assert plan.entity_ids == ["light.bedroom", "switch.kitchen_plug"]
+
+
+def test_explicit_entity_id(router):
+    plan = router.route("打开 fan.bedroom")
+    assert (plan.service, plan.entity_ids) == ("turn_on", ["fan.bedroom"])
+
+
+def test_all_lights(router):
+    plan = router.route("关闭所有灯")
+    assert plan.service == "turn_off"
+    assert sorted(plan.entity_ids) == ["light.bedroom", "light.living_room_ceiling", "light.living_room_desk"]
+    assert plan.source == "all"
+
+
+def test_area_and_device_type(router):
+    plan = router.route("打开客厅的灯")
+    assert plan.service == "turn_on"
+    assert sorted(plan.entity_ids) == ["light.living_room_ceiling", "light.living_room_desk"]
+
+
+@pytest.mark.parametrize("message", [
+    # 槽位和意图之外还有其他内容
+    "把客厅吊灯调到50%亮度",
+    "打开客厅吊灯然后放首歌",
+    # 询问而不是控制
+    "客厅吊灯开了吗",
+    "卧室灯是否打开",
+    # 同时出现两种动作
+    "打开客厅吊灯关闭卧室灯",
+    # 传感器不能开关
+    "打开客厅温度",
+    # 没有设备
+    "打开",
+])
+def test_falls_through_to_llm(router, message):
+    assert router.route(message) is None
+
+
+def test_hit_rate(router):
+    router.route("打开卧室灯")
+    router.route("卧室灯开了吗")
+    assert (router.hits, router.total) == (1, 2)
+    assert router.hit_rate == 0.5
+
+
+def test_matchers_follow_index_changes(router):
+    assert router.route("打开书房灯") is None
+    router.entity_index.add({"entity_id": "light.study", "friendly_name": "书房灯", "state": "off"}, "书房")
+    assert router.route("打开书房灯").entity_ids == ["light.study"]
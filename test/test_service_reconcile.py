@@ -0,0 +1,66 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("websockets")
+
+from source.api_layer.entity_classifier import EntityClassifier
+from source.api_layer.entity_store import EntityStore
+from source.api_layer.ha_instance import HomeAssistantInstance
+from source.api_layer.home_assistant import HomeAssistantManager
+from source.base_layer.snapshot_cache import SnapshotCache
+
+LAMP = {"entity_id": "light.lamp", "state": "off", "last_updated": "2024-01-01T00:00:00+00:00",
+        "attributes": {"friendly_name": "台灯"}}
+
+
+def make_manager(store_states):
+    """
+    构造只有一个实体存储在线的实例的管理器，跳过网络初始化
+    """
+    instance = HomeAssistantInstance("default", "http://ha.local:8123", "token")
+    instance.entity_store = EntityStore(instance.url, instance.token)
+    instance.entity_store.load_snapshot(store_states)
+    instance.entity_store._ready.set()
+
+    manager = HomeAssistantManager.__new__(HomeAssistantManager)
+    manager.instances = {"default": instance}
+    manager.federated = False
+    manager.entity_classifier = EntityClassifier(group_func=lambda record: "其他")
+    manager.entity_index = manager.entity_classifier.index
+    manager._summary_lock = threading.Lock()
+    manager._dirty_summary_domains = set()
+    # 测试中直接调用_reconcile_entities，不等待定时器
+    manager.reconcile_delay = 60
+    sensor_data, non_sensor_data = manager.entity_classifier.classify([LAMP])
+    manager.entity_data = {"sensor_data": sensor_data, "non_sensor_data": non_sensor_data}
+    manager.snapshot_cache = SnapshotCache(loader=lambda: manager.entity_data, max_staleness=60)
+    manager.snapshot_cache.prime(manager.entity_data)
+    return manager
+
+
+def test_optimistic_patch_reverted_when_live_store_disagrees():
+    # 服务调用成功但设备没有变化，不会收到state_changed，实体存储中仍是旧状态
+    manager = make_manager([LAMP])
+    manager._after_service_calls({"light.lamp": "成功执行 turn_on"}, "turn_on")
+    assert manager.entity_index.get("light.lamp").state == "on"
+    manager._reconcile_entities(["light.lamp"])
+    assert manager.entity_index.get("light.lamp").state == "off"
+
+
+def test_optimistic_patch_kept_when_live_store_agrees():
+    manager = make_manager([LAMP])
+    manager._after_service_calls({"light.lamp": "成功执行 turn_on"}, "turn_on")
+    assert manager.entity_index.get("light.lamp").state == "on"
+    manager.instances["default"].entity_store.apply_state_changed({
+        "entity_id": "light.lamp",
+        "new_state": dict(LAMP, state="on", last_updated="2024-01-01T00:01:00+00:00"),
+    })
+    manager._reconcile_entities(["light.lamp"])
+    record = manager.entity_index.get("light.lamp")
+    assert record.state == "on"
+    assert record.updated == "2024-01-01T00:01:00+00:00"
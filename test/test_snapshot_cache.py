@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.base_layer.snapshot_cache import SnapshotCache
+
+# 并发调用方数量
+CALLERS = 8
+
+
+class BlockingLoader:
+    """
+    在release前阻塞的加载函数，记录调用次数
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return {"load": self.calls}
+
+
+def run_concurrently(target, count: int):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_forced_callers_coalesce_with_in_flight_load():
+    loader = BlockingLoader()
+    cache = SnapshotCache(loader, max_staleness=60)
+
+    first, first_results = run_concurrently(lambda: cache.get(force=True), 1)
+    assert loader.started.wait(5)
+    # 加载进行中到达的强制刷新请求共享这次加载的结果
+    others, other_results = run_concurrently(lambda: cache.get(force=True), CALLERS)
+    time.sleep(0.1)
+    loader.release.set()
+    for thread in first + others:
+        thread.join(5)
+
+    assert loader.calls == 1
+    assert first_results + other_results == [{"load": 1}] * (CALLERS + 1)
+    assert cache.version == 1
+
+
+def test_forced_call_after_load_reloads():
+    loader = BlockingLoader()
+    loader.release.set()
+    cache = SnapshotCache(loader, max_staleness=60)
+    cache.get(force=True)
+    assert cache.get() == {"load": 1}
+    assert cache.get(force=True) == {"load": 2}
+    assert loader.calls == 2
+
+
+def test_invalidate_forces_reload():
+    loader = BlockingLoader()
+    loader.release.set()
+    cache = SnapshotCache(loader, max_staleness=60)
+    cache.get()
+    cache.invalidate()
+    assert cache.get() == {"load": 2}
@@ -0,0 +1,90 @@
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from source.base_layer.text_matcher import AhoCorasickMatcher
+
+
+def brute_force(patterns, text):
+    """
+    逐个模式逐个位置查找，作为自动机结果的参照
+    """
+    return sorted(
+        (start, pattern)
+        for pattern in patterns if pattern
+        for start in range(len(text) - len(pattern) + 1)
+        if text.startswith(pattern, start)
+    )
+
+
+@pytest.mark.parametrize("patterns, text, expected", [
+    # 嵌套：短模式是长模式的前缀、后缀
+    (["客厅灯", "客厅灯带", "灯带"], "打开客厅灯带", [(2, "客厅灯"), (2, "客厅灯带"), (4, "灯带")]),
+    # 重叠：失配链接上的输出
+    (["he", "she", "his", "hers"], "ushers", [(1, "she"), (2, "he"), (2, "hers")]),
+    # 同一模式多次出现
+    (["灯"], "灯灯灯", [(0, "灯"), (1, "灯"), (2, "灯")]),
+    (["aa"], "aaaa", [(0, "aa"), (1, "aa"), (2, "aa")]),
+    # 没有匹配和空模式
+    (["卧室"], "客厅", []),
+    (["", "a"], "ba", [(1, "a")]),
+])
+def test_find_all(patterns, text, expected):
+    assert sorted(AhoCorasickMatcher(patterns).find_all(text)) == expected
+
+
+def test_matches_ordered_by_end_position():
+    matcher = AhoCorasickMatcher(["客厅灯带", "灯带", "客厅"])
+    ends = [start + len(matcher.patterns[pattern_id]) for start, pattern_id in matcher.iter_matches("客厅灯带")]
+    assert ends == sorted(ends)
+
+
+def test_pattern_ids_follow_input_order():
+    matcher = AhoCorasickMatcher(["灯", "", "灯"])
+    assert len(matcher) == 3
+    assert sorted(pattern_id for _, pattern_id in matcher.iter_matches("灯")) == [0, 2]
+
+
+def test_random_texts_match_brute_force():
+    rng = random.Random(0)
+    alphabet = "abc"
+    for _ in range(200):
+        patterns = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 6))]
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 20)))
+        assert sorted(AhoCorasickMatcher(patterns).find_all(text)) == brute_force(patterns, text)
+
+
+@pytest.fixture
+def parser():
+    pytest.importorskip("pydantic")
+    from source.api_layer.entity_index import EntityIndex
+    from source.command_parser import CommandParser
+    entities = [
+        {"entity_id": "light.living_room", "friendly_name": "客厅灯", "state": "off"},
+        {"entity_id": "light.living_room_strip", "friendly_name": "客厅灯带", "state": "off"},
+        {"entity_id": "light.bedroom", "friendly_name": "卧室灯", "state": "off"},
+        {"entity_id": "switch.study", "friendly_name": "书房灯", "state": "off"},
+        {"entity_id": "sensor.living_room_light_level", "friendly_name": "客厅灯带亮度", "state": "30"},
+    ]
+    return CommandParser({}, "", {}, entity_index=EntityIndex.from_entities(entities))
+
+
+@pytest.mark.parametrize("command, entity_id", [
+    # 最长的名称优先
+    ("打开客厅灯带", "light.living_room_strip"),
+    # 长度相同时取先出现的
+    ("打开卧室灯和书房灯", "light.bedroom"),
+    ("打开书房灯和卧室灯", "switch.study"),
+    # 传感器名称不参与匹配
+    ("客厅灯带亮度", "light.living_room_strip"),
+])
+def test_match_entity_by_name(parser, command, entity_id):
+    assert parser.match_entity_by_name(command)["entity_id"] == entity_id
+
+
+def test_match_entity_by_name_without_match(parser):
+    assert parser.match_entity_by_name("打开空调") is None